@@ -37,4 +37,29 @@ def adjust_quantization_matrix(base_matrix, quality_factor):
     adjusted_matrix_int[adjusted_matrix_int < 1] = 1
     adjusted_matrix_int[adjusted_matrix_int > 255] = 255
 
-    return adjusted_matrix_int.astype(np.uint8)
\ No newline at end of file
+    return adjusted_matrix_int.astype(np.uint8)
+
+
+def scale_to_block_size(q_matrix, block_size):
+    """
+    Матрица квантования 8x8 (после учета качества), пересчитанная для блока NxN.
+
+    Коэффициент (u, v) блока NxN соответствует частоте (u * 8/N, v * 8/N) блока 8x8,
+    а dct_2d для блока NxN отличается от ортонормированного множителем N/8, поэтому шаг
+    берется из ближайшего элемента матрицы 8x8 и умножается на N/8: при одинаковом
+    качестве ошибка на пиксель для разных размеров блока сопоставима. Матрица NxN
+    однозначно задается матрицей 8x8, поэтому декодер может не хранить ее отдельно.
+
+    Аргументы:
+        q_matrix (np.ndarray): Матрица квантования 8x8.
+        block_size (int): Размер блока N.
+
+    Возвращает:
+        np.ndarray: Матрица NxN с целочисленными значениями от 1 до 255.
+    """
+    base_size = q_matrix.shape[0]
+    if block_size == base_size:
+        return q_matrix
+    index = np.arange(block_size) * base_size // block_size
+    scaled = np.round(q_matrix.astype(np.float64)[np.ix_(index, index)] * (block_size / base_size))
+    return np.clip(scaled, 1, 255).astype(np.uint8)
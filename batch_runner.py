@@ -0,0 +1,451 @@
+import argparse
+import csv
+import glob
+import hashlib
+import io
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+from PIL import Image
+
+import instrumentation
+import image_metrics
+import pipeline
+from jpeg_compressor import compress_image, quantize_array, encode_quantized, GRAYSCALE_MODES
+from jpeg_decompressor import decode_to_array
+
+
+MANIFEST_NAME = ".batch_manifest.json"
+RESULTS_NAME = "results.csv"
+RESULT_COLUMNS = ["input", "output", "params", "status", "original_bytes", "compressed_bytes",
+                  "ratio", "encode_seconds", "decode_seconds", "psnr", "error"]
+
+# Параметры compress_image, относящиеся ко второй половине сжатия (encode_quantized);
+# остальные передаются в quantize_array.
+ENTROPY_PARAMS = ("progressive", "entropy_coder")
+PIPELINE_STAGES = ("read", "quantize", "entropy", "verify", "write")
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Возвращает SHA-256 содержимого файла в шестнадцатеричном виде."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def expand_param_matrix(param_matrix):
+    """
+    Раскрывает матрицу параметров в список комбинаций.
+
+    Аргументы:
+        param_matrix (dict[str, list]): Имя аргумента compress_image -> список значений,
+                                        например {'quality': [10, 50, 90], 'block_size': [8]}.
+
+    Возвращает:
+        list[dict]: Декартово произведение значений в виде списка словарей kwargs.
+    """
+    if not param_matrix:
+        return [{}]
+    names = sorted(param_matrix)
+    return [dict(zip(names, values)) for values in itertools.product(*(param_matrix[name] for name in names))]
+
+
+def glob_root(patterns):
+    """
+    Общая папка шаблонов glob: самый длинный общий префикс их частей без символов
+    подстановки. Не зависит от найденных файлов, поэтому имена результатов
+    не меняются между запусками с теми же шаблонами.
+    """
+    roots = []
+    for pattern in patterns:
+        parts = []
+        for part in os.path.normpath(os.path.abspath(pattern)).split(os.sep)[:-1]:
+            if glob.has_magic(part):
+                break
+            parts.append(part)
+        roots.append(os.sep.join(parts) or os.sep)
+    return os.path.commonpath(roots) if roots else os.getcwd()
+
+
+def output_name(input_path, params, root=None):
+    """
+    Имя выходного файла: '<имя.расширение> <параметры>.raw' в подпапке, повторяющей путь
+    исходного файла относительно root (по умолчанию - его папки) без расширения.
+    Файлы с одинаковым именем из разных папок и файлы, отличающиеся только расширением
+    (x.png и x.jpg), получают разные имена.
+    """
+    relative = os.path.relpath(os.path.abspath(input_path), root or os.path.dirname(os.path.abspath(input_path)))
+    name = os.path.basename(relative)
+    suffix = " ".join(f"{key}={params[key]}" for key in sorted(params))
+    return os.path.join(os.path.splitext(relative)[0], f"{name} {suffix}.raw" if suffix else f"{name}.raw")
+
+
+def _default_file_mode():
+    """Права нового файла с учётом umask (mkstemp создаёт файлы с правами 0600)."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def _atomic_write_bytes(path, data):
+    """Записывает файл целиком через временный файл в той же папке и os.replace."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, _default_file_mode())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def run_job(input_path, output_path, params, measure_psnr=True):
+    """
+    Выполняет одно задание пакета: сжатие input_path с параметрами params в output_path.
+    Результат сначала пишется во временный файл и атомарно переименовывается.
+
+    Возвращает:
+        dict: Метрики задания (размеры, время, PSNR, статус).
+    """
+    tracer = instrumentation.ErrorCollector()
+    directory = os.path.dirname(output_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".raw")
+    os.close(fd)
+    row = {"input": input_path, "output": output_path, "params": json.dumps(params, sort_keys=True),
+           "original_bytes": os.path.getsize(input_path)}
+    try:
+        start = time.perf_counter()
+        compress_image(input_path, tmp_path, tracer=tracer, **params)
+        row["encode_seconds"] = time.perf_counter() - start
+
+        if tracer.errors or os.path.getsize(tmp_path) == 0:
+            row["status"] = "failed"
+            row["error"] = "; ".join(tracer.errors) or "пустой результат"
+            return row
+
+        if measure_psnr:
+            start = time.perf_counter()
+            decoded = decode_to_array(tmp_path, tracer=tracer)
+            row["decode_seconds"] = time.perf_counter() - start
+            if decoded is not None:
+                with Image.open(input_path) as img:
+                    original = np.array(img.convert('L' if decoded.ndim == 2 else 'RGB'))
+                row["psnr"] = image_metrics.psnr(original, decoded)
+
+        row["compressed_bytes"] = os.path.getsize(tmp_path)
+        row["ratio"] = row["original_bytes"] / row["compressed_bytes"]
+        os.chmod(tmp_path, _default_file_mode())
+        os.replace(tmp_path, output_path)
+        row["status"] = "done"
+        return row
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _stage_read(job):
+    """Стадия чтения (поток): декодирование входного изображения в массив."""
+    with Image.open(job["input_path"]) as img:
+        job["pixels"] = np.array(img.convert('L' if img.mode in GRAYSCALE_MODES else 'RGB'))
+    job["row"]["original_bytes"] = os.path.getsize(job["input_path"])
+    return job
+
+
+def _stage_errors(tracer, default):
+    return RuntimeError("; ".join(tracer.errors) or default)
+
+
+def _stage_quantize(job):
+    """Стадия цветового преобразования, DCT и квантования (процесс)."""
+    tracer = instrumentation.ErrorCollector()
+    params = {key: value for key, value in job["params"].items() if key not in ENTROPY_PARAMS}
+    start = time.perf_counter()
+    job["quantized"] = quantize_array(job["pixels"], tracer=tracer, **params)
+    job["row"]["encode_seconds"] = time.perf_counter() - start
+    if job["quantized"] is None:
+        raise _stage_errors(tracer, "ошибка квантования")
+    if not job["measure_psnr"]:
+        del job["pixels"]
+    return job
+
+
+def _stage_entropy(job):
+    """Стадия энтропийного кодирования и упаковки в контейнер (процесс)."""
+    tracer = instrumentation.ErrorCollector()
+    params = {key: value for key, value in job["params"].items() if key in ENTROPY_PARAMS}
+    start = time.perf_counter()
+    job["data"] = encode_quantized(job.pop("quantized"), tracer=tracer, **params)
+    job["row"]["encode_seconds"] += time.perf_counter() - start
+    if not job["data"]:
+        raise _stage_errors(tracer, "пустой результат")
+    return job
+
+
+def _stage_verify(job):
+    """Стадия декодирования результата для PSNR (процесс)."""
+    pixels = job.pop("pixels", None)
+    if pixels is None:
+        return job
+    start = time.perf_counter()
+    decoded = decode_to_array(job["data"])
+    job["row"]["decode_seconds"] = time.perf_counter() - start
+    if decoded is not None:
+        if decoded.ndim == 2 and pixels.ndim == 3:
+            # RGB с R = G = B сжимается одним компонентом
+            pixels = pixels[:, :, 0]
+        job["row"]["psnr"] = image_metrics.psnr(pixels, decoded)
+    return job
+
+
+def _stage_write(job):
+    """Стадия записи (поток): атомарная запись сжатого файла."""
+    os.makedirs(os.path.dirname(job["output_path"]) or ".", exist_ok=True)
+    _atomic_write_bytes(job["output_path"], job["data"])
+    row = job["row"]
+    row["compressed_bytes"] = len(job.pop("data"))
+    row["ratio"] = row["original_bytes"] / row["compressed_bytes"]
+    row["status"] = "done"
+    return job
+
+
+def batch_pipeline(workers=None, io_workers=2, stage_workers=None, measure_psnr=True, queue_size=None,
+                   tracer=None):
+    """
+    Конвейер пакетного сжатия: чтение и декодирование входа -> цвет, DCT и квантование ->
+    энтропийное кодирование -> [декодирование для PSNR] -> запись. Чтение и запись выполняются
+    потоками, вычислительные стадии - пулами процессов (см. pipeline.Pipeline).
+
+    Аргументы:
+        workers (int, optional): Процессов на каждую вычислительную стадию (по умолчанию os.cpu_count()).
+        io_workers (int): Потоков на стадии чтения и записи.
+        stage_workers (dict, optional): Число исполнителей отдельных стадий по именам PIPELINE_STAGES.
+        measure_psnr (bool): Включать ли стадию verify.
+        queue_size (int, optional): Емкость очередей (по умолчанию 2 * workers).
+        tracer (instrumentation.Tracer, optional): Получатель счетчиков стадий.
+
+    Возвращает:
+        pipeline.Pipeline: Конвейер для элементов-заданий run_batch.
+    """
+    workers = workers or os.cpu_count() or 1
+    counts = {"read": io_workers, "quantize": workers, "entropy": workers, "verify": workers, "write": io_workers}
+    unknown = set(stage_workers or ()) - set(counts)
+    if unknown:
+        raise ValueError(f"Неизвестные стадии конвейера: {sorted(unknown)}")
+    counts.update(stage_workers or {})
+    stages = [
+        pipeline.Stage("read", _stage_read, counts["read"]),
+        pipeline.Stage("quantize", _stage_quantize, counts["quantize"], processes=True),
+        pipeline.Stage("entropy", _stage_entropy, counts["entropy"], processes=True),
+    ]
+    if measure_psnr:
+        stages.append(pipeline.Stage("verify", _stage_verify, counts["verify"], processes=True))
+    stages.append(pipeline.Stage("write", _stage_write, counts["write"]))
+    return pipeline.Pipeline(stages, queue_size=queue_size or 2 * workers, tracer=tracer)
+
+
+def _run_pool(pending, workers, max_in_flight, measure_psnr):
+    """Выполняет задания run_job в пуле процессов, возвращая (задание, строка) по мере готовности."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = iter(pending)
+        in_flight = {}
+        while True:
+            while len(in_flight) < max_in_flight:
+                job = next(jobs, None)
+                if job is None:
+                    break
+                key, content_hash, input_path, output_path, params = job
+                future = pool.submit(run_job, input_path, output_path, params, measure_psnr)
+                in_flight[future] = job
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = in_flight.pop(future)
+                key, content_hash, input_path, output_path, params = job
+                try:
+                    row = future.result()
+                except Exception as e:
+                    row = {"input": input_path, "output": output_path,
+                           "params": json.dumps(params, sort_keys=True), "status": "failed", "error": str(e)}
+                yield job, row
+
+
+def _run_pipeline(pending, conveyor, measure_psnr):
+    """Выполняет задания конвейером batch_pipeline, возвращая (задание, строка) по мере готовности."""
+    items = ({"input_path": input_path, "output_path": output_path, "params": params,
+              "measure_psnr": measure_psnr,
+              "row": {"input": input_path, "output": output_path, "params": json.dumps(params, sort_keys=True)}}
+             for key, content_hash, input_path, output_path, params in pending)
+    for index, job, error in conveyor.run(items):
+        key, content_hash, input_path, output_path, params = pending[index]
+        if error is not None:
+            stage, exception = error
+            row = {"input": input_path, "output": output_path, "params": json.dumps(params, sort_keys=True),
+                   "status": "failed", "error": f"{stage}: {exception}"}
+        else:
+            row = job["row"]
+        yield pending[index], row
+
+
+def _load_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_manifest(path, manifest):
+    _atomic_write_bytes(path, json.dumps(manifest, indent=4, ensure_ascii=False).encode('utf-8'))
+
+
+def run_batch(patterns, param_matrix, output_dir, workers=None, max_in_flight=None,
+              measure_psnr=True, force=False, tracer=None, conveyor=None):
+    """
+    Сжимает все файлы, подходящие под шаблоны patterns, для каждой комбинации параметров.
+
+    Задания выполняются в пуле процессов, одновременно в работе находится не более
+    max_in_flight заданий. В output_dir хранится манифест с хешем содержимого входа и
+    параметрами каждого результата: если ни то ни другое не изменилось и выходной файл
+    существует, задание пропускается, а его метрики берутся из манифеста. Манифест
+    перезаписывается после каждого выполненного задания, поэтому прерванный пакет
+    при повторном запуске продолжается с невыполненных заданий. Пути результатов
+    (и ключи манифеста) повторяют пути входов относительно общей папки шаблонов (glob_root).
+    Сводная таблица метрик атомарно записывается в output_dir/results.csv.
+    С conveyor (batch_pipeline) задания вместо пула процессов проходят конвейер стадий,
+    в котором чтение и запись одних файлов идут одновременно со сжатием других.
+
+    Аргументы:
+        patterns (list[str]): Шаблоны glob входных изображений.
+        param_matrix (dict[str, list]): Матрица параметров compress_image (см. expand_param_matrix).
+        output_dir (str): Папка для результатов.
+        workers (int, optional): Число процессов (по умолчанию os.cpu_count()).
+        max_in_flight (int, optional): Предел одновременно отправленных заданий (по умолчанию 2 * workers).
+        measure_psnr (bool): Декодировать ли результат для вычисления PSNR.
+        force (bool): Пересчитать все задания, игнорируя манифест.
+        tracer (instrumentation.Tracer, optional): Получатель событий о ходе пакета.
+        conveyor (pipeline.Pipeline, optional): Конвейер batch_pipeline (measure_psnr
+            определяется наличием в нем стадии verify).
+
+    Возвращает:
+        list[dict]: Строки сводной таблицы.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max(1, max_in_flight or 2 * workers)
+    os.makedirs(output_dir, exist_ok=True)
+
+    inputs = sorted({path for pattern in patterns for path in glob.glob(pattern) if os.path.isfile(path)})
+    root = glob_root(patterns)
+    combos = expand_param_matrix(param_matrix)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = {} if force else _load_manifest(manifest_path)
+    new_manifest = {}
+    rows = []
+
+    pending = []
+    for input_path in inputs:
+        content_hash = file_sha256(input_path)
+        for params in combos:
+            output_path = os.path.join(output_dir, output_name(input_path, params, root))
+            key = os.path.relpath(output_path, output_dir)
+            entry = manifest.get(key)
+            if (entry is not None and entry.get("sha256") == content_hash and entry.get("params") == params
+                    and os.path.exists(output_path)):
+                new_manifest[key] = entry
+                rows.append(dict(entry["row"], status="skipped"))
+                continue
+            pending.append((key, content_hash, input_path, output_path, params))
+    tracer.counter('jobs', len(pending), skipped=len(rows))
+    _write_manifest(manifest_path, new_manifest)
+
+    with tracer.stage('batch', jobs=len(pending)):
+        if conveyor is not None:
+            measure_psnr = any(stage.name == "verify" for stage in conveyor.stages)
+            results = _run_pipeline(pending, conveyor, measure_psnr)
+        else:
+            results = _run_pool(pending, workers, max_in_flight, measure_psnr)
+        for (key, content_hash, input_path, output_path, params), row in results:
+            rows.append(row)
+            if row["status"] == "done":
+                new_manifest[key] = {"sha256": content_hash, "params": params, "row": row}
+                _write_manifest(manifest_path, new_manifest)
+            else:
+                tracer.warning(f"Задание {key} не выполнено: {row.get('error')}")
+            tracer.counter('jobs_done', 1, status=row["status"])
+
+    rows.sort(key=lambda row: (row["input"], row["params"]))
+    write_results(os.path.join(output_dir, RESULTS_NAME), rows)
+    return rows
+
+
+def write_results(path, rows):
+    """Атомарно записывает сводную таблицу метрик в CSV."""
+    buffer = io.StringIO(newline='')
+    writer = csv.DictWriter(buffer, fieldnames=RESULT_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(rows)
+    _atomic_write_bytes(path, buffer.getvalue().encode('utf-8'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетное сжатие изображений в пуле процессов.")
+    parser.add_argument("patterns", nargs="+", help="Шаблоны glob входных изображений, например 'data/*.png'.")
+    parser.add_argument("-o", "--output-dir", default="batch_output", help="Папка для результатов.")
+    parser.add_argument("-q", "--quality", type=int, nargs="+", default=[75], help="Список уровней качества.")
+    parser.add_argument("--block-size", type=int, nargs="+", default=None, help="Список размеров блока.")
+    parser.add_argument("--adaptive-blocks", action="store_true",
+                        help="Выбирать блоки 8x8 или 16x16 для каждого макроблока.")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Число процессов.")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Предел заданий в работе.")
+    parser.add_argument("--no-psnr", action="store_true", help="Не декодировать результаты для PSNR.")
+    parser.add_argument("--force", action="store_true", help="Пересчитать все задания.")
+    parser.add_argument("--profile", action="store_true", help="Вывести разбивку времени по этапам.")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Конвейер стадий вместо пула заданий; выводит загрузку стадий.")
+    parser.add_argument("--io-workers", type=int, default=2, help="Потоков чтения и записи конвейера.")
+    parser.add_argument("--stage-workers", nargs="+", default=[], metavar="STAGE=N",
+                        help=f"Исполнители отдельных стадий конвейера: {', '.join(PIPELINE_STAGES)}.")
+    args = parser.parse_args(argv)
+
+    param_matrix = {"quality": args.quality}
+    if args.block_size:
+        param_matrix["block_size"] = args.block_size
+    if args.adaptive_blocks:
+        param_matrix["adaptive_blocks"] = [True]
+
+    tracer = instrumentation.PerfCounterCollector() if args.profile else instrumentation.ConsoleTracer()
+    conveyor = None
+    if args.pipeline:
+        try:
+            stage_workers = {name: int(count) for name, count in (item.split("=", 1) for item in args.stage_workers)}
+            conveyor = batch_pipeline(args.workers, io_workers=args.io_workers, stage_workers=stage_workers,
+                                      measure_psnr=not args.no_psnr, queue_size=args.max_in_flight)
+        except ValueError as e:
+            parser.error(f"--stage-workers: {e}")
+    rows = run_batch(args.patterns, param_matrix, args.output_dir, workers=args.workers,
+                     max_in_flight=args.max_in_flight, measure_psnr=not args.no_psnr,
+                     force=args.force, tracer=tracer, conveyor=conveyor)
+    if args.profile:
+        tracer.report()
+    if conveyor is not None:
+        conveyor.report()
+    failed = sum(1 for row in rows if row["status"] == "failed")
+    print(f"Заданий: {len(rows)}, ошибок: {failed}. Таблица: {os.path.join(args.output_dir, RESULTS_NAME)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
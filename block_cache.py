@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+
+def block_key(block, q_key):
+    """
+    Ключ кэша блока: тип и байты исходного блока (до сдвига уровня) и байты матрицы квантования.
+
+    Аргументы:
+        block (np.ndarray): Блок NxN исходного канала.
+        q_key (bytes): Байты матрицы квантования (q_matrix.tobytes()), вычисляются один раз на компонент.
+
+    Возвращает:
+        tuple: Хешируемый ключ.
+    """
+    return (block.dtype.str, block.shape, block.tobytes(), q_key)
+
+
+class BlockCache:
+    """
+    LRU кэш результатов квантования блоков при сжатии. Одинаковые по байтам блоки
+    (однотонный фон, повторяющиеся символы на скриншотах и сканах) с одной матрицей
+    квантования дают одни и те же коэффициенты, поэтому DCT и квантование для них
+    выполняются один раз. Кэш ограничен количеством записей; строки коэффициентов
+    в кэше доступны только для чтения.
+    """
+    def __init__(self, max_entries=65536):
+        """
+        Аргументы:
+            max_entries (int): Предельное количество записей.
+        """
+        if max_entries <= 0:
+            raise ValueError("Размер кэша должен быть положительным.")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        Возвращает запись (коэффициенты в зигзаг-порядке, сумма квадратов ошибки квантования
+        или None) по ключу, помечая ее как недавно использованную, или None.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, zigzag_row, squared_error=None):
+        """Помещает результат квантования блока в кэш, вытесняя давно не использованные записи."""
+        zigzag_row.flags.writeable = False
+        self._entries[key] = (zigzag_row, squared_error)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """Счетчики кэша: попадания, промахи, доля попаданий, вытеснения, записи."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+        }
+
+    def clear(self):
+        """Очищает кэш и сбрасывает счетчики."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
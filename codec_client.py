@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+import codec_protocol
+
+
+class CodecError(Exception):
+    """Сервис кодека вернул ошибку."""
+
+
+class CodecClient:
+    """
+    Асинхронный клиент сервиса кодека (см. codec_server). Одно соединение допускает
+    несколько одновременных запросов: ответы сопоставляются с запросами по id.
+    После разрыва соединения или нарушения протокола все ожидающие и последующие
+    запросы завершаются той же ошибкой (ConnectionError или codec_protocol.ProtocolError).
+    """
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._ids = itertools.count(1)
+        self._waiters = {}
+        self._error = None
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+    @classmethod
+    async def connect(cls, socket_path):
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        return cls(reader, writer)
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        self._reader_task.cancel()
+        try:
+            await self._reader_task
+        except asyncio.CancelledError:
+            pass
+
+    async def request(self, header, body=b''):
+        """Отправляет запрос и возвращает (заголовок ответа, тело). Ошибка сервиса -> CodecError."""
+        if self._reader_task.done():
+            # ответы больше никто не читает: ожидание не завершилось бы никогда
+            raise self._error or ConnectionResetError("Соединение с сервисом закрыто.")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[request_id] = future
+        try:
+            self._writer.write(codec_protocol.encode_frame(dict(header, id=request_id), body))
+            await self._writer.drain()
+        except ConnectionError:
+            self._waiters.pop(request_id, None)
+            raise
+        response, response_body = await future
+        if response.get('status') != 'ok':
+            raise CodecError(response.get('error', 'неизвестная ошибка'))
+        return response, response_body
+
+    async def compress(self, image, quality=75):
+        """Сжимает RGB массив uint8 и возвращает содержимое файла MYJPEG."""
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        _, body = await self.request({'op': 'compress', 'quality': quality, 'format': 'raw',
+                                      'shape': list(image.shape)}, image.tobytes())
+        return body
+
+    async def decompress(self, data):
+        """Декодирует содержимое файла MYJPEG в RGB массив."""
+        response, body = await self.request({'op': 'decompress'}, data)
+        return np.frombuffer(body, dtype=np.uint8).reshape(response['shape'])
+
+    async def stats(self):
+        response, _ = await self.request({'op': 'stats'})
+        return response
+
+    async def _read_responses(self):
+        try:
+            while True:
+                header, body = await codec_protocol.read_frame(self._reader)
+                if header is None:
+                    break
+                future = self._waiters.pop(header.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result((header, body))
+        except (codec_protocol.ProtocolError, ConnectionError) as e:
+            error = e
+        else:
+            error = ConnectionResetError("Сервис закрыл соединение.")
+        self._error = error
+        for future in self._waiters.values():
+            if not future.done():
+                future.set_exception(error)
+        self._waiters.clear()
+
+
+async def run_load(socket_path, image, op='compress', requests=200, concurrency=8, connections=1, quality=75):
+    """
+    Генератор нагрузки: concurrency сопрограмм по connections соединениям отправляют
+    всего requests запросов и замеряют задержку каждого.
+
+    Возвращает:
+        dict: Количество запросов и ошибок, длительность, пропускная способность
+              (запросов/с и МБ/с входных данных), сводка задержек и статистика сервера
+              (None, если ни одно соединение не уцелело). Разрыв соединения считается
+              ошибкой запроса, как и ошибка сервиса.
+    """
+    clients = [await CodecClient.connect(socket_path) for _ in range(max(1, connections))]
+    payload = image
+    if op == 'decompress':
+        payload = await clients[0].compress(image, quality=quality)
+    payload_bytes = image.nbytes if op == 'compress' else len(payload)
+
+    latencies = []
+    errors = 0
+    remaining = itertools.count()
+
+    async def worker(client):
+        nonlocal errors
+        while next(remaining) < requests:
+            start = time.perf_counter()
+            try:
+                if op == 'compress':
+                    await client.compress(payload, quality=quality)
+                else:
+                    await client.decompress(payload)
+                latencies.append(time.perf_counter() - start)
+            except (CodecError, ConnectionError, codec_protocol.ProtocolError):
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(clients[i % len(clients)]) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    server_stats = None
+    for client in clients:
+        try:
+            server_stats = await client.stats()
+            break
+        except (CodecError, ConnectionError, codec_protocol.ProtocolError):
+            continue
+    for client in clients:
+        await client.close()
+
+    completed = len(latencies)
+    return {
+        'op': op,
+        'requests': completed + errors,
+        'errors': errors,
+        'elapsed_s': elapsed,
+        'throughput_rps': completed / elapsed if elapsed > 0 else 0.0,
+        'throughput_mb_s': completed * payload_bytes / elapsed / 1e6 if elapsed > 0 else 0.0,
+        'latency': codec_protocol.latency_summary(latencies),
+        'server': server_stats,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генератор нагрузки для сервиса кодека.")
+    parser.add_argument("image", help="Изображение, отправляемое в запросах.")
+    parser.add_argument("--socket", default="/tmp/myjpeg-codec.sock", help="Путь к Unix-сокету.")
+    parser.add_argument("--op", choices=("compress", "decompress"), default="compress")
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--connections", type=int, default=1)
+    parser.add_argument("-q", "--quality", type=int, default=75)
+    parser.add_argument("--json", action="store_true", help="Вывести результат в JSON.")
+    args = parser.parse_args(argv)
+
+    with Image.open(args.image) as img:
+        image = np.array(img.convert('RGB'))
+    report = asyncio.run(run_load(args.socket, image, op=args.op, requests=args.requests,
+                                  concurrency=args.concurrency, connections=args.connections,
+                                  quality=args.quality))
+    if args.json:
+        print(json.dumps(report, indent=4, ensure_ascii=False))
+    else:
+        latency = report['latency']
+        print(f"{report['op']}: {report['requests']} запросов, ошибок {report['errors']}, "
+              f"{report['elapsed_s']:.2f} с")
+        print(f"Пропускная способность: {report['throughput_rps']:.1f} запросов/с, "
+              f"{report['throughput_mb_s']:.2f} МБ/с")
+        print(f"Задержка: p50 {latency['p50_ms']:.2f} мс, p99 {latency['p99_ms']:.2f} мс, "
+              f"макс. {latency['max_ms']:.2f} мс")
+        server = report['server']
+        if server is not None:
+            print(f"Сервер: пакетов {server['batches']}, "
+                  f"средний размер пакета {server['mean_batch_size']:.2f}, "
+                  f"макс. глубина очереди {server['queue_high_water']}")
+    return 1 if report['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+import constants
+
+
+# Кадр протокола сервиса кодека:
+#   [длина заголовка][заголовок JSON (utf-8)][длина тела][тело]
+# Длины занимают constants.Bites_for_param байт в порядке constants.ByteOrder,
+# как и длина заголовка в сжатом файле.
+#
+# Запрос:  {"id": 1, "op": "compress", "quality": 75, "format": "raw", "shape": [h, w, 3] или [h, w]} + пиксели uint8
+#          {"id": 2, "op": "compress", "quality": 75, "format": "image"} + файл PNG/BMP/...
+#          (необязательно "progressive": true | "refine" - прогрессивный режим, см. progressive_coding;
+#           "entropy_coder": "huffman" | "rans" - энтропийный кодер, см. entropy_coding;
+#           "rdo": true | множитель λ - квантование с оптимизацией искажение/биты, см. rdo_quantization)
+#          {"id": 3, "op": "decompress"} + сжатый файл MYJPEG
+#          {"id": 4, "op": "stats"} + пустое тело
+# Ответ:   {"id": 1, "status": "ok", ...} + сжатые данные или пиксели ("shape" в заголовке)
+#          {"id": 1, "status": "error", "error": "..."} + пустое тело
+
+MAX_HEADER_BYTES = 1 << 20
+MAX_BODY_BYTES = 1 << 30
+
+
+class ProtocolError(Exception):
+    """Нарушение формата кадра протокола."""
+
+
+def encode_frame(header, body=b''):
+    """
+    Собирает кадр протокола в одну байтовую строку.
+
+    Аргументы:
+        header (dict): Заголовок (сериализуется в JSON).
+        body (bytes-like): Тело кадра.
+
+    Возвращает:
+        bytes: Готовый к отправке кадр.
+    """
+    header_bytes = json.dumps(header).encode('utf-8')
+    return b''.join((
+        len(header_bytes).to_bytes(constants.Bites_for_param, constants.ByteOrder),
+        header_bytes,
+        len(body).to_bytes(constants.Bites_for_param, constants.ByteOrder),
+        body,
+    ))
+
+
+async def read_frame(reader):
+    """
+    Читает один кадр из asyncio.StreamReader.
+
+    Возвращает:
+        tuple[dict, bytes]: (заголовок, тело) или (None, None), если соединение закрыто
+                            до начала очередного кадра.
+    """
+    try:
+        prefix = await reader.readexactly(constants.Bites_for_param)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None, None
+        raise ProtocolError("Соединение закрыто посреди длины заголовка.") from e
+    header_len = int.from_bytes(prefix, constants.ByteOrder)
+    if header_len > MAX_HEADER_BYTES:
+        raise ProtocolError(f"Слишком длинный заголовок: {header_len} байт.")
+    try:
+        header = json.loads((await reader.readexactly(header_len)).decode('utf-8'))
+        body_len = int.from_bytes(await reader.readexactly(constants.Bites_for_param), constants.ByteOrder)
+        if body_len > MAX_BODY_BYTES:
+            raise ProtocolError(f"Слишком длинное тело кадра: {body_len} байт.")
+        body = await reader.readexactly(body_len)
+    except asyncio.IncompleteReadError as e:
+        raise ProtocolError("Соединение закрыто посреди кадра.") from e
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ProtocolError(f"Некорректный заголовок кадра: {e}") from e
+    if not isinstance(header, dict):
+        raise ProtocolError("Заголовок кадра должен быть объектом JSON.")
+    return header, body
+
+
+def latency_summary(latencies):
+    """
+    Сводка по задержкам (в секундах).
+
+    Возвращает:
+        dict: count, mean, p50, p90, p99 и max в миллисекундах.
+    """
+    values = sorted(latencies)
+    if not values:
+        return {'count': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p90_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+
+    def percentile(p):
+        index = min(len(values) - 1, max(0, int(round(p / 100.0 * (len(values) - 1)))))
+        return values[index] * 1000.0
+
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) * 1000.0,
+        'p50_ms': percentile(50),
+        'p90_ms': percentile(90),
+        'p99_ms': percentile(99),
+        'max_ms': values[-1] * 1000.0,
+    }
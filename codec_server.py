@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import collections
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import instrumentation
+import codec_protocol
+import codec_session
+from jpeg_compressor import GRAYSCALE_MODES
+
+
+CODEC_OPS = ('compress', 'decompress')
+
+# сессии кодека процесса пула: таблицы и буферы общие для всех запросов процесса
+_encoder = None
+_decoder = None
+
+
+def _sessions():
+    global _encoder, _decoder
+    if _encoder is None:
+        _encoder = codec_session.Encoder()
+        _decoder = codec_session.Decoder()
+    return _encoder, _decoder
+
+
+def _init_worker():
+    """
+    Инициализатор процесса пула: создает сессии кодека и прогоняет маленькое изображение
+    через сжатие и декомпрессию, чтобы таблицы Хаффмана, матрицы квантования качества
+    по умолчанию и матрицы DCT были готовы до первого настоящего запроса.
+    """
+    encoder, decoder = _sessions()
+    data = encoder.compress_array(np.full((16, 16, 3), 128, dtype=np.uint8))
+    if data is not None:
+        decoder.decompress_bytes(data)
+
+
+def _process_one(op, params, body):
+    """Выполняет один запрос кодека в процессе пула. Возвращает (заголовок ответа, тело)."""
+    tracer = instrumentation.ErrorCollector()
+    encoder, decoder = _sessions()
+    start = time.perf_counter()
+    try:
+        if op == 'compress':
+            if params.get('format', 'raw') == 'raw':
+                shape = tuple(params['shape'])
+                image = np.frombuffer(body, dtype=np.uint8).reshape(shape)
+            else:
+                with Image.open(io.BytesIO(body)) as img:
+                    image = np.array(img.convert('L' if img.mode in GRAYSCALE_MODES else 'RGB'))
+            result = encoder.compress_array(image, quality=params.get('quality', 75),
+                                            block_size=params.get('block_size', 8), tracer=tracer,
+                                            progressive=params.get('progressive', False),
+                                            entropy_coder=params.get('entropy_coder', 'huffman'),
+                                            rdo=params.get('rdo', False))
+            header = {}
+        elif op == 'decompress':
+            decoded = decoder.decompress_bytes(body, tracer=tracer)
+            result = None if decoded is None else decoded.tobytes()
+            header = {} if decoded is None else {'shape': list(decoded.shape)}
+        else:
+            return {'status': 'error', 'error': f"Неизвестная операция: {op}"}, b''
+    except Exception as e:
+        return {'status': 'error', 'error': f"{type(e).__name__}: {e}"}, b''
+
+    if result is None:
+        return {'status': 'error', 'error': "; ".join(tracer.errors) or "ошибка кодека"}, b''
+    header['status'] = 'ok'
+    header['worker_ms'] = (time.perf_counter() - start) * 1000.0
+    return header, result
+
+
+def _process_batch(items):
+    """Выполняет пакет запросов [(op, params, body), ...] в одном обращении к процессу пула."""
+    return [_process_one(op, params, body) for op, params, body in items]
+
+
+class _Request:
+    __slots__ = ('op', 'params', 'body', 'future', 'received')
+
+    def __init__(self, op, params, body, future):
+        self.op = op
+        self.params = params
+        self.body = body
+        self.future = future
+        self.received = time.perf_counter()
+
+
+class CodecServer:
+    """
+    Сервис сжатия/декомпрессии поверх Unix-сокета.
+
+    Запросы (см. codec_protocol) помещаются в ограниченную очередь. Когда очередь заполнена,
+    обработчик соединения перестает читать сокет - клиент упирается в обратное давление.
+    Отдельная задача собирает маленькие запросы в пакеты (до batch_max_items штук и
+    batch_max_bytes байт, ожидая не дольше batch_window секунд) и отправляет их в
+    "теплый" пул процессов; число одновременно обрабатываемых пакетов ограничено
+    max_in_flight_batches. Операция 'stats' возвращает счетчики очереди и задержек.
+    """
+    def __init__(self, socket_path, workers=None, queue_size=256, batch_max_items=16,
+                 batch_max_bytes=1 << 20, batch_window=0.002, small_request_bytes=256 * 1024,
+                 max_in_flight_batches=None, latency_window=10000):
+        self.socket_path = socket_path
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.batch_max_items = batch_max_items
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_window = batch_window
+        self.small_request_bytes = small_request_bytes
+        self.max_in_flight_batches = max_in_flight_batches or 2 * self.workers
+
+        self._queue = None
+        self._in_flight = None
+        self._pool = None
+        self._server = None
+        self._batcher_task = None
+        self._started = time.perf_counter()
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._counters = collections.Counter()
+        self._queue_high_water = 0
+        self._in_flight_batches = 0
+
+    async def start(self):
+        """Запускает пул процессов, задачу пакетирования и слушающий сокет."""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._in_flight = asyncio.Semaphore(self.max_in_flight_batches)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, os.getpid) for _ in range(self.workers)))
+        self._batcher_task = asyncio.create_task(self._batcher())
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        self._started = time.perf_counter()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Останавливает прием соединений, пакетирование и пул процессов."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._batcher_task is not None:
+            self._batcher_task.cancel()
+            try:
+                await self._batcher_task
+            except asyncio.CancelledError:
+                pass
+            self._batcher_task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def stats(self):
+        """Счетчики запросов, пакетов, глубина очереди и сводка задержек (мс)."""
+        uptime = time.perf_counter() - self._started
+        batches = self._counters['batches']
+        return {
+            'uptime_s': uptime,
+            'requests': dict((key[len('op:'):], value) for key, value in self._counters.items() if key.startswith('op:')),
+            'completed': self._counters['completed'],
+            'errors': self._counters['errors'],
+            'throughput_rps': self._counters['completed'] / uptime if uptime > 0 else 0.0,
+            'batches': batches,
+            'mean_batch_size': self._counters['batched_requests'] / batches if batches else 0.0,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'queue_capacity': self.queue_size,
+            'queue_high_water': self._queue_high_water,
+            'in_flight_batches': self._in_flight_batches,
+            'backpressure_waits': self._counters['backpressure_waits'],
+            'latency': codec_protocol.latency_summary(self._latencies),
+        }
+
+    async def _handle_connection(self, reader, writer):
+        write_lock = asyncio.Lock()
+        pending = set()
+        try:
+            while True:
+                try:
+                    header, body = await codec_protocol.read_frame(reader)
+                except codec_protocol.ProtocolError as e:
+                    await self._send(writer, write_lock, {'status': 'error', 'error': str(e)}, b'')
+                    break
+                if header is None:
+                    break
+                request_id = header.get('id')
+                op = header.get('op')
+                if op == 'stats':
+                    await self._send(writer, write_lock, dict(self.stats(), id=request_id, status='ok'), b'')
+                    continue
+                if op not in CODEC_OPS:
+                    await self._send(writer, write_lock,
+                                     {'id': request_id, 'status': 'error', 'error': f"Неизвестная операция: {op}"}, b'')
+                    continue
+
+                self._counters['op:' + op] += 1
+                request = _Request(op, header, body, asyncio.get_running_loop().create_future())
+                if self._queue.full():
+                    self._counters['backpressure_waits'] += 1
+                await self._queue.put(request)
+                self._queue_high_water = max(self._queue_high_water, self._queue.qsize())
+                task = asyncio.create_task(self._respond(writer, write_lock, request_id, request))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+
+    async def _respond(self, writer, write_lock, request_id, request):
+        header, body = await request.future
+        self._latencies.append(time.perf_counter() - request.received)
+        self._counters['completed'] += 1
+        if header.get('status') != 'ok':
+            self._counters['errors'] += 1
+        await self._send(writer, write_lock, dict(header, id=request_id), body)
+
+    async def _send(self, writer, write_lock, header, body):
+        async with write_lock:
+            writer.write(codec_protocol.encode_frame(header, body))
+            await writer.drain()
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            batch = [first]
+            batch_bytes = len(first.body)
+            if batch_bytes < self.small_request_bytes:
+                if self._queue.empty() and self.batch_window > 0:
+                    await asyncio.sleep(self.batch_window)
+                while (len(batch) < self.batch_max_items and batch_bytes < self.batch_max_bytes
+                       and not self._queue.empty()):
+                    request = self._queue.get_nowait()
+                    batch.append(request)
+                    batch_bytes += len(request.body)
+
+            await self._in_flight.acquire()
+            self._in_flight_batches += 1
+            self._counters['batches'] += 1
+            self._counters['batched_requests'] += len(batch)
+            future = loop.run_in_executor(self._pool, _process_batch,
+                                          [(request.op, request.params, request.body) for request in batch])
+            future.add_done_callback(lambda done, batch=batch: self._finish_batch(done, batch))
+
+    def _finish_batch(self, done, batch):
+        self._in_flight.release()
+        self._in_flight_batches -= 1
+        try:
+            results = done.result()
+        except Exception as e:
+            results = [({'status': 'error', 'error': f"{type(e).__name__}: {e}"}, b'')] * len(batch)
+        for request, result in zip(batch, results):
+            if not request.future.done():
+                request.future.set_result(result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сервис сжатия изображений поверх Unix-сокета.")
+    parser.add_argument("--socket", default="/tmp/myjpeg-codec.sock", help="Путь к Unix-сокету.")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Число процессов пула.")
+    parser.add_argument("--queue-size", type=int, default=256, help="Емкость очереди запросов.")
+    parser.add_argument("--batch-items", type=int, default=16, help="Максимум запросов в пакете.")
+    parser.add_argument("--batch-window-ms", type=float, default=2.0, help="Время ожидания для накопления пакета.")
+    args = parser.parse_args(argv)
+
+    server = CodecServer(args.socket, workers=args.workers, queue_size=args.queue_size,
+                         batch_max_items=args.batch_items, batch_window=args.batch_window_ms / 1000.0)
+    print(f"Сервис кодека слушает {args.socket}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
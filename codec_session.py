@@ -0,0 +1,150 @@
+import numpy as np
+
+import adjust_quantization_matrix
+import huffman_coding
+import jpeg_compressor
+import jpeg_decompressor
+
+
+class CodecSession:
+    """
+    Общее состояние серии операций кодека: таблицы Хаффмана по спецификации
+    (вместе с таблицами быстрого декодирования), матрицы квантования по качеству
+    и рабочие буферы, размер которых подстраивается под последнее изображение.
+    Матрицы DCT кэшируются модулем dct_2d для каждого N и общие для всех сессий.
+
+    Сессия не потокобезопасна: буферы переиспользуются следующим вызовом,
+    поэтому каждому потоку или процессу нужна своя сессия.
+    """
+    def __init__(self):
+        self._huffman_tables = {}
+        self._quantization_tables = {}
+        self._buffers = {}
+        self.table_hits = 0
+        self.table_misses = 0
+        self.buffer_allocations = 0
+
+    def huffman_table(self, bits, huffval):
+        """
+        Таблица Хаффмана по спецификации BITS/HUFFVAL, создается один раз.
+
+        Возвращает:
+            huffman_coding.HuffmanTable: Общая для всех вызовов таблица (не изменять).
+        """
+        key = (tuple(bits), tuple(huffval))
+        table = self._huffman_tables.get(key)
+        if table is None:
+            self.table_misses += 1
+            table = self._huffman_tables[key] = huffman_coding.HuffmanTable(bits, huffval)
+        else:
+            self.table_hits += 1
+        return table
+
+    def quantization_tables(self, quality, block_size=8):
+        """
+        Матрицы квантования яркости и цветности для качества quality (1..100)
+        и блока block_size x block_size, вычисляются при первом обращении.
+
+        Возвращает:
+            tuple[np.ndarray, np.ndarray]: (q_matrix_y, q_matrix_c), только для чтения.
+        """
+        tables = self._quantization_tables.get((quality, block_size))
+        if tables is None:
+            self.table_misses += 1
+            tables = tuple(adjust_quantization_matrix.scale_to_block_size(
+                               adjust_quantization_matrix.adjust_quantization_matrix(base, quality), block_size)
+                           for base in (jpeg_compressor.BASE_Q_LUMINANCE, jpeg_compressor.BASE_Q_CHROMINANCE))
+            for matrix in tables:
+                matrix.flags.writeable = False
+            self._quantization_tables[(quality, block_size)] = tables
+        else:
+            self.table_hits += 1
+        return tables
+
+    def buffer(self, key, rows, row_shape=(), dtype=np.int16):
+        """
+        Рабочий буфер (rows, *row_shape) без инициализации. Буфер с тем же ключом
+        переиспользуется, пока хватает строк, иначе выделяется заново под новый размер.
+
+        Аргументы:
+            key (hashable): Назначение буфера (например, ('coeffs', 'Y')).
+            rows (int): Требуемое количество строк.
+            row_shape (tuple): Форма строки.
+            dtype (np.dtype): Тип элементов.
+
+        Возвращает:
+            np.ndarray: C-непрерывный вид на первые rows строк буфера.
+        """
+        row_shape = tuple(row_shape)
+        array = self._buffers.get(key)
+        if array is None or array.shape[1:] != row_shape or array.dtype != dtype or len(array) < rows:
+            self.buffer_allocations += 1
+            array = self._buffers[key] = np.empty((rows,) + row_shape, dtype=dtype)
+        return array[:rows]
+
+    def stats(self):
+        """Счетчики сессии: попадания и промахи кэша таблиц, выделения буферов, байты в буферах."""
+        return {
+            'table_hits': self.table_hits,
+            'table_misses': self.table_misses,
+            'buffer_allocations': self.buffer_allocations,
+            'buffer_bytes': sum(array.nbytes for array in self._buffers.values()),
+        }
+
+    def clear(self):
+        """Освобождает таблицы и буферы и сбрасывает счетчики."""
+        self.__init__()
+
+
+class Encoder(CodecSession):
+    """
+    Сессия сжатия: серия изображений сжимается с общими таблицами и буферами.
+    Параметры методов совпадают с одноименными функциями jpeg_compressor
+    (quality, block_size, tracer, distortion, progressive, entropy_coder, rdo, block_cache);
+    результат побайтно совпадает с ними.
+    """
+    def __init__(self, block_cache=None):
+        """
+        Аргументы:
+            block_cache (block_cache.BlockCache, optional): Кэш квантованных блоков
+                для всех вызовов сессии (для серий скриншотов и документов); по умолчанию
+                кэш не используется.
+        """
+        super().__init__()
+        self.block_cache = block_cache
+
+    def _options(self, options):
+        options.setdefault('block_cache', self.block_cache)
+        return options
+
+    def compress_array(self, image, **options):
+        """Сжимает массив в байты MYJPEG (см. jpeg_compressor.compress_array)."""
+        return jpeg_compressor.compress_array(image, session=self, **self._options(options))
+
+    def compress_to_stream(self, image, fileobj, **options):
+        """Сжимает массив в двоичный поток (см. jpeg_compressor.compress_to_stream)."""
+        return jpeg_compressor.compress_to_stream(image, fileobj, session=self, **self._options(options))
+
+    def compress_image(self, image_path, output_path, **options):
+        """Сжимает файл изображения (см. jpeg_compressor.compress_image)."""
+        return jpeg_compressor.compress_image(image_path, output_path, session=self, **self._options(options))
+
+
+class Decoder(CodecSession):
+    """
+    Сессия декомпрессии: таблицы Хаффмана из заголовков с одинаковыми спецификациями
+    строятся один раз, буферы коэффициентов и блоков переиспользуются.
+    Возвращаемые изображения не ссылаются на буферы сессии.
+    """
+    def decompress_bytes(self, data, tracer=None, components=None):
+        """Декодирует сжатые данные из памяти (см. jpeg_decompressor.decompress_bytes)."""
+        return jpeg_decompressor.decompress_bytes(data, tracer=tracer, session=self, components=components)
+
+    def decompress_image(self, compressed_path, output_path, tracer=None, components=None):
+        """Декодирует файл MYJPEG в файл изображения (см. jpeg_decompressor.decompress_image)."""
+        return jpeg_decompressor.decompress_image(compressed_path, output_path, tracer=tracer, session=self,
+                                                  components=components)
+
+    def decode_to_array(self, source, cache=None, tracer=None):
+        """Декодирует путь или данные в массив (см. jpeg_decompressor.decode_to_array)."""
+        return jpeg_decompressor.decode_to_array(source, cache=cache, tracer=tracer, session=self)
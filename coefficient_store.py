@@ -0,0 +1,75 @@
+import numpy as np
+
+import zigzag_scan
+
+
+# Квантованные коэффициенты компонента между квантованием и энтропийным кодированием
+# (в обе стороны) хранятся одним массивом (n_blocks, N*N) типа COEFF_DTYPE в зигзаг-порядке,
+# DC - абсолютные значения. Уровни после квантования с шагом >= 1 не превышают по модулю
+# 1024 * N/8 (см. dct_2d), поэтому int16 достаточно и для блоков 16x16.
+# Позиции конца блока (EOB) - необязательный массив (n_blocks,): индекс последнего
+# ненулевого коэффициента плюс один (0 для нулевого блока).
+
+COEFF_DTYPE = np.int16
+
+
+def allocate(num_blocks, num_coeffs=64):
+    """
+    Создает нулевое хранилище коэффициентов.
+
+    Аргументы:
+        num_blocks (int): Количество блоков.
+        num_coeffs (int): Количество коэффициентов в блоке (N*N).
+
+    Возвращает:
+        np.ndarray: Массив (num_blocks, num_coeffs) типа COEFF_DTYPE.
+    """
+    return np.zeros((num_blocks, num_coeffs), dtype=COEFF_DTYPE)
+
+
+def eob_positions(coeffs):
+    """
+    Позиции конца блока для хранилища коэффициентов.
+
+    Аргументы:
+        coeffs (np.ndarray): Коэффициенты (n_blocks, N*N) в зигзаг-порядке.
+
+    Возвращает:
+        np.ndarray: Массив (n_blocks,) int32: индекс последнего ненулевого коэффициента плюс один.
+    """
+    coeffs = np.asarray(coeffs)
+    nonzero = coeffs != 0
+    last_from_end = np.argmax(nonzero[:, ::-1], axis=1)
+    return np.where(nonzero.any(axis=1), coeffs.shape[1] - last_from_end, 0).astype(np.int32)
+
+
+def to_blocks(coeffs, block_size):
+    """
+    Переставляет коэффициенты из зигзаг-порядка в блоки NxN (обратное зигзаг-сканирование
+    всех блоков одной операцией).
+
+    Аргументы:
+        coeffs (np.ndarray): Коэффициенты (n_blocks, N*N) в зигзаг-порядке.
+        block_size (int): Размер блока N.
+
+    Возвращает:
+        np.ndarray: Блоки (n_blocks, N, N) того же типа.
+    """
+    coeffs = np.asarray(coeffs)
+    inverse = zigzag_scan.inverse_zigzag_order(block_size)
+    return coeffs[:, inverse].reshape(-1, block_size, block_size)
+
+
+def from_blocks(blocks):
+    """
+    Переставляет блоки NxN в строки зигзаг-порядка (прямое зигзаг-сканирование всех блоков).
+
+    Аргументы:
+        blocks (np.ndarray): Блоки (n_blocks, N, N).
+
+    Возвращает:
+        np.ndarray: Коэффициенты (n_blocks, N*N) того же типа.
+    """
+    blocks = np.asarray(blocks)
+    block_size = blocks.shape[-1]
+    return blocks.reshape(-1, block_size * block_size)[:, zigzag_scan.zigzag_order(block_size)]
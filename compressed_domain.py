@@ -0,0 +1,581 @@
+import argparse
+import functools
+import io
+import math
+import sys
+
+import numpy as np
+
+import adjust_quantization_matrix
+import coefficient_store
+import entropy_coding
+import instrumentation
+import progressive_coding
+import zigzag_scan
+from image_archive import ArchiveWriter
+from jpeg_compressor import BASE_Q_LUMINANCE, BASE_Q_CHROMINANCE, write_compressed_data, _component_tables
+from jpeg_decompressor import (load_compressed_data, parse_compressed_data, decode_coefficients, read_tables,
+                               component_names)
+
+
+# Операции над сжатым файлом без выхода в область пикселей: файл декодируется только
+# до квантованных коэффициентов (jpeg_decompressor.decode_coefficients), коэффициенты
+# преобразуются и снова кодируются тем же энтропийным кодером и в том же режиме
+# (базовом или прогрессивном), что и исходный файл. Обратное DCT, апсэмплинг и цветовое
+# преобразование не выполняются, поэтому нет и потерь повторного сжатия пикселей.
+
+# Поворот, отражение и транспонирование выполняются перестановкой блоков и точными
+# операциями над коэффициентами блока C[v, u] (v - вертикальная частота, u - горизонтальная):
+#   отражение по горизонтали - C[v, u] * (-1)^u, по вертикали - C[v, u] * (-1)^v,
+#   транспонирование - C[u, v]; поворот составляется из них.
+# Сетка блоков Y дополняется нулевыми блоками до целого числа MCU (2x2 блока Y на блок
+# Cb/Cr при 4:2:0), чтобы Y и Cb/Cr отражались относительно одной границы. Дополнение
+# до целых блоков после отражения оказывается слева или сверху, поэтому видимая область
+# задается в метаданных смещением "offset_x"/"offset_y" в плоскости Y (декодер учитывает
+# его при обрезке и апсэмплинге). Смещение всегда меньше размера MCU.
+_TRANSFORM_STEPS = {
+    'flip_h': ('flip_h',),
+    'flip_v': ('flip_v',),
+    'transpose': ('transpose',),
+    'rotate90': ('transpose', 'flip_h'),
+    'rotate180': ('flip_h', 'flip_v'),
+    'rotate270': ('transpose', 'flip_v'),
+    'crop': (),
+}
+TRANSFORMS = tuple(_TRANSFORM_STEPS)
+
+# Уменьшение вдвое (пирамида) выполняется над деквантованными коэффициентами: блок
+# уровня ниже собирается из 2x2 соседних блоков линейным оператором, равным
+# последовательности IDCT -> усреднение 2x2 пикселей -> DCT, затем квантуется
+# матрицами исходного файла. Уровень i пирамиды - запись "level_i" архива MYJPAR.
+PYRAMID_LEVEL_NAME = "level_{}"
+
+
+def scan_script_from_metadata(metadata):
+    """
+    Восстанавливает скрипт сканов прогрессивного файла по описаниям сканов в метаданных
+    (скрипт применяется к каждому компоненту по очереди, см. progressive_coding).
+
+    Возвращает:
+        list[tuple]: Скрипт (Ss, Se, Ah, Al) или None для базового файла.
+    """
+    scans = metadata.get('progressive_scans')
+    if scans is None:
+        return None
+    step = len(component_names(metadata))
+    return [(scan['ss'], scan['se'], scan['ah'], scan['al']) for scan in scans[::step]]
+
+
+def encode_coefficients(metadata, coefficients, tracer=None):
+    """
+    Кодирует квантованные коэффициенты компонентов с таблицами Хаффмана, энтропийным
+    кодером и скриптом сканов из metadata. Таблицы файлов с блоками больше 8x8 построены
+    по статистике исходного изображения, и после перестановки коэффициентов в них может
+    не оказаться нужных символов, поэтому для таких файлов таблицы строятся заново
+    по новым коэффициентам и записываются в метаданные результата.
+
+    Аргументы:
+        metadata (dict): Метаданные результата (таблицы, размеры, "entropy_coder", "progressive_scans").
+        coefficients (dict): Имя компонента -> коэффициенты (n_blocks, N*N) в зигзаг-порядке.
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+
+    Возвращает:
+        tuple: (metadata, components_data) - копия метаданных с новыми длинами потоков
+               и словарь {'Y': bytes, 'Cb': bytes, 'Cr': bytes}.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    metadata = dict(metadata)
+    if metadata['block_size'] != 8:
+        huff_dc_y, huff_ac_y, huff_dc_c, huff_ac_c = _component_tables(
+            [(name, coefficients[name]) for name in component_names(metadata)])
+        metadata.update({
+            "huff_dc_y_bits": huff_dc_y.bits,
+            "huff_dc_y_huffval": huff_dc_y.huffval,
+            "huff_ac_y_bits": huff_ac_y.bits,
+            "huff_ac_y_huffval": huff_ac_y.huffval,
+            "huff_dc_c_bits": huff_dc_c.bits,
+            "huff_dc_c_huffval": huff_dc_c.huffval,
+            "huff_ac_c_bits": huff_ac_c.bits,
+            "huff_ac_c_huffval": huff_ac_c.huffval,
+        })
+    tables = read_tables(metadata)
+    components_data = {'Y': b'', 'Cb': b'', 'Cr': b''}
+    script = scan_script_from_metadata(metadata)
+    if script is not None:
+        components = [(name, coefficients[name], tables[name][1], tables[name][2]) for name in component_names(metadata)]
+        scans, scan_data = progressive_coding.encode_progressive(components, script, tracer=tracer)
+        metadata['progressive_scans'] = scans
+        components_data['Y'] = scan_data
+    else:
+        backend = entropy_coding.get_backend(metadata.get('entropy_coder'))
+        for name in component_names(metadata):
+            _, dc_table, ac_table = tables[name]
+            with tracer.stage('entropy', component=name, coder=backend.name):
+                components_data[name] = backend.encode(coefficients[name], dc_table, ac_table, tracer=tracer)
+            tracer.counter('bytes', len(components_data[name]), component=name)
+    for name in ('Y', 'Cb', 'Cr'):
+        metadata[f'data_len_{name.lower()}'] = len(components_data[name])
+    return metadata, components_data
+
+
+def requantize(zigzag_coeffs, q_old, q_new):
+    """
+    Переквантует коэффициенты: уровень l с шагом q_old становится round(l * q_old / q_new),
+    то есть коэффициент DCT, восстановленный декодером, квантуется новой матрицей
+    так же, как в quantization.quantize.
+
+    Аргументы:
+        zigzag_coeffs (np.ndarray): Коэффициенты (n_blocks, N*N) в зигзаг-порядке.
+        q_old, q_new (np.ndarray): Исходная и новая матрицы квантования NxN.
+
+    Возвращает:
+        np.ndarray: Новые коэффициенты того же типа и формы.
+    """
+    order = zigzag_scan.zigzag_order(q_old.shape[0])
+    q_old_zigzag = q_old.reshape(-1)[order].astype(np.float64)
+    q_new_zigzag = q_new.reshape(-1)[order].astype(np.float64)
+    dequantized = zigzag_coeffs.astype(np.float64) * q_old_zigzag
+    return np.round(dequantized / q_new_zigzag).astype(zigzag_coeffs.dtype)
+
+
+def _transcode(metadata, y_data, cb_data, cr_data, quality, tracer):
+    """Переквантует разобранный файл. Возвращает (metadata, components_data) или None при ошибке."""
+    try:
+        q_new = {
+            'Y': adjust_quantization_matrix.adjust_quantization_matrix(BASE_Q_LUMINANCE, quality),
+            'C': adjust_quantization_matrix.adjust_quantization_matrix(BASE_Q_CHROMINANCE, quality),
+        }
+    except (TypeError, ValueError) as e:
+        tracer.error(f"Некорректное качество {quality}: {e}", exception=e)
+        return None
+    block_size = metadata['block_size']
+    if q_new['Y'].shape != (block_size, block_size):
+        tracer.error(f"Переквантование поддерживает только блоки {q_new['Y'].shape[0]}x{q_new['Y'].shape[0]}, "
+                     f"в файле {block_size}x{block_size}.")
+        return None
+    source_quality = metadata.get('quality')
+    if source_quality is not None and quality > source_quality:
+        tracer.warning(f"Качество {quality} выше исходного {source_quality}: "
+                       f"потерянные при исходном квантовании детали не восстанавливаются.")
+
+    coefficients = decode_coefficients(metadata, y_data, cb_data, cr_data, tracer=tracer)
+    if coefficients is None:
+        return None
+
+    try:
+        tables = read_tables(metadata)
+        with tracer.stage('requantize'):
+            for name in coefficients:
+                q_matrix = q_new['Y'] if name == 'Y' else q_new['C']
+                coefficients[name] = requantize(coefficients[name], tables[name][0], q_matrix)
+        metadata = dict(metadata, quality=quality, q_table_y=q_new['Y'].tolist(), q_table_c=q_new['C'].tolist())
+        return encode_coefficients(metadata, coefficients, tracer=tracer)
+    except Exception as e:
+        tracer.error(f"Ошибка при переквантовании: {e}", exception=e)
+        return None
+
+
+def _block_grids(metadata, coefficients):
+    """Блоки компонентов в естественном порядке в виде сеток (строки блоков, столбцы блоков, N, N)."""
+    block_size = metadata['block_size']
+    grids = {}
+    for name, zigzag_coeffs in coefficients.items():
+        h_pad, w_pad = metadata[f'padded_dims_{name.lower()}']
+        rows, cols = h_pad // block_size, w_pad // block_size
+        if len(zigzag_coeffs) != rows * cols:
+            raise ValueError(f"Компонент {name} содержит {len(zigzag_coeffs)} блоков вместо {rows * cols} "
+                             f"(файл поврежден или обрезан).")
+        grids[name] = coefficient_store.to_blocks(zigzag_coeffs, block_size).reshape(rows, cols, block_size, block_size)
+    if 'Cb' in grids:
+        # сетка Y ровно вдвое больше сетки Cb/Cr: нулевые блоки (серый цвет) справа и снизу
+        rows, cols = (2 * size for size in grids['Cb'].shape[:2])
+        y_grid = grids['Y']
+        if y_grid.shape[:2] != (rows, cols):
+            padded = np.zeros((rows, cols) + y_grid.shape[2:], dtype=y_grid.dtype)
+            padded[:y_grid.shape[0], :y_grid.shape[1]] = y_grid
+            grids['Y'] = padded
+    return grids
+
+
+def _apply_step(grids, step, geometry, block_size):
+    """Применяет к сеткам блоков одно элементарное преобразование и пересчитывает видимую область."""
+    offset_x, offset_y, width, height = geometry
+    canvas_h, canvas_w = (size * block_size for size in grids['Y'].shape[:2])
+    signs = 1 - 2 * (np.arange(block_size) % 2)
+    for name, grid in grids.items():
+        if step == 'flip_h':
+            grids[name] = grid[:, ::-1] * signs
+        elif step == 'flip_v':
+            grids[name] = grid[::-1, :] * signs[:, np.newaxis]
+        else:
+            grids[name] = grid.transpose(1, 0, 3, 2)
+    if step == 'flip_h':
+        return canvas_w - offset_x - width, offset_y, width, height
+    if step == 'flip_v':
+        return offset_x, canvas_h - offset_y - height, width, height
+    return offset_y, offset_x, height, width
+
+
+def _crop_grids(grids, geometry, block_size):
+    """
+    Оставляет блоки, покрывающие видимую область: начало выравнивается по MCU, лишние
+    блоки справа и снизу отбрасываются. Возвращает новую видимую область.
+    """
+    offset_x, offset_y, width, height = geometry
+    scale = 2 if 'Cb' in grids else 1
+    mcu = block_size * scale
+    first_y, first_x = offset_y // mcu, offset_x // mcu
+    offset_x -= first_x * mcu
+    offset_y -= first_y * mcu
+    for name, grid in grids.items():
+        factor = scale if name == 'Y' else 1
+        step = block_size * (1 if name == 'Y' else 2)
+        rows = math.ceil((offset_y + height) / step)
+        cols = math.ceil((offset_x + width) / step)
+        grids[name] = grid[first_y * factor:first_y * factor + rows, first_x * factor:first_x * factor + cols]
+    return offset_x, offset_y, width, height
+
+
+def _transform(metadata, y_data, cb_data, cr_data, op, crop, tracer):
+    """Преобразует разобранный файл. Возвращает (metadata, components_data) или None при ошибке."""
+    if op not in _TRANSFORM_STEPS:
+        tracer.error(f"Неизвестное преобразование {op!r}. Доступны: {', '.join(TRANSFORMS)}")
+        return None
+    geometry = (metadata.get('offset_x', 0), metadata.get('offset_y', 0),
+                metadata['original_width'], metadata['original_height'])
+    if op == 'crop':
+        try:
+            x, y, width, height = (int(v) for v in crop)
+        except (TypeError, ValueError) as e:
+            tracer.error(f"Область обрезки задается как (x, y, ширина, высота), получено {crop!r}", exception=e)
+            return None
+        if x < 0 or y < 0 or width <= 0 or height <= 0 or x + width > geometry[2] or y + height > geometry[3]:
+            tracer.error(f"Область обрезки {crop!r} выходит за изображение {geometry[2]}x{geometry[3]}.")
+            return None
+        geometry = (geometry[0] + x, geometry[1] + y, width, height)
+
+    coefficients = decode_coefficients(metadata, y_data, cb_data, cr_data, tracer=tracer)
+    if coefficients is None:
+        return None
+
+    try:
+        block_size = metadata['block_size']
+        with tracer.stage('transform', op=op):
+            grids = _block_grids(metadata, coefficients)
+            for step in _TRANSFORM_STEPS[op]:
+                geometry = _apply_step(grids, step, geometry, block_size)
+            geometry = _crop_grids(grids, geometry, block_size)
+            coefficients = {name: np.ascontiguousarray(coefficient_store.from_blocks(
+                grid.reshape((-1,) + grid.shape[2:])), dtype=coefficient_store.COEFF_DTYPE)
+                for name, grid in grids.items()}
+
+        offset_x, offset_y, width, height = geometry
+        metadata = dict(metadata, original_width=width, original_height=height)
+        if _TRANSFORM_STEPS[op].count('transpose') % 2:
+            # Матрицы квантования несимметричны: коэффициент (u, v) после транспонирования
+            # стоит на месте (v, u) и должен деквантоваться транспонированной матрицей.
+            for key in ('q_table_y', 'q_table_c'):
+                metadata[key] = np.array(metadata[key]).T.tolist()
+        for name, grid in grids.items():
+            metadata[f'padded_dims_{name.lower()}'] = [grid.shape[0] * block_size, grid.shape[1] * block_size]
+        for key, value in (('offset_x', offset_x), ('offset_y', offset_y)):
+            if value:
+                metadata[key] = value
+            else:
+                metadata.pop(key, None)
+        return encode_coefficients(metadata, coefficients, tracer=tracer)
+    except Exception as e:
+        tracer.error(f"Ошибка при преобразовании {op}: {e}", exception=e)
+        return None
+
+
+def _write_result(encoded, fileobj, tracer):
+    metadata, components_data = encoded
+    with tracer.stage('save'):
+        return write_compressed_data(fileobj, metadata, components_data['Y'], components_data['Cb'],
+                                     components_data['Cr'], tracer=tracer)
+
+
+def transcode(src, dst, quality=75, tracer=None):
+    """
+    Понижает качество сжатого файла без декодирования в пиксели: коэффициенты
+    энтропийно декодируются, деквантуются сохраненными матрицами q_table_y/q_table_c,
+    квантуются матрицами нового качества и снова кодируются (тем же кодером и в том же
+    режиме). В отличие от decompress_image + compress_image, ошибки IDCT, апсэмплинга,
+    цветового преобразования и округления пикселей не накапливаются.
+
+    Аргументы:
+        src (str): Путь к исходному файлу MYJPEG.
+        dst (str): Путь к результату.
+        quality (int): Новое качество от 1 до 100 (повышение качества не восстанавливает деталей).
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+
+    Возвращает:
+        int: Количество записанных байт или None при ошибке.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    with tracer.stage('transcode', path=src, quality=quality):
+        with tracer.stage('load'):
+            metadata, y_data, cb_data, cr_data = load_compressed_data(src, tracer=tracer)
+        if metadata is None:
+            return None
+        encoded = _transcode(metadata, y_data, cb_data, cr_data, quality, tracer)
+        if encoded is None:
+            return None
+        try:
+            with open(dst, 'wb') as f:
+                return _write_result(encoded, f, tracer)
+        except IOError as e:
+            tracer.error(f"Ошибка записи файла {dst}: {e}", exception=e)
+            return None
+
+
+def transcode_bytes(data, quality=75, tracer=None):
+    """
+    То же, что transcode, для сжатых данных в памяти.
+
+    Возвращает:
+        bytes: Новый файл MYJPEG или None при ошибке.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    with tracer.stage('transcode', quality=quality):
+        with tracer.stage('load'):
+            metadata, y_data, cb_data, cr_data = parse_compressed_data(data, tracer=tracer)
+        if metadata is None:
+            return None
+        encoded = _transcode(metadata, y_data, cb_data, cr_data, quality, tracer)
+        if encoded is None:
+            return None
+        buffer = io.BytesIO()
+        _write_result(encoded, buffer, tracer)
+        return buffer.getvalue()
+
+
+def transform(src, dst, op, crop=None, tracer=None):
+    """
+    Поворачивает, отражает или обрезает сжатый файл без потерь: переставляются блоки
+    и меняются знаки и порядок квантованных коэффициентов, затем заново выполняются
+    только DPCM для DC и энтропийное кодирование (тем же кодером и в том же режиме).
+    Результат декодируется в точности в преобразованное изображение исходного файла.
+
+    Аргументы:
+        src (str): Путь к исходному файлу MYJPEG.
+        dst (str): Путь к результату.
+        op (str): 'rotate90' (по часовой стрелке), 'rotate180', 'rotate270', 'flip_h', 'flip_v',
+                  'transpose' или 'crop'.
+        crop (tuple, optional): Для 'crop' - (x, y, ширина, высота) в пикселях изображения.
+            Хранятся целые MCU, покрывающие область, видимая область задается смещением.
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+
+    Возвращает:
+        int: Количество записанных байт или None при ошибке.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    with tracer.stage('transform_file', path=src, op=op):
+        with tracer.stage('load'):
+            metadata, y_data, cb_data, cr_data = load_compressed_data(src, tracer=tracer)
+        if metadata is None:
+            return None
+        encoded = _transform(metadata, y_data, cb_data, cr_data, op, crop, tracer)
+        if encoded is None:
+            return None
+        try:
+            with open(dst, 'wb') as f:
+                return _write_result(encoded, f, tracer)
+        except IOError as e:
+            tracer.error(f"Ошибка записи файла {dst}: {e}", exception=e)
+            return None
+
+
+def transform_bytes(data, op, crop=None, tracer=None):
+    """
+    То же, что transform, для сжатых данных в памяти.
+
+    Возвращает:
+        bytes: Новый файл MYJPEG или None при ошибке.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    with tracer.stage('transform_file', op=op):
+        with tracer.stage('load'):
+            metadata, y_data, cb_data, cr_data = parse_compressed_data(data, tracer=tracer)
+        if metadata is None:
+            return None
+        encoded = _transform(metadata, y_data, cb_data, cr_data, op, crop, tracer)
+        if encoded is None:
+            return None
+        buffer = io.BytesIO()
+        _write_result(encoded, buffer, tracer)
+        return buffer.getvalue()
+
+
+@functools.lru_cache(maxsize=None)
+def _downscale_operators(block_size):
+    """
+    Операторы P_0, P_1 (N x N) уменьшения вдвое вдоль одной оси в области коэффициентов:
+    для сетки блоков C[a, b] (a, b - половины) блок результата равен sum P_a C[a, b] P_b^T.
+    P_i = d A_i d^-1, где d - одномерное DCT в нормировке dct_2d, A_i - усреднение пар
+    отсчетов блока i в половину i блока результата.
+    """
+    n = np.arange(block_size)
+    d = 0.5 * np.cos((2 * n[np.newaxis, :] + 1) * n[:, np.newaxis] * np.pi / (2 * block_size))
+    d[0] /= np.sqrt(2.0)
+    inverse = np.linalg.inv(d)
+    half = block_size // 2
+    operators = np.zeros((2, block_size, block_size))
+    for part in range(2):
+        averaging = np.zeros((block_size, block_size))
+        rows = part * half + np.arange(half)
+        averaging[rows, 2 * np.arange(half)] = 0.5
+        averaging[rows, 2 * np.arange(half) + 1] = 0.5
+        operators[part] = d @ averaging @ inverse
+    operators.flags.writeable = False
+    return operators
+
+
+def _downscale_grid(grid, q_matrix):
+    """Уменьшает вдвое сетку квантованных блоков (rows, cols, N, N) одного компонента."""
+    rows, cols, block_size = grid.shape[0], grid.shape[1], grid.shape[2]
+    even = np.zeros((rows + rows % 2, cols + cols % 2, block_size, block_size))
+    even[:rows, :cols] = grid * q_matrix.astype(np.float64)
+    pairs = even.reshape(even.shape[0] // 2, 2, even.shape[1] // 2, 2, block_size, block_size)
+    operators = _downscale_operators(block_size)
+    coeffs = np.einsum('aik,racbkl,bml->rcim', operators, pairs, operators, optimize=True)
+    levels = np.round(coeffs / q_matrix.astype(np.float64))
+    limits = np.iinfo(coefficient_store.COEFF_DTYPE)
+    return np.clip(levels, limits.min, limits.max).astype(coefficient_store.COEFF_DTYPE)
+
+
+def _pyramid_levels(metadata, y_data, cb_data, cr_data, levels, tracer):
+    """
+    Строит уровни 1..levels из разобранного файла. Возвращает список пар
+    (metadata, components_data) или None при ошибке.
+    """
+    coefficients = decode_coefficients(metadata, y_data, cb_data, cr_data, tracer=tracer)
+    if coefficients is None:
+        return None
+    try:
+        block_size = metadata['block_size']
+        tables = read_tables(metadata)
+        grids = _block_grids(metadata, coefficients)
+        offset_x, offset_y = metadata.get('offset_x', 0), metadata.get('offset_y', 0)
+        width, height = metadata['original_width'], metadata['original_height']
+        results = []
+        for level in range(1, levels + 1):
+            if width == 1 and height == 1:
+                break
+            with tracer.stage('pyramid_level', level=level):
+                grids = {name: _downscale_grid(grid, tables[name][0]) for name, grid in grids.items()}
+                width = math.ceil((offset_x + width) / 2) - offset_x // 2
+                height = math.ceil((offset_y + height) / 2) - offset_y // 2
+                offset_x, offset_y = offset_x // 2, offset_y // 2
+                level_metadata = dict(metadata, original_width=width, original_height=height)
+                for name, grid in grids.items():
+                    level_metadata[f'padded_dims_{name.lower()}'] = [grid.shape[0] * block_size,
+                                                                     grid.shape[1] * block_size]
+                for key, value in (('offset_x', offset_x), ('offset_y', offset_y)):
+                    if value:
+                        level_metadata[key] = value
+                    else:
+                        level_metadata.pop(key, None)
+                level_coefficients = {name: coefficient_store.from_blocks(grid.reshape((-1,) + grid.shape[2:]))
+                                      for name, grid in grids.items()}
+                results.append(encode_coefficients(level_metadata, level_coefficients, tracer=tracer))
+        return results
+    except Exception as e:
+        tracer.error(f"Ошибка при построении пирамиды: {e}", exception=e)
+        return None
+
+
+def build_pyramid(src, dst, levels=3, tracer=None):
+    """
+    Строит пирамиду уменьшенных копий сжатого файла (1/2, 1/4, ... по каждой стороне)
+    без декодирования в пиксели: каждый уровень получается из коэффициентов предыдущего
+    (см. _downscale_operators) и кодируется с таблицами, кодером и режимом исходного файла.
+    Результат - архив MYJPAR (image_archive.ImageArchive) с записями "level_0" (исходный
+    файл без изменений), "level_1", ...; индекс архива хранит смещение, длину и размеры
+    каждого уровня. Построение останавливается на изображении 1x1.
+
+    Аргументы:
+        src (str): Путь к исходному файлу MYJPEG.
+        dst (str): Путь к создаваемому архиву.
+        levels (int): Количество уменьшенных уровней.
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+
+    Возвращает:
+        list[tuple[int, int]]: Размеры (ширина, высота) уровней, начиная с level_0, или None при ошибке.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    with tracer.stage('pyramid', path=src, levels=levels):
+        try:
+            with open(src, 'rb') as f:
+                data = f.read()
+        except IOError as e:
+            tracer.error(f"Ошибка чтения файла {src}: {e}", exception=e)
+            return None
+        with tracer.stage('load'):
+            metadata, y_data, cb_data, cr_data = parse_compressed_data(data, tracer=tracer)
+        if metadata is None:
+            return None
+        results = _pyramid_levels(metadata, y_data, cb_data, cr_data, levels, tracer)
+        if results is None:
+            return None
+
+        sizes = [(metadata['original_width'], metadata['original_height'])]
+        try:
+            with tracer.stage('save'):
+                with ArchiveWriter(dst) as writer:
+                    writer.add(PYRAMID_LEVEL_NAME.format(0), data)
+                    for level, encoded in enumerate(results, start=1):
+                        buffer = io.BytesIO()
+                        _write_result(encoded, buffer, tracer)
+                        writer.add(PYRAMID_LEVEL_NAME.format(level), buffer.getvalue())
+                        sizes.append((encoded[0]['original_width'], encoded[0]['original_height']))
+        except (IOError, ValueError) as e:
+            tracer.error(f"Ошибка записи пирамиды {dst}: {e}", exception=e)
+            return None
+        return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Операции над сжатыми файлами MYJPEG без декодирования в пиксели.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    transcode_parser = commands.add_parser("transcode", help="Понизить качество переквантованием коэффициентов.")
+    transcode_parser.add_argument("src")
+    transcode_parser.add_argument("dst")
+    transcode_parser.add_argument("-q", "--quality", type=int, required=True)
+    transform_parser = commands.add_parser("transform", help="Повернуть, отразить или обрезать без потерь.")
+    transform_parser.add_argument("src")
+    transform_parser.add_argument("dst")
+    transform_parser.add_argument("op", choices=TRANSFORMS)
+    transform_parser.add_argument("--crop", type=int, nargs=4, metavar=("X", "Y", "W", "H"),
+                                  help="Область для op=crop.")
+    pyramid_parser = commands.add_parser("pyramid", help="Построить архив уменьшенных вдвое уровней.")
+    pyramid_parser.add_argument("src")
+    pyramid_parser.add_argument("dst")
+    pyramid_parser.add_argument("-l", "--levels", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    error_collector = instrumentation.ErrorCollector()
+    if args.command == "pyramid":
+        sizes = build_pyramid(args.src, args.dst, levels=args.levels, tracer=error_collector)
+        if sizes is None:
+            for message in error_collector.errors:
+                print(message, file=sys.stderr)
+            return 1
+        for level, (width, height) in enumerate(sizes):
+            print(f"{PYRAMID_LEVEL_NAME.format(level)}: {width}x{height}")
+        return 0
+    if args.command == "transcode":
+        written = transcode(args.src, args.dst, quality=args.quality, tracer=error_collector)
+    else:
+        written = transform(args.src, args.dst, args.op, crop=args.crop, tracer=error_collector)
+    if written is None:
+        for message in error_collector.errors:
+            print(message, file=sys.stderr)
+        return 1
+    print(f"{args.dst}: {written} байт")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
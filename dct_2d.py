@@ -1,3 +1,5 @@
+import functools
+
 import numpy as np
 
 
@@ -9,19 +11,31 @@ def _get_C_factor(k_val):
         return 1.0
 
 
+@functools.lru_cache(maxsize=None)
 def _create_dct_1d_transform_matrix(N_val):
     """
     Создает матрицу 1D DCT-II T размером N x N.
     T_kn = cos((2*n + 1) * k * pi / (2*N))
     где k - индекс частоты (строка), n - пространственный индекс (столбец).
+    Матрица вычисляется один раз для каждого N и далее берется из кэша (только для чтения).
     """
     T = np.zeros((N_val, N_val), dtype=np.float64)
     for k_idx in range(N_val):
         for n_idx in range(N_val):
             T[k_idx, n_idx] = np.cos((2 * n_idx + 1) * k_idx * np.pi / (2 * N_val))
+    T.flags.writeable = False
     return T
 
 
+@functools.lru_cache(maxsize=None)
+def _create_scaling_matrix(N_val):
+    """Создает (и кэширует) матрицу множителей C(v)C(u) размером N x N."""
+    C_array = np.array([_get_C_factor(k_idx) for k_idx in range(N_val)], dtype=np.float64)
+    C_vu_matrix = C_array.reshape(N_val, 1) * C_array.reshape(1, N_val)
+    C_vu_matrix.flags.writeable = False
+    return C_vu_matrix
+
+
 def dct_2d_transform(input_block):
     """
     Выполняет прямое 2D DCT-II для блока NxN, используя матричные операции.
@@ -45,11 +59,7 @@ def dct_2d_transform(input_block):
     T_matrix = _create_dct_1d_transform_matrix(N)
     dct_intermediate = T_matrix @ input_block_float @ T_matrix.T
 
-    C_array = np.array([_get_C_factor(k_idx) for k_idx in range(N)], dtype=np.float64)
-    Cv_factor_col_vec = C_array.reshape(N, 1)
-    Cu_factor_row_vec = C_array.reshape(1, N)
-
-    C_vu_matrix = Cv_factor_col_vec * Cu_factor_row_vec
+    C_vu_matrix = _create_scaling_matrix(N)
     dct_coeffs = (1.0/4.0) * C_vu_matrix * dct_intermediate
     return dct_coeffs
 
@@ -59,6 +69,8 @@ def idct_2d_transform(dct_coeffs):
     Выполняет обратное 2D DCT-II для блока NxN, используя матричные операции.
     Формула из ITU-T T.81 (A.3.3): s_xy = (1/4) * sum_u sum_v C(u)C(v)S_vu cos_xu cos_yv
     В матричной форме: RECON_BLOCK = (1/4) * (T.T @ (C_v_col @ C_u_row * DCT_COEFFS) @ T)
+    Множитель 1/4 верен для N = 8; прямое преобразование dct_2d_transform для других N
+    отличается от ортонормированного множителем N/8, поэтому в общем случае он равен 16/N^2.
 
     Аргументы:
         dct_coeffs (np.ndarray): Входной блок NxN коэффициентов DCT.
@@ -72,14 +84,54 @@ def idct_2d_transform(dct_coeffs):
 
     T_matrix = _create_dct_1d_transform_matrix(N)
 
-    C_array = np.array([_get_C_factor(k_idx) for k_idx in range(N)], dtype=np.float64)
-    Cv_factor_col_vec = C_array.reshape(N, 1)
-    Cu_factor_row_vec = C_array.reshape(1, N)
-
-    C_vu_matrix = Cv_factor_col_vec * Cu_factor_row_vec
+    C_vu_matrix = _create_scaling_matrix(N)
     S_prime = C_vu_matrix * dct_coeffs
 
     rec_intermediate = T_matrix.T @ S_prime @ T_matrix
-    rec_block = (1.0/4.0) * rec_intermediate
+    rec_block = (16.0 / (N * N)) * rec_intermediate
+
+    return rec_block
+
+
+def dct_2d_blocks(blocks):
+    """
+    Прямое 2D DCT-II для стопки блоков (n, N, N) теми же матричными операциями,
+    что и dct_2d_transform.
+
+    Аргументы:
+        blocks (np.ndarray): Блоки (n, N, N), уже сдвинутые по уровню (float64).
+
+    Возвращает:
+        np.ndarray: Блоки (n, N, N) коэффициентов DCT.
+    """
+    N = blocks.shape[-1]
+    if blocks.shape[-2] != N:
+        raise ValueError("Блоки должны быть квадратными.")
+    T_matrix = _create_dct_1d_transform_matrix(N)
+    dct_blocks = T_matrix @ blocks @ T_matrix.T
+    dct_blocks *= (1.0/4.0) * _create_scaling_matrix(N)
+    return dct_blocks
+
+
+def idct_2d_blocks(dct_blocks):
+    """
+    Обратное 2D DCT-II для стопки блоков (n, N, N) теми же матричными операциями,
+    что и idct_2d_transform; результат для каждого блока совпадает с ним побитно.
+
+    Аргументы:
+        dct_blocks (np.ndarray): Блоки коэффициентов DCT (n, N, N), float64.
 
-    return rec_block
\ No newline at end of file
+    Возвращает:
+        np.ndarray: Блоки (n, N, N) восстановленных значений (с уровнем сдвига).
+    """
+    N = dct_blocks.shape[-1]
+    if dct_blocks.shape[-2] != N:
+        raise ValueError("Блоки коэффициентов DCT должны быть квадратными.")
+
+    T_matrix = _create_dct_1d_transform_matrix(N)
+    C_vu_matrix = _create_scaling_matrix(N)
+    S_prime = C_vu_matrix * dct_blocks
+
+    rec_intermediate = T_matrix.T @ S_prime @ T_matrix
+    rec_intermediate *= 16.0 / (N * N)
+    return rec_intermediate
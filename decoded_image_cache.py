@@ -0,0 +1,84 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+
+def source_key(source):
+    """
+    Строит ключ кэша для источника сжатого изображения.
+
+    Аргументы:
+        source (str | os.PathLike | bytes | bytearray | memoryview): Путь к файлу или его содержимое.
+
+    Возвращает:
+        tuple: Для пути - ('path', абсолютный путь, mtime_ns, размер);
+               для данных в памяти - ('sha256', хеш содержимого).
+    """
+    if isinstance(source, (str, os.PathLike)):
+        path = os.path.realpath(source)
+        st = os.stat(path)
+        return ('path', path, st.st_mtime_ns, st.st_size)
+    return ('sha256', hashlib.sha256(source).hexdigest())
+
+
+class DecodedImageCache:
+    """
+    LRU кэш декодированных изображений, ограниченный суммарным размером массивов в байтах
+    (и, опционально, количеством записей). Массивы в кэше доступны только для чтения,
+    поэтому повторные обращения возвращают один и тот же объект без копирования.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_entries=None):
+        """
+        Аргументы:
+            max_bytes (int): Предельный суммарный размер хранимых массивов (nbytes).
+            max_entries (int, optional): Предельное количество записей.
+        """
+        if max_bytes <= 0:
+            raise ValueError("Размер кэша должен быть положительным.")
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Возвращает массив по ключу (помечая его как недавно использованный) или None."""
+        array = self._entries.get(key)
+        if array is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return array
+
+    def put(self, key, array):
+        """
+        Помещает массив в кэш, вытесняя давно не использованные записи.
+        Массивы крупнее max_bytes не кэшируются.
+        """
+        if array.nbytes > self.max_bytes:
+            return
+        array.flags.writeable = False
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= old.nbytes
+        self._entries[key] = array
+        self.current_bytes += array.nbytes
+        while self.current_bytes > self.max_bytes or (
+                self.max_entries is not None and len(self._entries) > self.max_entries):
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+
+    def clear(self):
+        """Очищает кэш и сбрасывает счетчики."""
+        self._entries.clear()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
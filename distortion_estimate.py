@@ -0,0 +1,158 @@
+import math
+
+import numpy as np
+
+import image_metrics
+import rgb_to_ycbcr
+import downsample_channel
+
+
+# Строки матрицы обратного преобразования YCbCr -> RGB (см. rgb_to_ycbcr.ycbcr_to_rgb):
+# веса, с которыми ошибки компонентов Y, Cb, Cr попадают в каналы R, G, B.
+_YCBCR_TO_RGB = np.array([
+    [1.0, 0.0, 1.402],
+    [1.0, -0.344136, -0.714136],
+    [1.0, 1.772, 0.0],
+])
+
+
+def rounded_noise_mse(variance):
+    """
+    Среднеквадратичная ошибка после округления до целого значения x + n,
+    где x - целое, n ~ N(0, variance): E[round(n)^2].
+    Для малых ошибок округление "съедает" шум, для больших результат стремится к variance + 1/12.
+    """
+    if variance <= 0:
+        return 0.0
+    sigma = math.sqrt(variance)
+    total = 0.0
+    k = 1
+    while True:
+        upper = 0.5 * math.erfc((k - 0.5) / (sigma * math.sqrt(2.0)))
+        if upper < 1e-12:
+            break
+        lower = 0.5 * math.erfc((k + 0.5) / (sigma * math.sqrt(2.0)))
+        total += 2.0 * k * k * (upper - lower)
+        k += 1
+    return total
+
+
+class DistortionEstimator:
+    """
+    Оценка искажений сжатия без декодирования.
+
+    Дискретное косинусное преобразование dct_2d для блока N x N отличается от ортонормированного
+    множителем N/8 (для N = 8 оно ортонормировано), поэтому по равенству Парсеваля сумма квадратов
+    ошибок в блоке пикселей равна (8/N)^2 * сумма квадратов разностей между коэффициентами DCT
+    и их деквантованными значениями. Кодер передает эти суммы через add_quantization_error.
+
+    Отдельно учитываются:
+        - округление восстановленных пикселей декодером (rounded_noise_mse);
+        - потери даунсэмплинга Cb/Cr 4:2:0 (сравнение с апсэмплингом ближайшего соседа, как в декодере);
+        - потери преобразования RGB -> YCbCr -> RGB с целочисленными плоскостями.
+
+    Итоговая ошибка в RGB - это измеренные потери цвета и даунсэмплинга плюс ошибки квантования
+    компонентов, пересчитанные через матрицу YCbCr -> RGB в предположении их независимости.
+
+    Ограничение значений [0, 255] декодером не моделируется, а ошибка в пикселях дополнения
+    до целых блоков учитывается наравне с остальными. Кроме того, ошибки квантования Y, Cb и Cr
+    на деле коррелированы (перепады яркости и цветности совпадают и частично компенсируют
+    друг друга в каналах G и B), поэтому оценка RGB, как правило, консервативна (PSNR занижен).
+
+    Для изображения в оттенках серого (один компонент Y) потерь цвета и даунсэмплинга нет,
+    и итоговая ошибка равна ошибке компонента Y.
+    Допуск (измерен на фрагментах data/Lenna.png от 64x64 до 512x512, качество 1..100,
+    с rdo и без него - допуск одинаков): оценка PSNR компонентов и изображений в оттенках серого
+    отличается от PSNR реального декодирования не более чем на 0.5 дБ. Оценка PSNR RGB цветного
+    изображения занижена в среднем на 0.25 дБ, в 95% случаев - не более чем на 0.6 дБ; наихудшие
+    отклонения - до 0.9 дБ при качестве 10..90 и до 1.8 дБ при качестве 1 на фрагментах 64x64,
+    завышение - не более 0.4 дБ. Для размеров, не кратных 16 (с дополнением до целых блоков),
+    отклонения больше: до 1.7 дБ для цветных и до 0.9 дБ для серых изображений от 64x64,
+    до 3.4 дБ в обе стороны для изображений меньше 64x64.
+    """
+    def __init__(self):
+        self._quant = {}
+        self._subsampling = {}
+        self.colour_mse = 0.0
+        self.colour_subsampling_mse = 0.0
+        self.grayscale = False
+
+    def add_quantization_error(self, component, squared_error_sum, num_samples):
+        """
+        Добавляет сумму квадратов ошибок квантования компонента, приведенную к пиксельной области.
+
+        Аргументы:
+            component (str): Имя компонента ('Y', 'Cb', 'Cr').
+            squared_error_sum (float): Сумма квадратов ошибок (в масштабе пикселей).
+            num_samples (int): Количество отсчетов (пикселей), к которым относится ошибка.
+        """
+        sse, count = self._quant.get(component, (0.0, 0))
+        self._quant[component] = (sse + squared_error_sum, count + num_samples)
+
+    def measure_colour_and_subsampling(self, rgb_image, ycbcr_image, cb_downsampled, cr_downsampled):
+        """
+        Измеряет потери, не зависящие от квантования: цветовое преобразование RGB -> YCbCr -> RGB
+        с целочисленными плоскостями и даунсэмплинг Cb/Cr 4:2:0 (с апсэмплингом ближайшего
+        соседа, как в декодере). Потери измеряются совместно, так как они не независимы.
+        """
+        height, width = ycbcr_image.shape[:2]
+        restored = ycbcr_image.copy()
+        for index, name, downsampled in ((1, 'Cb', cb_downsampled), (2, 'Cr', cr_downsampled)):
+            if downsampled.size == 0:
+                restored[:, :, index] = 128
+            else:
+                restored[:, :, index] = downsample_channel.upsample_channel_nearest_neighbor(downsampled, height, width)
+            self._subsampling[name] = image_metrics.mse(ycbcr_image[:, :, index], restored[:, :, index])
+        self.colour_mse = image_metrics.mse(rgb_image, rgb_to_ycbcr.ycbcr_to_rgb(ycbcr_image))
+        self.colour_subsampling_mse = image_metrics.mse(rgb_image, rgb_to_ycbcr.ycbcr_to_rgb(restored))
+
+    def measure_grayscale(self):
+        """Отмечает, что изображение сжимается одним компонентом Y без цветового преобразования."""
+        self.grayscale = True
+        self._subsampling.clear()
+        self.colour_mse = 0.0
+        self.colour_subsampling_mse = 0.0
+
+    def _rounded_quantization_mse(self, component):
+        sse, count = self._quant.get(component, (0.0, 0))
+        return rounded_noise_mse(sse / count) if count else 0.0
+
+    def component_mse(self, component):
+        """Оценка MSE восстановленной плоскости компонента в полном разрешении."""
+        return self._rounded_quantization_mse(component) + self._subsampling.get(component, 0.0)
+
+    def report(self):
+        """
+        Возвращает:
+            dict: {
+                'components': {имя: {'mse_quantization', 'mse_subsampling', 'mse', 'psnr'}},
+                'mse_colour': ошибка одного цветового преобразования (без сжатия),
+                'mse_colour_subsampling': ошибка цветового преобразования и даунсэмплинга (без квантования),
+                'mse': оценка MSE итогового RGB изображения (или плоскости Y для оттенков серого),
+                'psnr': оценка PSNR итогового изображения (дБ)
+            }
+        """
+        components = {}
+        quant_variances = []
+        for name in (('Y',) if self.grayscale else ('Y', 'Cb', 'Cr')):
+            sse, count = self._quant.get(name, (0.0, 0))
+            comp_mse = self.component_mse(name)
+            quant_variances.append(self._rounded_quantization_mse(name))
+            components[name] = {
+                'mse_quantization': sse / count if count else 0.0,
+                'mse_subsampling': self._subsampling.get(name, 0.0),
+                'mse': comp_mse,
+                'psnr': image_metrics.psnr_from_mse(comp_mse),
+            }
+        if self.grayscale:
+            rgb_mse = components['Y']['mse']
+        else:
+            quant_rgb_mse = float(np.mean((_YCBCR_TO_RGB ** 2) @ np.array(quant_variances)))
+            rgb_mse = self.colour_subsampling_mse + quant_rgb_mse
+        return {
+            'components': components,
+            'mse_colour': self.colour_mse,
+            'mse_colour_subsampling': self.colour_subsampling_mse,
+            'mse': rgb_mse,
+            'psnr': image_metrics.psnr_from_mse(rgb_mse),
+        }
@@ -0,0 +1,115 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+import huffman_coding
+import entropy_coding
+from jpeg_compressor import compress_array
+from jpeg_decompressor import parse_compressed_data
+
+
+def quantized_components(image, quality=75):
+    """
+    Квантованные коэффициенты компонентов изображения и их таблицы Хаффмана.
+
+    Возвращает:
+        list[tuple]: [(имя, коэффициенты (n, 64) в зигзаг-порядке, dc_table, ac_table), ...]
+    """
+    metadata, y_data, cb_data, cr_data = parse_compressed_data(compress_array(image, quality=quality))
+    tables = {}
+    for suffix in ('y', 'c'):
+        tables[suffix] = tuple(
+            huffman_coding.HuffmanTable(metadata[f'huff_{kind}_{suffix}_bits'], metadata[f'huff_{kind}_{suffix}_huffval'])
+            for kind in ('dc', 'ac'))
+    huffman = entropy_coding.HuffmanBackend()
+    components = []
+    for name, data, suffix in (('Y', y_data, 'y'), ('Cb', cb_data, 'c'), ('Cr', cr_data, 'c')):
+        h, w = metadata[f'padded_dims_{name.lower()}']
+        num_blocks = (h // 8) * (w // 8)
+        if num_blocks == 0:
+            continue
+        dc_table, ac_table = tables[suffix]
+        components.append((name, huffman.decode(data, num_blocks, dc_table, ac_table), dc_table, ac_table))
+    return components
+
+
+def benchmark(image, quality=75, coders=None, repeat=3):
+    """
+    Сравнивает энтропийные кодеры на одних и тех же квантованных коэффициентах.
+
+    Аргументы:
+        image (np.ndarray): RGB изображение uint8.
+        quality (int): Качество, с которым квантуются коэффициенты.
+        coders (list[str], optional): Имена кодеров (по умолчанию все из entropy_coding.BACKENDS).
+        repeat (int): Число повторов; время берется минимальное.
+
+    Возвращает:
+        dict: {имя кодера: {'bytes', 'ratio_to_huffman', 'encode_s', 'decode_s',
+                            'decode_blocks_per_s', 'decode_mb_s', 'exact'}}
+    """
+    components = quantized_components(image, quality)
+    num_blocks = sum(len(coeffs) for _, coeffs, _, _ in components)
+    report = {}
+    for name in coders or list(entropy_coding.BACKENDS):
+        backend = entropy_coding.get_backend(name)
+        encode_s = decode_s = float('inf')
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            streams = [backend.encode(coeffs, dc_table, ac_table) for _, coeffs, dc_table, ac_table in components]
+            encode_s = min(encode_s, time.perf_counter() - start)
+            start = time.perf_counter()
+            decoded = [backend.decode(stream, len(coeffs), dc_table, ac_table)
+                       for stream, (_, coeffs, dc_table, ac_table) in zip(streams, components)]
+            decode_s = min(decode_s, time.perf_counter() - start)
+        size = sum(len(stream) for stream in streams)
+        report[name] = {
+            'bytes': size,
+            'components': {component: len(stream) for (component, _, _, _), stream in zip(components, streams)},
+            'encode_s': encode_s,
+            'decode_s': decode_s,
+            'decode_blocks_per_s': num_blocks / decode_s if decode_s > 0 else 0.0,
+            'decode_mb_s': size / decode_s / 1e6 if decode_s > 0 else 0.0,
+            'exact': all(np.array_equal(out, coeffs) for out, (_, coeffs, _, _) in zip(decoded, components)),
+        }
+    baseline = report.get('huffman', {}).get('bytes')
+    for entry in report.values():
+        entry['ratio_to_huffman'] = entry['bytes'] / baseline if baseline else None
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение энтропийных кодеров на одних и тех же коэффициентах.")
+    parser.add_argument("images", nargs="+", help="Изображения для сравнения.")
+    parser.add_argument("-q", "--quality", type=int, default=75)
+    parser.add_argument("--coders", nargs="+", default=None, help="Кодеры (по умолчанию все).")
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Вывести результат в JSON.")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for path in args.images:
+        with Image.open(path) as img:
+            image = np.array(img.convert('RGB'))
+        results[path] = benchmark(image, quality=args.quality, coders=args.coders, repeat=args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=4, ensure_ascii=False))
+        return 0
+    for path, report in results.items():
+        print(f"{path} (качество {args.quality}):")
+        for name, entry in report.items():
+            ratio = entry['ratio_to_huffman']
+            print(f"  {name:8s} {entry['bytes']:9d} байт"
+                  + (f" ({(ratio - 1) * 100:+.1f}% к huffman)" if ratio is not None else "")
+                  + f", кодирование {entry['encode_s'] * 1000:.1f} мс, декодирование {entry['decode_s'] * 1000:.1f} мс"
+                  f" ({entry['decode_blocks_per_s']:.0f} блоков/с, {entry['decode_mb_s']:.2f} МБ/с)"
+                  + ("" if entry['exact'] else ", КОЭФФИЦИЕНТЫ НЕ СОВПАЛИ"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import numpy as np
+
+import instrumentation
+import huffman_coding
+import rans_coding
+
+
+# Энтропийный кодер выбирается при сжатии и записывается в метаданные ключом "entropy_coder"
+# (отсутствие ключа означает 'huffman', так файлы прежних версий читаются без изменений).
+# Кодер получает квантованные коэффициенты компонента в зигзаг-порядке с абсолютными DC
+# (хранилище coefficient_store) и отдает один поток байт; декодер восстанавливает те же
+# коэффициенты в новом хранилище. Таблицы Хаффмана
+# передаются всем кодерам, но используются только теми, кому они нужны.
+
+DEFAULT_ENTROPY_CODER = 'huffman'
+
+
+class EntropyBackend:
+    """Интерфейс энтропийного кодера коэффициентов одного компонента."""
+    name = None
+
+    def encode(self, zigzag_coeffs, dc_table, ac_table, tracer=None):
+        """
+        Аргументы:
+            zigzag_coeffs (np.ndarray): Коэффициенты (n_blocks, N*N) в зигзаг-порядке, DC - абсолютные значения.
+            dc_table, ac_table (huffman_coding.HuffmanTable): Таблицы Хаффмана компонента.
+            tracer (instrumentation.Tracer, optional): Получатель событий.
+
+        Возвращает:
+            bytes: Сжатый поток компонента.
+        """
+        raise NotImplementedError
+
+    def decode(self, data, num_blocks, dc_table, ac_table, num_coeffs=64, tracer=None, out=None):
+        """
+        Аргументы:
+            data (bytes-like): Сжатый поток компонента.
+            num_blocks (int): Ожидаемое количество блоков.
+            dc_table, ac_table (huffman_coding.HuffmanTable): Таблицы Хаффмана компонента.
+            num_coeffs (int): Количество коэффициентов в блоке.
+            tracer (instrumentation.Tracer, optional): Получатель событий.
+            out (np.ndarray, optional): Рабочий буфер (num_blocks, num_coeffs) COEFF_DTYPE, который
+                кодер может заполнить вместо выделения нового; его содержимое не важно.
+
+        Возвращает:
+            np.ndarray: Коэффициенты (n, num_coeffs) coefficient_store.COEFF_DTYPE в зигзаг-порядке
+                        с абсолютными DC.
+                        Для оборванного потока n может быть меньше num_blocks.
+        """
+        raise NotImplementedError
+
+
+class HuffmanBackend(EntropyBackend):
+    """Базовый кодер JPEG: DPCM для DC, RLE для AC, VLI и статические таблицы Хаффмана."""
+    name = 'huffman'
+
+    def encode(self, zigzag_coeffs, dc_table, ac_table, tracer=None):
+        return huffman_coding.huffman_encode_coefficients(zigzag_coeffs, dc_table, ac_table)
+
+    def decode(self, data, num_blocks, dc_table, ac_table, num_coeffs=64, tracer=None, out=None):
+        tracer = instrumentation.resolve_tracer(tracer)
+        coeffs = huffman_coding.huffman_decode_coefficients(data, dc_table, ac_table, num_blocks,
+                                                            num_coeffs=num_coeffs, out=out, tracer=tracer)
+        if len(coeffs) != num_blocks:
+            tracer.warning(f"декодировано {len(coeffs)} блоков, ожидалось {num_blocks}")
+        return coeffs
+
+
+class RansBackend(EntropyBackend):
+    """
+    Адаптивный контекстный rANS-кодер с чередующимися дорожками (см. rans_coding).
+    Таблицы Хаффмана не используются; поддерживаются только блоки 8x8.
+    """
+    name = 'rans'
+
+    def __init__(self, lanes=None):
+        self.lanes = lanes
+
+    def encode(self, zigzag_coeffs, dc_table, ac_table, tracer=None):
+        if np.shape(zigzag_coeffs)[1:] != (64,):
+            raise ValueError("Кодер rANS поддерживает только блоки 8x8.")
+        return rans_coding.encode_coefficients(zigzag_coeffs, lanes=self.lanes, tracer=tracer)
+
+    def decode(self, data, num_blocks, dc_table, ac_table, num_coeffs=64, tracer=None, out=None):
+        if num_coeffs != 64:
+            raise ValueError("Кодер rANS поддерживает только блоки 8x8.")
+        return rans_coding.decode_coefficients(data, num_blocks, tracer=tracer)
+
+
+BACKENDS = {
+    HuffmanBackend.name: HuffmanBackend,
+    RansBackend.name: RansBackend,
+}
+
+
+def get_backend(name=None):
+    """
+    Возвращает энтропийный кодер по имени из метаданных или параметров сжатия.
+
+    Аргументы:
+        name (str | EntropyBackend, optional): 'huffman' (по умолчанию), 'rans' или готовый кодер.
+
+    Возвращает:
+        EntropyBackend: Экземпляр кодера.
+    """
+    if isinstance(name, EntropyBackend):
+        return name
+    backend = BACKENDS.get(name or DEFAULT_ENTROPY_CODER)
+    if backend is None:
+        raise ValueError(f"Неизвестный энтропийный кодер: {name!r}. Доступны: {', '.join(BACKENDS)}")
+    return backend()
@@ -0,0 +1,272 @@
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+from PIL import Image
+
+import coefficient_store
+
+
+# Число категорий VLI (0..15) и символов AC (run << 4 | size).
+NUM_CATEGORIES = 16
+NUM_AC_SYMBOLS = 256
+EOB_SYMBOL = 0x00
+ZRL_SYMBOL = 0xF0
+
+CSV_COLUMNS = ["component", "metric", "key", "value"]
+
+
+def vli_categories(values):
+    """Категории VLI (число значащих бит модуля) для целочисленного массива, 0 для нуля."""
+    return np.frexp(np.abs(np.asarray(values, dtype=np.float64)))[1].astype(np.int64)
+
+
+def _code_lengths(table, size):
+    """Длины кодов таблицы Хаффмана по символам (0 для отсутствующих символов)."""
+    lengths = np.zeros(size, dtype=np.int64)
+    for symbol, (_, code_len) in table.encode_table.items():
+        if symbol < size:
+            lengths[symbol] = code_len
+    return lengths
+
+
+def _add_counts(target, key, counts):
+    """Прибавляет гистограмму counts к target[key], расширяя более короткую из них."""
+    current = target.get(key)
+    if current is None:
+        target[key] = counts.astype(np.int64)
+        return
+    if len(current) < len(counts):
+        current = np.pad(current, (0, len(counts) - len(current)))
+    current[:len(counts)] += counts
+    target[key] = current
+
+
+def _add_rates(entry):
+    """Дополняет сводку долями: нулевые блоки, блоки только с DC, биты VLI, стаффинг."""
+    blocks = entry['blocks']
+    entry['zero_block_rate'] = entry['zero_blocks'] / blocks if blocks else 0.0
+    entry['dc_only_block_rate'] = entry['dc_only_blocks'] / blocks if blocks else 0.0
+    entry['vli_share'] = entry['vli_bits'] / entry['huffman_bits'] if entry['huffman_bits'] else 0.0
+    huffman_bytes = entry['huffman_stream_bytes']
+    entry['stuffing_overhead'] = entry['stuffed_bytes'] / huffman_bytes if huffman_bytes else 0.0
+
+
+def symbol_counts(coeffs, eob=None):
+    """
+    Гистограммы символов, которые базовый кодер Хаффмана (huffman_coding.huffman_encode_coefficients)
+    записывает для хранилища коэффициентов: категории разностей DC и символы AC (run, size),
+    включая ZRL на каждые 16 нулей подряд (в том числе в хвосте блока) и EOB в конце каждого блока.
+
+    Аргументы:
+        coeffs (np.ndarray): Коэффициенты (n_blocks, N*N) в зигзаг-порядке, DC - абсолютные значения.
+        eob (np.ndarray, optional): Позиции конца блоков (coefficient_store.eob_positions).
+
+    Возвращает:
+        dict: 'dc_categories' (NUM_CATEGORIES,), 'ac_symbols' (NUM_AC_SYMBOLS,),
+              'dc_vli_bits', 'ac_vli_bits' (int) и 'eob' (позиции конца блоков).
+    """
+    coeffs = np.asarray(coeffs)
+    num_blocks, num_coeffs = coeffs.shape
+    if eob is None:
+        eob = coefficient_store.eob_positions(coeffs)
+
+    dc_categories = vli_categories(np.diff(coeffs[:, 0].astype(np.int64), prepend=0))
+
+    blocks, positions = np.nonzero(coeffs[:, 1:])
+    ac_categories = vli_categories(coeffs[:, 1:][blocks, positions])
+    previous = np.empty_like(positions)
+    previous[1:] = positions[:-1]
+    first_in_block = np.ones(len(positions), dtype=bool)
+    first_in_block[1:] = blocks[1:] != blocks[:-1]
+    previous[first_in_block] = -1
+    runs = positions - previous - 1
+    trailing_zeros = num_coeffs - np.maximum(eob, 1)
+
+    ac_symbols = np.bincount(((runs % 16) << 4) | ac_categories, minlength=NUM_AC_SYMBOLS)
+    ac_symbols[ZRL_SYMBOL] += int(np.sum(runs // 16)) + int(np.sum(trailing_zeros // 16))
+    ac_symbols[EOB_SYMBOL] += num_blocks
+    return {
+        'dc_categories': np.bincount(dc_categories, minlength=NUM_CATEGORIES),
+        'ac_symbols': ac_symbols,
+        'dc_vli_bits': int(np.sum(dc_categories)),
+        'ac_vli_bits': int(np.sum(ac_categories)),
+        'eob': eob,
+    }
+
+
+class EntropyStatistics:
+    """
+    Сборщик статистики энтропийного кодирования: кодер передает в него квантованные
+    коэффициенты каждого компонента вместе с таблицами Хаффмана и получившимся потоком
+    (см. jpeg_compressor.compress_image, аргумент entropy_stats).
+
+    По компонентам накапливаются гистограммы категорий DC, символов AC (run/size) и позиций
+    конца блока, доля нулевых блоков, биты кодов Хаффмана и дополнительные биты VLI, а для
+    потоков базового кодера Хаффмана - байты стаффинга (0x00 после каждого 0xFF) и биты
+    дополнения последнего байта. Для них биты кодов + биты VLI + дополнение + стаффинг
+    в точности равны размеру потока.
+
+    Для прогрессивного режима и кодера rANS биты Хаффмана - оценка по таблицам файла
+    для базового кодирования тех же коэффициентов; размер потока компонента записывается,
+    только если у компонента есть свой поток.
+
+    Один сборщик можно передавать в несколько вызовов: статистика суммируется
+    (например, по набору изображений для подбора таблиц).
+    """
+    def __init__(self):
+        self._components = {}
+
+    def add_component(self, component, coeffs, dc_table, ac_table, data=None, coder='huffman'):
+        """
+        Добавляет статистику компонента.
+
+        Аргументы:
+            component (str): Имя компонента ('Y', 'Cb', 'Cr').
+            coeffs (np.ndarray): Квантованные коэффициенты (n_blocks, N*N) в зигзаг-порядке.
+            dc_table, ac_table (huffman_coding.HuffmanTable): Таблицы Хаффмана компонента.
+            data (bytes-like, optional): Сжатый поток компонента, если он записан отдельно.
+            coder (str): Имя энтропийного кодера потока (см. entropy_coding).
+        """
+        counts = symbol_counts(coeffs)
+        eob = counts['eob']
+        num_coeffs = np.shape(coeffs)[1]
+        stats = self._components.setdefault(component, {
+            'blocks': 0, 'zero_blocks': 0, 'dc_only_blocks': 0,
+            'dc_code_bits': 0, 'ac_code_bits': 0, 'dc_vli_bits': 0, 'ac_vli_bits': 0,
+            'stream_bytes': 0, 'huffman_stream_bytes': 0, 'stuffed_bytes': 0, 'padding_bits': 0,
+            'histograms': {},
+        })
+        stats['blocks'] += len(eob)
+        stats['zero_blocks'] += int(np.count_nonzero(eob == 0))
+        stats['dc_only_blocks'] += int(np.count_nonzero(eob <= 1))
+        dc_bits = int(np.dot(counts['dc_categories'], _code_lengths(dc_table, NUM_CATEGORIES)))
+        ac_bits = int(np.dot(counts['ac_symbols'], _code_lengths(ac_table, NUM_AC_SYMBOLS)))
+        stats['dc_code_bits'] += dc_bits
+        stats['ac_code_bits'] += ac_bits
+        stats['dc_vli_bits'] += counts['dc_vli_bits']
+        stats['ac_vli_bits'] += counts['ac_vli_bits']
+        histograms = stats['histograms']
+        _add_counts(histograms, 'dc_categories', counts['dc_categories'])
+        _add_counts(histograms, 'ac_symbols', counts['ac_symbols'])
+        _add_counts(histograms, 'eob_positions', np.bincount(eob, minlength=num_coeffs + 1))
+
+        if data is None:
+            return
+        stats['stream_bytes'] += len(data)
+        if coder == 'huffman':
+            stuffed = bytes(data).count(b'\xff')
+            stats['huffman_stream_bytes'] += len(data)
+            stats['stuffed_bytes'] += stuffed
+            stats['padding_bits'] += (len(data) - stuffed) * 8 - (dc_bits + ac_bits + counts['dc_vli_bits']
+                                                                  + counts['ac_vli_bits'])
+
+    def components(self):
+        """Имена компонентов в порядке добавления."""
+        return list(self._components)
+
+    def report(self):
+        """
+        Возвращает:
+            dict: {
+                'components': {имя: {
+                    'blocks', 'zero_blocks', 'zero_block_rate', 'dc_only_blocks', 'dc_only_block_rate',
+                    'dc_code_bits', 'ac_code_bits', 'dc_vli_bits', 'ac_vli_bits',
+                    'code_bits', 'vli_bits', 'huffman_bits', 'vli_share',
+                    'stream_bytes', 'huffman_stream_bytes', 'stuffed_bytes', 'stuffing_overhead',
+                    'padding_bits',
+                    'dc_categories': {категория: count}, 'ac_symbols': {'run/size': count},
+                    'eob_positions': {позиция: count}}},
+                'totals': суммы скалярных полей по компонентам
+            }
+            Гистограммы содержат только ненулевые элементы; stuffing_overhead - доля байтов
+            стаффинга в потоках базового кодера Хаффмана.
+        """
+        components = {}
+        totals = {}
+        for name, stats in self._components.items():
+            entry = {key: value for key, value in stats.items() if key != 'histograms'}
+            entry['code_bits'] = stats['dc_code_bits'] + stats['ac_code_bits']
+            entry['vli_bits'] = stats['dc_vli_bits'] + stats['ac_vli_bits']
+            entry['huffman_bits'] = entry['code_bits'] + entry['vli_bits']
+            for key, value in entry.items():
+                totals[key] = totals.get(key, 0) + value
+            _add_rates(entry)
+            histograms = stats['histograms']
+            entry['dc_categories'] = {int(cat): int(count) for cat, count
+                                      in enumerate(histograms['dc_categories']) if count}
+            entry['ac_symbols'] = {f"{symbol >> 4}/{symbol & 0x0F}": int(count) for symbol, count
+                                   in enumerate(histograms['ac_symbols']) if count}
+            entry['eob_positions'] = {int(pos): int(count) for pos, count
+                                      in enumerate(histograms['eob_positions']) if count}
+            components[name] = entry
+        if totals:
+            _add_rates(totals)
+        return {'components': components, 'totals': totals}
+
+    def to_json(self, fileobj):
+        """Записывает report() в текстовый поток в формате JSON."""
+        json.dump(self.report(), fileobj, indent=4, ensure_ascii=False)
+
+    def csv_rows(self):
+        """
+        Строки длинной таблицы (component, metric, key, value): скалярные поля с пустым key,
+        элементы гистограмм с категорией, символом 'run/size' или позицией в key.
+        Итоги записываются с component = 'total'.
+        """
+        report = self.report()
+        rows = []
+        for name, entry in list(report['components'].items()) + [('total', report['totals'])]:
+            for metric, value in entry.items():
+                if isinstance(value, dict):
+                    rows.extend([name, metric, key, count] for key, count in value.items())
+                else:
+                    rows.append([name, metric, "", value])
+        return rows
+
+    def to_csv(self, fileobj):
+        """Записывает csv_rows() с заголовком CSV_COLUMNS в текстовый поток (открытый с newline='')."""
+        writer = csv.writer(fileobj)
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows(self.csv_rows())
+
+
+def main(argv=None):
+    from jpeg_compressor import compress_array, GRAYSCALE_MODES
+
+    parser = argparse.ArgumentParser(description="Статистика энтропийного кодирования изображений.")
+    parser.add_argument("images", nargs="+", help="Изображения; статистика суммируется по всем.")
+    parser.add_argument("-q", "--quality", type=int, default=75)
+    parser.add_argument("-b", "--block-size", type=int, default=8)
+    parser.add_argument("--adaptive-blocks", action="store_true",
+                        help="Выбирать блоки 8x8 или 16x16 для каждого макроблока (компоненты 'Y 16x16' и т.д.).")
+    parser.add_argument("--csv", action="store_true", help="Вывести длинную таблицу CSV вместо JSON.")
+    parser.add_argument("-o", "--output", help="Файл результата (по умолчанию stdout).")
+    args = parser.parse_args(argv)
+
+    stats = EntropyStatistics()
+    for path in args.images:
+        with Image.open(path) as img:
+            pixels = np.array(img.convert('L' if img.mode in GRAYSCALE_MODES else 'RGB'))
+        if compress_array(pixels, quality=args.quality, block_size=args.block_size, entropy_stats=stats,
+                          adaptive_blocks=args.adaptive_blocks) is None:
+            print(f"Не удалось сжать {path}", file=sys.stderr)
+            return 1
+
+    stream = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        if args.csv:
+            stats.to_csv(stream)
+        else:
+            stats.to_json(stream)
+            stream.write("\n")
+    finally:
+        if args.output:
+            stream.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
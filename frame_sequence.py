@@ -0,0 +1,432 @@
+import argparse
+import json
+import math
+import mmap
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+import instrumentation
+import codec_session
+from jpeg_compressor import GRAYSCALE_MODES, MACROBLOCK_SIZE
+from jpeg_decompressor import parse_compressed_data, decode_components
+from image_archive import SHARED_METADATA_KEYS, _tables_id
+
+try:
+    import constants
+except ImportError:
+    class DefaultConstants:
+        Bites_for_param = 4
+        ByteOrder = 'big'
+        Channels = 3
+    constants = DefaultConstants()
+    print("Предупреждение: Файл constants.py не найден, используются значения по умолчанию.", file=sys.stderr)
+
+
+# Последовательность кадров одного размера (таймлапс, видеонаблюдение) в одном файле:
+#   [b'MYJSEQ'][версия, 1 байт]
+#   кадры: [длина заголовка][заголовок JSON][флаги пропуска][поток Y][поток Cb][поток Cr]
+#   индекс JSON: {"width", "height", "components", "mcu", "tables": {id: таблицы},
+#                 "frames": [[смещение, длина, ключевой], ...]}
+#   хвост: смещение и длина индекса (по 8 байт), b'MYJSEQ'
+# Кадр делится на MCU - наименьшие области, кодируемые независимо: блок преобразования
+# (8x8; 16x16 при block_size=16 или adaptive_blocks) для оттенков серого и вдвое больше
+# для цветных кадров с цветностью 4:2:0; кадр дополняется повторением краевых пикселей
+# до целого числа MCU.
+# Ключевой кадр - дополненный кадр целиком. Разностный кадр: бит на каждую MCU
+# (np.packbits, 1 - MCU закодирована заново) и мозаика из измененных MCU, сжатая как
+# одно изображение (нет изображения, если изменений нет); остальные MCU берутся из
+# предыдущего восстановленного кадра. Изображение кадра хранится как запись архива
+# MYJPAR: метаданные MYJPEG без общих таблиц (ключ "image" заголовка кадра, таблицы -
+# в индексе по id), затем потоки компонентов. MCU кодируются независимо от соседей
+# (субдискретизация 2x2 не выходит за MCU), поэтому перенос в мозаику не меняет их декодирования.
+
+SEQUENCE_MAGIC = b'MYJSEQ'
+SEQUENCE_VERSION = 1
+_FOOTER_FIELD = 8
+_FOOTER = len(SEQUENCE_MAGIC) + 2 * _FOOTER_FIELD
+
+
+def _mcu_size(components, block_size=8):
+    """Размер MCU для блока преобразования block_size (для adaptive_blocks - размер макроблока)."""
+    return block_size if components == 1 else 2 * block_size
+
+
+def _pad_frame(frame, mcu):
+    """Дополняет кадр повторением краевых пикселей до размеров, кратных mcu."""
+    h, w = frame.shape[:2]
+    pad = ((0, -h % mcu), (0, -w % mcu)) + ((0, 0),) * (frame.ndim - 2)
+    return np.pad(frame, pad, mode='edge') if any(p[1] for p in pad) else frame
+
+
+def _tiles(plane, mcu):
+    """Вид (rows, cols, mcu, mcu[, C]) на MCU дополненного кадра."""
+    h, w = plane.shape[:2]
+    shape = (h // mcu, mcu, w // mcu, mcu) + plane.shape[2:]
+    axes = (0, 2, 1, 3) + tuple(range(4, plane.ndim + 2))
+    return plane.reshape(shape).transpose(axes)
+
+
+def _mosaic_shape(count):
+    """Сетка мозаики (строк, столбцов) для count MCU, близкая к квадратной."""
+    cols = math.ceil(math.sqrt(count))
+    return math.ceil(count / cols), cols
+
+
+def _to_mosaic(tiles, mcu):
+    """Склеивает MCU (count, mcu, mcu[, C]) в изображение, пустые места заполняются серым."""
+    count = len(tiles)
+    rows, cols = _mosaic_shape(count)
+    grid = np.full((rows * cols,) + tiles.shape[1:], 128, dtype=np.uint8)
+    grid[:count] = tiles
+    grid = grid.reshape((rows, cols) + tiles.shape[1:])
+    axes = (0, 2, 1, 3) + tuple(range(4, grid.ndim))
+    return grid.transpose(axes).reshape((rows * mcu, cols * mcu) + tiles.shape[3:])
+
+
+def _from_mosaic(mosaic, count, mcu):
+    """Обратная операция к _to_mosaic: возвращает (count, mcu, mcu[, C])."""
+    rows, cols = mosaic.shape[0] // mcu, mosaic.shape[1] // mcu
+    return _tiles(mosaic, mcu).reshape((rows * cols, mcu, mcu) + mosaic.shape[2:])[:count]
+
+
+def _read_footer(tail, file_size):
+    """Разбирает хвост файла. Возвращает (index_offset, index_len)."""
+    if len(tail) != _FOOTER or tail[-len(SEQUENCE_MAGIC):] != SEQUENCE_MAGIC:
+        raise ValueError("Неверный формат последовательности (не найден хвост 'MYJSEQ').")
+    index_offset, index_len = (int.from_bytes(tail[i * _FOOTER_FIELD:(i + 1) * _FOOTER_FIELD], constants.ByteOrder)
+                               for i in range(2))
+    if not len(SEQUENCE_MAGIC) + 1 <= index_offset <= index_offset + index_len <= file_size - _FOOTER:
+        raise ValueError("Поврежден хвост последовательности: индекс вне файла.")
+    return index_offset, index_len
+
+
+class SequenceWriter:
+    """
+    Запись последовательности кадров с пропуском неизменившихся MCU.
+
+    MCU считается неизменившейся, если ни один ее отсчет не отличается больше чем на threshold
+    от исходного кадра, по которому эта MCU была закодирована в последний раз. Сравнение
+    с исходными, а не с восстановленными, пикселями не принимает ошибку квантования за
+    изменение и не позволяет медленным изменениям накапливаться: расхождение с исходным
+    кадром ограничено ошибкой сжатия плюс threshold. Каждый key_interval-й кадр ключевой.
+    """
+    def __init__(self, path, quality=75, key_interval=30, threshold=4, tracer=None, **compress_kwargs):
+        """
+        Аргументы:
+            path (str): Путь к создаваемому файлу.
+            quality (int): Уровень качества от 1 до 100.
+            key_interval (int): Расстояние между ключевыми кадрами (1 - все кадры ключевые).
+            threshold (int): Допустимая разность отсчетов MCU, при которой она пропускается (0 - только без изменений).
+            tracer (instrumentation.Tracer, optional): Получатель событий.
+            compress_kwargs: Прочие параметры сжатия (см. jpeg_compressor.compress_array).
+        """
+        if key_interval < 1:
+            raise ValueError("Интервал ключевых кадров должен быть положительным.")
+        self.path = path
+        self.quality = quality
+        self.key_interval = key_interval
+        self.threshold = threshold
+        self.tracer = instrumentation.resolve_tracer(tracer)
+        self.compress_kwargs = compress_kwargs
+        # блок 16x16 не должен захватывать соседние MCU мозаики
+        self._block_size = MACROBLOCK_SIZE if compress_kwargs.get('adaptive_blocks') \
+            else compress_kwargs.get('block_size', 8)
+        self.coded_tiles = 0
+        self.skipped_tiles = 0
+        self._encoder = codec_session.Encoder()
+        self._frames = []
+        self._tables = {}
+        self._shape = None
+        self._reference = None
+        self._file = open(path, 'wb')
+        self._file.write(SEQUENCE_MAGIC + bytes([SEQUENCE_VERSION]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def _compress(self, image):
+        """Сжимает изображение кадра. Возвращает (метаданные без общих таблиц, потоки Y + Cb + Cr)."""
+        data = self._encoder.compress_array(image, quality=self.quality, tracer=self.tracer, **self.compress_kwargs)
+        if data is None:
+            raise ValueError(f"Не удалось сжать кадр {len(self._frames)}.")
+        metadata, y_data, cb_data, cr_data = parse_compressed_data(data)
+        tables = {key: metadata.pop(key) for key in SHARED_METADATA_KEYS}
+        metadata["tables"] = _tables_id(tables)
+        self._tables.setdefault(metadata["tables"], tables)
+        return metadata, bytes(y_data) + bytes(cb_data) + bytes(cr_data)
+
+    def add_frame(self, frame):
+        """
+        Добавляет кадр: RGB (height, width, 3) или оттенки серого (height, width), uint8.
+        Все кадры последовательности должны иметь одну форму.
+
+        Возвращает:
+            int: Длина записи кадра в файле.
+        """
+        frame = np.asarray(frame)
+        if frame.dtype != np.uint8 or frame.ndim not in (2, 3) or (frame.ndim == 3 and frame.shape[2] != 3):
+            raise ValueError(f"Ожидался кадр uint8 формы (height, width, 3) или (height, width), "
+                             f"получен {frame.dtype}{frame.shape}")
+        if self._shape is None:
+            self._shape = frame.shape
+        elif frame.shape != self._shape:
+            raise ValueError(f"Форма кадра {frame.shape} отличается от формы последовательности {self._shape}.")
+        mcu = _mcu_size(1 if frame.ndim == 2 else 3, self._block_size)
+        padded = _pad_frame(frame, mcu)
+        index = len(self._frames)
+
+        with self.tracer.stage('sequence_frame', frame=index):
+            if index % self.key_interval == 0:
+                header = {"type": "key"}
+                mask = b''
+                header["image"], data = self._compress(padded)
+                self._reference = padded.copy()
+                self.tracer.counter('coded_blocks', padded.shape[0] * padded.shape[1] // (mcu * mcu))
+            else:
+                current = _tiles(padded, mcu)
+                reference = _tiles(self._reference, mcu)
+                difference = np.abs(current.astype(np.int16) - reference.astype(np.int16))
+                changed = difference.reshape(current.shape[:2] + (-1,)).max(axis=2) > self.threshold
+                count = int(changed.sum())
+                header = {"type": "delta", "tiles": count}
+                mask = np.packbits(changed.reshape(-1)).tobytes()
+                data = b''
+                if count:
+                    header["image"], data = self._compress(_to_mosaic(current[changed], mcu))
+                    reference[changed] = current[changed]
+                self.coded_tiles += count
+                self.skipped_tiles += changed.size - count
+                self.tracer.counter('coded_blocks', count)
+                self.tracer.counter('skipped_blocks', changed.size - count)
+
+            header["mask_len"] = len(mask)
+            header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+            offset = self._file.tell()
+            self._file.write(len(header_bytes).to_bytes(constants.Bites_for_param, constants.ByteOrder))
+            self._file.write(header_bytes)
+            self._file.write(mask)
+            self._file.write(data)
+            length = self._file.tell() - offset
+            self._frames.append([offset, length, header["type"] == "key"])
+            self.tracer.counter('bytes', length)
+        return length
+
+    def close(self):
+        """Записывает индекс и хвост и закрывает файл."""
+        if self._file is None:
+            return
+        height, width = self._shape[:2] if self._shape is not None else (0, 0)
+        components = 1 if self._shape is not None and len(self._shape) == 2 else 3
+        index = {"width": width, "height": height, "components": components, "mcu": _mcu_size(components, self._block_size),
+                 "tables": self._tables, "frames": self._frames}
+        index_bytes = json.dumps(index, separators=(',', ':')).encode('utf-8')
+        index_offset = self._file.tell()
+        self._file.write(index_bytes)
+        for value in (index_offset, len(index_bytes)):
+            self._file.write(value.to_bytes(_FOOTER_FIELD, constants.ByteOrder))
+        self._file.write(SEQUENCE_MAGIC)
+        self._file.close()
+        self._file = None
+
+
+class FrameSequence:
+    """
+    Чтение последовательности через mmap. Кадр восстанавливается от ближайшего
+    ключевого кадра не позже него; при последовательном чтении продолжается
+    восстановление от предыдущего запрошенного кадра.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._decoder = codec_session.Decoder()
+        self._state = None
+        self._file = open(path, 'rb')
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < len(SEQUENCE_MAGIC) + 1 + _FOOTER:
+                raise ValueError("Файл слишком мал для последовательности MYJSEQ.")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._mmap[:len(SEQUENCE_MAGIC)] != SEQUENCE_MAGIC:
+                raise ValueError("Неверный формат последовательности (не найден 'MYJSEQ').")
+            if self._mmap[len(SEQUENCE_MAGIC)] != SEQUENCE_VERSION:
+                raise ValueError(f"Неподдерживаемая версия последовательности: {self._mmap[len(SEQUENCE_MAGIC)]}")
+            index_offset, index_len = _read_footer(self._mmap[-_FOOTER:], size)
+            index = json.loads(self._mmap[index_offset:index_offset + index_len].decode('utf-8'))
+            self.width = index["width"]
+            self.height = index["height"]
+            self.components = index["components"]
+            self.mcu = index["mcu"]
+            self._tables = index["tables"]
+            self._frames = index["frames"]
+            if self._frames and not self._frames[0][2]:
+                raise ValueError("Первый кадр последовательности не ключевой.")
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __iter__(self):
+        for index in range(len(self._frames)):
+            yield self.frame(index)
+
+    def key_frames(self):
+        """Номера ключевых кадров по возрастанию."""
+        return [index for index, (_, _, key) in enumerate(self._frames) if key]
+
+    def key_frame_before(self, index):
+        """Номер ближайшего ключевого кадра не позже index."""
+        if not 0 <= index < len(self._frames):
+            raise IndexError(f"Кадр {index} вне последовательности из {len(self._frames)} кадров.")
+        while not self._frames[index][2]:
+            index -= 1
+        return index
+
+    def _read_record(self, index):
+        """Возвращает (заголовок, флаги пропуска, метаданные изображения или None, потоки Y, Cb, Cr)."""
+        offset, length, _ = self._frames[index]
+        record = memoryview(self._mmap)[offset:offset + length]
+        header_len = int.from_bytes(record[:constants.Bites_for_param], constants.ByteOrder)
+        pos = constants.Bites_for_param + header_len
+        header = json.loads(bytes(record[constants.Bites_for_param:pos]).decode('utf-8'))
+        mask = record[pos:pos + header["mask_len"]]
+        pos += header["mask_len"]
+        metadata = header.get("image")
+        payloads = [b'', b'', b'']
+        if metadata is not None:
+            metadata.update(self._tables[metadata.pop("tables")])
+            for i, key in enumerate(("data_len_y", "data_len_cb", "data_len_cr")):
+                payloads[i] = record[pos:pos + metadata[key]]
+                pos += metadata[key]
+        if pos != length:
+            raise ValueError(f"Запись кадра {index} повреждена: длины не совпадают с длиной записи.")
+        return header, mask, metadata, payloads
+
+    def _decode(self, metadata, payloads, tracer):
+        image = decode_components(metadata, *payloads, tracer=tracer, session=self._decoder)
+        if image is None:
+            return None
+        # мозаика цветного кадра с R = G = B во всех пикселях сжимается как оттенки серого
+        if self.components == 3 and image.ndim == 2:
+            image = np.repeat(image[:, :, None], 3, axis=2)
+        return image
+
+    def _apply(self, index, reconstruction, tracer):
+        """Восстанавливает кадр index поверх reconstruction (для ключевого - заново)."""
+        header, mask, metadata, payloads = self._read_record(index)
+        if header["type"] == "key":
+            return self._decode(metadata, payloads, tracer)
+        rows = math.ceil(self.height / self.mcu)
+        cols = math.ceil(self.width / self.mcu)
+        changed = np.unpackbits(np.frombuffer(mask, dtype=np.uint8), count=rows * cols).astype(bool)
+        if int(changed.sum()) != header["tiles"]:
+            raise ValueError(f"Флаги пропуска кадра {index} не совпадают с количеством MCU.")
+        if header["tiles"]:
+            mosaic = self._decode(metadata, payloads, tracer)
+            if mosaic is None:
+                return None
+            _tiles(reconstruction, self.mcu)[changed.reshape(rows, cols)] = _from_mosaic(mosaic, header["tiles"], self.mcu)
+        tracer.counter('skipped_blocks', changed.size - header["tiles"])
+        return reconstruction
+
+    def frame(self, index, tracer=None):
+        """
+        Декодирует кадр index.
+
+        Возвращает:
+            np.ndarray: RGB (height, width, 3) или оттенки серого (height, width), uint8, или None при ошибке.
+        """
+        tracer = instrumentation.resolve_tracer(tracer)
+        with tracer.stage('sequence_frame', frame=index):
+            try:
+                start = self.key_frame_before(index)
+                reconstruction = None
+                if self._state is not None and start <= self._state[0] <= index:
+                    start, reconstruction = self._state[0] + 1, self._state[1]
+                for current in range(start, index + 1):
+                    reconstruction = self._apply(current, reconstruction, tracer)
+                    if reconstruction is None:
+                        self._state = None
+                        return None
+            except (IndexError, KeyError, ValueError, json.JSONDecodeError) as e:
+                tracer.error(f"Ошибка чтения кадра {index} из {self.path}: {e}", exception=e)
+                self._state = None
+                return None
+            self._state = (index, reconstruction)
+            return reconstruction[:self.height, :self.width].copy()
+
+    def close(self):
+        """Закрывает отображение и файл."""
+        self._state = None
+        if getattr(self, '_mmap', None) is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
+            self._file = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Последовательности кадров MYJSEQ с пропуском неизменившихся блоков.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    encode = commands.add_parser("encode", help="Сжать кадры (в порядке аргументов) в последовательность.")
+    encode.add_argument("output")
+    encode.add_argument("frames", nargs="+")
+    encode.add_argument("-q", "--quality", type=int, default=75)
+    encode.add_argument("-k", "--key-interval", type=int, default=30)
+    encode.add_argument("-t", "--threshold", type=int, default=4)
+    info = commands.add_parser("info", help="Сведения о последовательности.")
+    info.add_argument("sequence")
+    extract = commands.add_parser("extract", help="Декодировать кадр в файл изображения.")
+    extract.add_argument("sequence")
+    extract.add_argument("index", type=int)
+    extract.add_argument("output")
+    args = parser.parse_args(argv)
+
+    if args.command == "encode":
+        with SequenceWriter(args.output, quality=args.quality, key_interval=args.key_interval,
+                            threshold=args.threshold) as writer:
+            for path in args.frames:
+                with Image.open(path) as img:
+                    writer.add_frame(np.array(img.convert('L' if img.mode in GRAYSCALE_MODES else 'RGB')))
+            total = writer.coded_tiles + writer.skipped_tiles
+            skipped = writer.skipped_tiles / total if total else 0.0
+        print(f"Последовательность {args.output}: {len(args.frames)} кадров, {os.path.getsize(args.output)} байт, "
+              f"пропущено {skipped:.1%} MCU разностных кадров")
+        return 0
+
+    with FrameSequence(args.sequence) as sequence:
+        if args.command == "info":
+            print(f"{sequence.width}x{sequence.height}, кадров: {len(sequence)}, "
+                  f"ключевые: {', '.join(map(str, sequence.key_frames()))}")
+            return 0
+        error_collector = instrumentation.ErrorCollector()
+        frame = sequence.frame(args.index, tracer=error_collector)
+        if frame is None:
+            for message in error_collector.errors:
+                print(message, file=sys.stderr)
+            return 1
+        Image.fromarray(frame).save(args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,10 @@
 import heapq
 from collections import Counter, defaultdict
-import io
 import numpy as np
 
+import instrumentation
+import coefficient_store
+
 
 DEFAULT_DC_LUMINANCE_BITS = [0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]
 DEFAULT_DC_LUMINANCE_HUFFVAL = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
@@ -40,6 +42,67 @@ DEFAULT_AC_CHROMINANCE_HUFFVAL = [
     0xF9, 0xFA
 ]
 
+def optimal_table_spec(frequencies):
+    """
+    Спецификация таблицы Хаффмана, оптимальной для частот символов (ITU-T T.81, приложение K.2-K.3):
+    длины кодов ограничены 16 битами, код из одних единиц не используется.
+
+    Аргументы:
+        frequencies (sequence[int]): Частоты символов 0..255 (длина не больше 256);
+            символы с нулевой частотой в таблицу не попадают.
+
+    Возвращает:
+        tuple[list[int], list[int]]: (BITS, HUFFVAL) для HuffmanTable.
+    """
+    freq = [int(f) for f in frequencies] + [0] * (256 - len(frequencies))
+    # зарезервированный символ 256 гарантирует, что ни один код не состоит из одних единиц
+    freq.append(1)
+    codesize = [0] * 257
+    others = [-1] * 257
+    while True:
+        v1 = v2 = -1
+        for v in range(257):
+            if freq[v] > 0 and (v1 < 0 or freq[v] <= freq[v1]):
+                v1 = v
+        for v in range(257):
+            if freq[v] > 0 and v != v1 and (v2 < 0 or freq[v] <= freq[v2]):
+                v2 = v
+        if v2 < 0:
+            break
+        freq[v1] += freq[v2]
+        freq[v2] = 0
+        codesize[v1] += 1
+        while others[v1] != -1:
+            v1 = others[v1]
+            codesize[v1] += 1
+        others[v1] = v2
+        codesize[v2] += 1
+        while others[v2] != -1:
+            v2 = others[v2]
+            codesize[v2] += 1
+
+    bits = [0] * 33
+    for size in codesize:
+        if size:
+            bits[size] += 1
+    for i in range(32, 16, -1):
+        while bits[i] > 0:
+            j = i - 2
+            while bits[j] == 0:
+                j -= 1
+            bits[i] -= 2
+            bits[i - 1] += 1
+            bits[j + 1] += 2
+            bits[j] -= 1
+    i = 16
+    while bits[i] == 0:
+        i -= 1
+    bits[i] -= 1
+
+    huffval = [symbol for size in range(1, 33) for symbol in range(256) if codesize[symbol] == size]
+    return bits[1:17], huffval
+
+
 class HuffmanTable:
     """
     Класс для представления и работы с таблицей Хаффмана в формате JPEG.
@@ -119,12 +182,13 @@ class HuffmanTable:
         """
         return self.encode_table.get(symbol)
 
-    def decode_symbol(self, bit_reader):
+    def decode_symbol(self, bit_reader, tracer=None):
         """
         Декодирует следующий символ Хаффмана из битового потока.
 
         Аргументы:
             bit_reader (BitReader): Объект для чтения бит.
+            tracer (instrumentation.Tracer, optional): Получатель предупреждений об ошибках декодирования.
 
         Возвращает:
             int: Декодированный символ или None, если достигнут конец потока или ошибка.
@@ -134,12 +198,16 @@ class HuffmanTable:
             bit = bit_reader.read_bit()
             if bit is None:
                 if current_code_str:
-                     print(f"Ошибка декодирования: конец потока после неполного кода '{current_code_str}'")
+                     tracer = instrumentation.resolve_tracer(tracer)
+                     if tracer.enabled:
+                         tracer.warning(f"Ошибка декодирования: конец потока после неполного кода '{current_code_str}'")
                 return None
             current_code_str += str(bit)
             if current_code_str in self.decode_table:
                 return self.decode_table[current_code_str]
-        print(f"Ошибка декодирования: не найден символ для кода '{current_code_str}' (макс. длина {self.max_code_len})")
+        tracer = instrumentation.resolve_tracer(tracer)
+        if tracer.enabled:
+            tracer.warning(f"Ошибка декодирования: не найден символ для кода '{current_code_str}' (макс. длина {self.max_code_len})")
         return None
 
 
@@ -198,9 +266,13 @@ class BitWriter:
 
 
 class BitReader:
-    """Класс для чтения бит из байтового потока с JPEG байт-стаффингом."""
+    """
+    Класс для чтения бит из байтового потока с JPEG байт-стаффингом.
+    Читает напрямую из memoryview над исходными данными, не копируя их.
+    """
     def __init__(self, byte_data):
-        self._byte_stream = io.BytesIO(byte_data)
+        self._data = memoryview(byte_data)
+        self._pos = 0
         self._current_byte = 0
         self._bit_pos = 8
         self._marker_found = False
@@ -210,23 +282,24 @@ class BitReader:
         if self._marker_found:
             return None
 
-        byte = self._byte_stream.read(1)
-        if not byte:
+        data = self._data
+        if self._pos >= len(data):
             return None
 
-        val = byte[0]
+        val = data[self._pos]
+        self._pos += 1
         if val == 0xFF:
-            next_byte = self._byte_stream.read(1)
-            if not next_byte:
+            if self._pos >= len(data):
                  self._marker_found = True
                  return None
-            next_val = next_byte[0]
+            next_val = data[self._pos]
             if next_val == 0x00:
+                self._pos += 1
                 self._current_byte = 0xFF
                 self._bit_pos = 0
                 return True
             else:
-                self._byte_stream.seek(-2, io.SEEK_CUR)
+                self._pos -= 1
                 self._marker_found = True
                 return None
         else:
@@ -262,6 +335,75 @@ class BitReader:
 
 from vli_coding import get_vli_category_and_value
 
+def encode_dc_symbol(bit_writer, dc_category, dc_vli_bits, dc_table):
+    """
+    Записывает категорию DC (кодом Хаффмана) и ее дополнительные биты VLI.
+
+    Аргументы:
+        bit_writer (BitWriter): Приемник бит.
+        dc_category (int): Категория разности DC.
+        dc_vli_bits (str): Дополнительные биты VLI (строка из '0'/'1').
+        dc_table (HuffmanTable): Таблица Хаффмана для DC категорий.
+    """
+    dc_huff_code_info = dc_table.get_code(dc_category)
+    if dc_huff_code_info is None:
+         raise ValueError(f"Символ DC категории {dc_category} не найден в таблице Хаффмана.")
+    dc_code, dc_len = dc_huff_code_info
+    bit_writer.write_bits(dc_code, dc_len)
+    if dc_category > 0:
+        if len(dc_vli_bits) != dc_category:
+             raise ValueError(f"Неверная длина VLI бит для DC={dc_category}: '{dc_vli_bits}' (длина {len(dc_vli_bits)})")
+        dc_vli_val = int(dc_vli_bits, 2)
+        bit_writer.write_bits(dc_vli_val, dc_category)
+
+
+def encode_ac_pairs(bit_writer, ac_rle_pairs, ac_table):
+    """
+    Записывает RLE пары AC коэффициентов (до EOB включительно) кодами Хаффмана с битами VLI.
+
+    Аргументы:
+        bit_writer (BitWriter): Приемник бит.
+        ac_rle_pairs (list[tuple]): Пары из rle_encode_ac_coefficients.
+        ac_table (HuffmanTable): Таблица Хаффмана для AC RLE пар (run/size).
+    """
+    for run_length, ac_value in ac_rle_pairs:
+        if run_length == 0 and ac_value == 0:
+            ac_symbol = 0x00
+            ac_huff_code_info = ac_table.get_code(ac_symbol)
+            if ac_huff_code_info is None:
+                raise ValueError("Символ EOB (0x00) не найден в AC таблице Хаффмана.")
+            ac_code, ac_len = ac_huff_code_info
+            bit_writer.write_bits(ac_code, ac_len)
+            break
+        elif run_length == 15 and ac_value == 0:
+            ac_symbol = 0xF0
+            ac_huff_code_info = ac_table.get_code(ac_symbol)
+            if ac_huff_code_info is None:
+                raise ValueError("Символ ZRL (0xF0) не найден в AC таблице Хаффмана.")
+            ac_code, ac_len = ac_huff_code_info
+            bit_writer.write_bits(ac_code, ac_len)
+        else:
+            ac_category, ac_vli_bits = get_vli_category_and_value(ac_value)
+            if ac_category == 0:
+                raise ValueError(f"Получена нулевая категория для ненулевого AC: {ac_value}")
+            if ac_category > 15:
+                raise ValueError(f"AC VLI категория {ac_category} не может быть > 15")
+            if not (0 <= run_length <= 15):
+                 raise ValueError(f"Недопустимый run_length {run_length} в AC RLE.")
+
+            ac_symbol = (run_length << 4) | ac_category
+            ac_huff_code_info = ac_table.get_code(ac_symbol)
+            if ac_huff_code_info is None:
+                raise ValueError(f"Символ AC (run={run_length}, size={ac_category}, sym=0x{ac_symbol:02X}) не найден в таблице Хаффмана.")
+            ac_code, ac_len = ac_huff_code_info
+            bit_writer.write_bits(ac_code, ac_len)
+
+            if len(ac_vli_bits) != ac_category:
+                 raise ValueError(f"Неверная длина VLI бит для AC={ac_value} (кат={ac_category}): '{ac_vli_bits}' (длина {len(ac_vli_bits)})")
+            ac_vli_val = int(ac_vli_bits, 2)
+            bit_writer.write_bits(ac_vli_val, ac_category)
+
+
 def huffman_encode_data(data_units, dc_table, ac_table):
     """
     Кодирует список обработанных блоков данных (DC + AC RLE) Хаффманом.
@@ -279,80 +421,125 @@ def huffman_encode_data(data_units, dc_table, ac_table):
     bit_writer = BitWriter()
 
     for dc_category, dc_vli_bits, ac_rle_pairs in data_units:
-        dc_huff_code_info = dc_table.get_code(dc_category)
-        if dc_huff_code_info is None:
-             raise ValueError(f"Символ DC категории {dc_category} не найден в таблице Хаффмана.")
-        dc_code, dc_len = dc_huff_code_info
-        bit_writer.write_bits(dc_code, dc_len)
-        if dc_category > 0:
-            if len(dc_vli_bits) != dc_category:
-                 raise ValueError(f"Неверная длина VLI бит для DC={dc_category}: '{dc_vli_bits}' (длина {len(dc_vli_bits)})")
-            dc_vli_val = int(dc_vli_bits, 2)
-            bit_writer.write_bits(dc_vli_val, dc_category)
-
-        for run_length, ac_value in ac_rle_pairs:
-            if run_length == 0 and ac_value == 0:
-                ac_symbol = 0x00
-                ac_huff_code_info = ac_table.get_code(ac_symbol)
-                if ac_huff_code_info is None:
-                    raise ValueError("Символ EOB (0x00) не найден в AC таблице Хаффмана.")
-                ac_code, ac_len = ac_huff_code_info
-                bit_writer.write_bits(ac_code, ac_len)
-                break
-            elif run_length == 15 and ac_value == 0:
-                ac_symbol = 0xF0
-                ac_huff_code_info = ac_table.get_code(ac_symbol)
-                if ac_huff_code_info is None:
-                    raise ValueError("Символ ZRL (0xF0) не найден в AC таблице Хаффмана.")
-                ac_code, ac_len = ac_huff_code_info
-                bit_writer.write_bits(ac_code, ac_len)
-            else:
-                ac_category, ac_vli_bits = get_vli_category_and_value(ac_value)
-                if ac_category == 0:
-                    raise ValueError(f"Получена нулевая категория для ненулевого AC: {ac_value}")
-                if ac_category > 15:
-                    raise ValueError(f"AC VLI категория {ac_category} не может быть > 15")
-                if not (0 <= run_length <= 15):
-                     raise ValueError(f"Недопустимый run_length {run_length} в AC RLE.")
-
-                ac_symbol = (run_length << 4) | ac_category
-                ac_huff_code_info = ac_table.get_code(ac_symbol)
-                if ac_huff_code_info is None:
-                    raise ValueError(f"Символ AC (run={run_length}, size={ac_category}, sym=0x{ac_symbol:02X}) не найден в таблице Хаффмана.")
-                ac_code, ac_len = ac_huff_code_info
-                bit_writer.write_bits(ac_code, ac_len)
-
-                if len(ac_vli_bits) != ac_category:
-                     raise ValueError(f"Неверная длина VLI бит для AC={ac_value} (кат={ac_category}): '{ac_vli_bits}' (длина {len(ac_vli_bits)})")
-                ac_vli_val = int(ac_vli_bits, 2)
-                bit_writer.write_bits(ac_vli_val, ac_category)
+        encode_dc_symbol(bit_writer, dc_category, dc_vli_bits, dc_table)
+        encode_ac_pairs(bit_writer, ac_rle_pairs, ac_table)
+
+    return bit_writer.get_byte_string()
+
+
+def _vli_bits(number, category):
+    """Дополнительные биты VLI числа категории category в виде целого (см. get_vli_category_and_value)."""
+    return number if number > 0 else number + (1 << category) - 1
+
+
+def _encode_ac_row(ac_row, trailing_zeros, ac_codes):
+    """
+    Кодирует AC коэффициенты блока до последнего ненулевого и хвост из trailing_zeros нулей
+    так же, как rle_encode_ac_coefficients + encode_ac_pairs (ZRL на каждые 16 нулей подряд,
+    включая хвостовые, затем EOB).
+
+    Возвращает:
+        tuple[int, int]: (биты, их количество) одним целым числом.
+    """
+    value, length = 0, 0
+    run = 0
+    for coeff in ac_row:
+        if coeff == 0:
+            run += 1
+            continue
+        while run >= 16:
+            code, code_len = ac_codes[0xF0]
+            value, length = (value << code_len) | code, length + code_len
+            run -= 16
+        category = abs(coeff).bit_length()
+        if category > 15:
+            raise ValueError(f"AC VLI категория {category} не может быть > 15")
+        symbol = (run << 4) | category
+        if symbol not in ac_codes:
+            raise ValueError(f"Символ AC (run={run}, size={category}, sym=0x{symbol:02X}) не найден в таблице Хаффмана.")
+        code, code_len = ac_codes[symbol]
+        value = (((value << code_len) | code) << category) | _vli_bits(coeff, category)
+        length += code_len + category
+        run = 0
+    for _ in range(trailing_zeros // 16):
+        code, code_len = ac_codes[0xF0]
+        value, length = (value << code_len) | code, length + code_len
+    code, code_len = ac_codes[0x00]
+    return (value << code_len) | code, length + code_len
+
+
+def huffman_encode_coefficients(coeffs, dc_table, ac_table, eob=None):
+    """
+    Кодирует квантованные коэффициенты компонента Хаффманом напрямую из хранилища
+    (см. coefficient_store), без промежуточных списков RLE пар и строк VLI.
+    Результат совпадает с huffman_encode_data для тех же блоков после DPCM, VLI и RLE.
+
+    Аргументы:
+        coeffs (np.ndarray): Коэффициенты (n_blocks, N*N) в зигзаг-порядке, DC - абсолютные значения.
+        dc_table (HuffmanTable): Таблица Хаффмана для DC категорий.
+        ac_table (HuffmanTable): Таблица Хаффмана для AC RLE пар (run/size).
+        eob (np.ndarray, optional): Позиции конца блоков (coefficient_store.eob_positions).
+
+    Возвращает:
+        bytes: Закодированная байтовая строка.
+    """
+    coeffs = np.asarray(coeffs)
+    num_blocks, num_coeffs = coeffs.shape
+    if eob is None:
+        eob = coefficient_store.eob_positions(coeffs)
+    dc_codes = dc_table.encode_table
+    ac_codes = ac_table.encode_table
+    for symbol, name in ((0x00, "EOB (0x00)"), (0xF0, "ZRL (0xF0)")):
+        if symbol not in ac_codes:
+            raise ValueError(f"Символ {name} не найден в AC таблице Хаффмана.")
+
+    bit_writer = BitWriter()
+    dc_diffs = np.diff(coeffs[:, 0].astype(np.int64), prepend=0).tolist()
+    # одинаковые строки AC (однотонные и повторяющиеся блоки) кодируются один раз
+    ac_memo = {}
+    for index, (dc_diff, end) in enumerate(zip(dc_diffs, eob.tolist())):
+        dc_category = abs(dc_diff).bit_length()
+        if dc_category not in dc_codes:
+            raise ValueError(f"Символ DC категории {dc_category} не найден в таблице Хаффмана.")
+        dc_code, dc_len = dc_codes[dc_category]
+        bit_writer.write_bits((dc_code << dc_category) | (_vli_bits(dc_diff, dc_category) if dc_category else 0),
+                              dc_len + dc_category)
+
+        ac_row = coeffs[index, 1:end]
+        key = ac_row.tobytes()
+        ac_bits = ac_memo.get(key)
+        if ac_bits is None:
+            ac_bits = ac_memo[key] = _encode_ac_row(ac_row.tolist(), num_coeffs - max(end, 1), ac_codes)
+        bit_writer.write_bits(*ac_bits)
 
     return bit_writer.get_byte_string()
 
 
 from vli_coding import decode_vli
 
-def huffman_decode_data(byte_data, dc_table, ac_table, num_blocks):
+def huffman_decode_data(byte_data, dc_table, ac_table, num_blocks, tracer=None):
     """
     Декодирует Хаффман-закодированные данные для нескольких блоков.
 
     Аргументы:
-        byte_data (bytes): Входная байтовая строка.
+        byte_data (bytes-like): Входная байтовая строка (bytes, bytearray или memoryview).
         dc_table (HuffmanTable): Таблица Хаффмана для DC категорий.
         ac_table (HuffmanTable): Таблица Хаффмана для AC RLE пар (run/size).
         num_blocks (int): Ожидаемое количество блоков для декодирования.
+        tracer (instrumentation.Tracer, optional): Получатель предупреждений о повреждённых данных.
 
     Возвращает:
         list: Список кортежей, формат совпадает с входом huffman_encode_data:
               [(dc_category, dc_vli_bits, [(rle_ac_run, ac_value), ...]), ...]
               где ac_value - восстановленное значение AC.
     """
+    tracer = instrumentation.resolve_tracer(tracer)
     bit_reader = BitReader(byte_data)
     decoded_units = []
 
     try:
         for block_index in range(num_blocks):
-            dc_category = dc_table.decode_symbol(bit_reader)
+            dc_category = dc_table.decode_symbol(bit_reader, tracer)
             if dc_category is None:
                  raise EOFError(f"Не удалось декодировать DC категорию блока {block_index + 1}.")
 
@@ -366,7 +553,7 @@ def huffman_decode_data(byte_data, dc_table, ac_table, num_blocks):
             ac_rle_pairs = []
             ac_count = 0
             while ac_count < 64:
-                ac_symbol = ac_table.decode_symbol(bit_reader)
+                ac_symbol = ac_table.decode_symbol(bit_reader, tracer)
                 if ac_symbol is None:
                     raise EOFError(f"Не удалось декодировать AC символ в блоке {block_index + 1} после {len(ac_rle_pairs)} пар.")
 
@@ -388,20 +575,174 @@ def huffman_decode_data(byte_data, dc_table, ac_table, num_blocks):
                     ac_rle_pairs.append((run_length, ac_value))
                     ac_count += run_length + 1
 
-                if ac_count > 63 :
-                     print(f"Предупреждение: Счетчик AC ({ac_count}) превысил 63 в блоке {block_index + 1}. Возможно, лишние данные.")
+                if ac_count > 63 and tracer.enabled:
+                     tracer.warning(f"Счетчик AC ({ac_count}) превысил 63 в блоке {block_index + 1}. Возможно, лишние данные.")
 
-            if ac_count > 63 and ac_symbol != 0x00:
-                 print(f"Предупреждение: Цикл декодирования AC завершился с ac_count={ac_count} > 63 и без EOB.")
+            if ac_count > 63 and ac_symbol != 0x00 and tracer.enabled:
+                 tracer.warning(f"Цикл декодирования AC завершился с ac_count={ac_count} > 63 и без EOB.")
 
 
             decoded_units.append((dc_category, dc_vli_bits_str, ac_rle_pairs))
 
     except EOFError as e:
-         print(f"Предупреждение: Ошибка конца потока при декодировании блока {len(decoded_units) + 1}: {e}. Декодировано {len(decoded_units)} блоков.")
-         pass
+         tracer.warning(f"Ошибка конца потока при декодировании блока {len(decoded_units) + 1}: {e}. Декодировано {len(decoded_units)} блоков.")
     except ValueError as e:
-         print(f"Ошибка значения при декодировании блока {len(decoded_units) + 1}: {e}")
-         pass
+         tracer.warning(f"Ошибка значения при декодировании блока {len(decoded_units) + 1}: {e}")
+
+    return decoded_units
 
-    return decoded_units
\ No newline at end of file
+_LOOKAHEAD_BITS = 16
+
+
+def _lookup_table(table):
+    """
+    Таблица быстрого декодирования: для каждого 16-битного префикса потока - число
+    (символ << 5) | длина_кода, 0 для префиксов без кода. Строится один раз на таблицу.
+    """
+    lookup = getattr(table, '_lookup', None)
+    if lookup is None:
+        lookup = [0] * (1 << _LOOKAHEAD_BITS)
+        for symbol, (code, length) in table.encode_table.items():
+            span = 1 << (_LOOKAHEAD_BITS - length)
+            start = code << (_LOOKAHEAD_BITS - length)
+            lookup[start:start + span] = [(symbol << 5) | length] * span
+        table._lookup = lookup
+    return lookup
+
+
+def _unstuff(byte_data):
+    """
+    Отрезает поток по первому маркеру (0xFF, за которым не 0x00, или 0xFF в конце)
+    и убирает байт-стаффинг, как это делает BitReader.
+    """
+    data = bytes(byte_data)
+    pos = data.find(b'\xff')
+    while pos != -1:
+        if pos + 1 >= len(data) or data[pos + 1] != 0x00:
+            data = data[:pos]
+            break
+        pos = data.find(b'\xff', pos + 2)
+    return data.replace(b'\xff\x00', b'\xff')
+
+
+def huffman_decode_coefficients(byte_data, dc_table, ac_table, num_blocks, num_coeffs=64,
+                                out=None, positions=None, tracer=None):
+    """
+    Декодирует поток Хаффмана компонента сразу в хранилище коэффициентов: символы
+    читаются по 16-битным таблицам просмотра, знак VLI, пропуски нулей и предсказание DC
+    восстанавливаются на месте, промежуточные кортежи, списки RLE пар и строки бит не
+    создаются. Обратная операция к huffman_encode_coefficients; при повреждении потока
+    ведет себя как huffman_decode_data (возвращаются блоки до ошибки).
+
+    Аргументы:
+        byte_data (bytes-like): Закодированный поток.
+        dc_table (HuffmanTable): Таблица Хаффмана для DC категорий.
+        ac_table (HuffmanTable): Таблица Хаффмана для AC RLE пар (run/size).
+        num_blocks (int): Ожидаемое количество блоков.
+        num_coeffs (int): Количество коэффициентов в блоке (N*N).
+        out (np.ndarray, optional): Заранее выделенный C-непрерывный массив (>= num_blocks, num_coeffs)
+            типа COEFF_DTYPE; обнуляется и заполняется. По умолчанию выделяется новый.
+        positions (sequence[int], optional): Позиция в строке для k-го коэффициента зигзаг-порядка.
+            По умолчанию k (строки в зигзаг-порядке); zigzag_scan.zigzag_order(N) дает
+            естественный порядок, то есть блоки NxN без обратного зигзаг-сканирования.
+        tracer (instrumentation.Tracer, optional): Получатель предупреждений о повреждённых данных.
+
+    Возвращает:
+        np.ndarray: Коэффициенты (n, num_coeffs) с абсолютными DC (вид на out); n < num_blocks
+                    для оборванного потока.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    if out is None:
+        out = coefficient_store.allocate(num_blocks, num_coeffs)
+    else:
+        if out.dtype != coefficient_store.COEFF_DTYPE or not out.flags.c_contiguous \
+                or out.shape[0] < num_blocks or out.shape[1:] != (num_coeffs,):
+            raise ValueError(f"Буфер коэффициентов {out.dtype}{out.shape} не подходит для "
+                             f"({num_blocks}, {num_coeffs}) {np.dtype(coefficient_store.COEFF_DTYPE)}.")
+        out[:num_blocks] = 0
+    positions = list(range(num_coeffs)) if positions is None else [int(p) for p in positions]
+    if num_blocks == 0:
+        return out[:0]
+    flat = memoryview(out[:num_blocks]).cast('B').cast(out.dtype.char)
+
+    dc_lookup = _lookup_table(dc_table)
+    ac_lookup = _lookup_table(ac_table)
+    data = _unstuff(byte_data)
+    total_bits = len(data) * 8
+    data += bytes(8)
+    from_bytes = int.from_bytes
+
+    acc = 0
+    nbits = 0
+    pos = 0
+    predictor = 0
+    dc_position = positions[0]
+    decoded = 0
+    try:
+        for block_index in range(num_blocks):
+            base = block_index * num_coeffs
+            if nbits < 32:
+                acc = ((acc & ((1 << nbits) - 1)) << 32) | from_bytes(data[pos:pos + 4], 'big')
+                pos += 4
+                nbits += 32
+            entry = dc_lookup[(acc >> (nbits - _LOOKAHEAD_BITS)) & 0xFFFF]
+            if not entry:
+                raise ValueError(f"Не найден код DC категории в блоке {block_index + 1}.")
+            nbits -= entry & 31
+            size = entry >> 5
+            if size > 15:
+                raise ValueError(f"Декодирована некорректная DC категория {size} > 15.")
+            if size:
+                value = (acc >> (nbits - size)) & ((1 << size) - 1)
+                nbits -= size
+                if value < (1 << (size - 1)):
+                    value -= (1 << size) - 1
+                predictor += value
+            flat[base + dc_position] = predictor
+
+            # как и huffman_decode_data, после заполненного блока читается еще один символ (EOB)
+            k = 1
+            while k <= num_coeffs:
+                if nbits < 32:
+                    acc = ((acc & ((1 << nbits) - 1)) << 32) | from_bytes(data[pos:pos + 4], 'big')
+                    pos += 4
+                    nbits += 32
+                entry = ac_lookup[(acc >> (nbits - _LOOKAHEAD_BITS)) & 0xFFFF]
+                if not entry:
+                    raise ValueError(f"Не найден AC код в блоке {block_index + 1}.")
+                nbits -= entry & 31
+                symbol = entry >> 5
+                if symbol == 0x00:
+                    break
+                if symbol == 0xF0:
+                    k += 16
+                    continue
+                size = symbol & 0x0F
+                if size == 0:
+                    raise ValueError(f"Некорректный AC символ 0x{symbol:02X} (run={symbol >> 4}, size=0)")
+                value = (acc >> (nbits - size)) & ((1 << size) - 1)
+                nbits -= size
+                if value < (1 << (size - 1)):
+                    value -= (1 << size) - 1
+                k += symbol >> 4
+                if k < num_coeffs:
+                    flat[base + positions[k]] = value
+                elif tracer.enabled:
+                    tracer.warning(f"Значение {value} после {symbol >> 4} нулей выходит за границу блока "
+                                   f"({num_coeffs}) и игнорируется.")
+                k += 1
+            else:
+                if tracer.enabled:
+                    tracer.warning(f"Блок {block_index + 1} закончился без EOB.")
+
+            if pos * 8 - nbits > total_bits:
+                raise EOFError(f"Неожиданный конец потока в блоке {block_index + 1}.")
+            decoded = block_index + 1
+    except EOFError as e:
+        tracer.warning(f"Ошибка конца потока при декодировании блока {decoded + 1}: {e}. Декодировано {decoded} блоков.")
+    except (ValueError, OverflowError) as e:
+        tracer.warning(f"Ошибка значения при декодировании блока {decoded + 1}: {e}")
+    flat.release()
+    if decoded < num_blocks:
+        out[decoded:num_blocks] = 0
+    return out[:decoded]
@@ -0,0 +1,357 @@
+import argparse
+import hashlib
+import io
+import json
+import mmap
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+import instrumentation
+from jpeg_compressor import compress_array, write_compressed_data, GRAYSCALE_MODES
+from jpeg_decompressor import parse_compressed_data, decode_components
+
+try:
+    import constants
+except ImportError:
+    class DefaultConstants:
+        Bites_for_param = 4
+        ByteOrder = 'big'
+        Channels = 3
+    constants = DefaultConstants()
+    print("Предупреждение: Файл constants.py не найден, используются значения по умолчанию.", file=sys.stderr)
+
+
+# Архив многих сжатых изображений в одном файле:
+#   [b'MYJPAR'][версия, 1 байт]
+#   записи: [длина заголовка][заголовок JSON][поток Y][поток Cb][поток Cr]
+#   раздел таблиц JSON: {id: {ключ таблицы: значение}} - общие для записей матрицы
+#       квантования и таблицы Хаффмана (в файле MYJPEG они повторяются в каждом заголовке)
+#   индекс JSON: {"entries": [[имя, смещение, длина, ширина, высота], ...]}, по возрастанию имени
+#   хвост: смещение и длина раздела таблиц, смещение и длина индекса (по 8 байт), b'MYJPAR'
+# Заголовок записи - метаданные MYJPEG без общих таблиц и с ключом "tables" (id набора таблиц).
+# Длина заголовка записи занимает constants.Bites_for_param байт, как в MYJPEG.
+# Добавление записей дописывает их после хвоста, а в close() - новые таблицы, индекс
+# и хвост (как центральный каталог zip); повторное имя заменяет запись в индексе.
+# Старые таблицы, индекс и хвост остаются в файле: если добавление прервано до close(),
+# читатель находит последний целый хвост (_locate_footer) и видит архив до добавления.
+
+ARCHIVE_MAGIC = b'MYJPAR'
+ARCHIVE_VERSION = 1
+_FOOTER = len(ARCHIVE_MAGIC) + 4 * 8
+_FOOTER_FIELD = 8
+
+SHARED_METADATA_KEYS = (
+    "q_table_y", "q_table_c",
+    "huff_dc_y_bits", "huff_dc_y_huffval", "huff_ac_y_bits", "huff_ac_y_huffval",
+    "huff_dc_c_bits", "huff_dc_c_huffval", "huff_ac_c_bits", "huff_ac_c_huffval",
+)
+
+
+def _tables_id(tables):
+    canonical = json.dumps(tables, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(canonical).hexdigest()[:16]
+
+
+def _read_footer(tail, file_size):
+    """Разбирает хвост архива. Возвращает (tables_offset, tables_len, index_offset, index_len)."""
+    if len(tail) != _FOOTER or tail[-len(ARCHIVE_MAGIC):] != ARCHIVE_MAGIC:
+        raise ValueError("Неверный формат архива (не найден хвост 'MYJPAR').")
+    fields = [int.from_bytes(tail[i * _FOOTER_FIELD:(i + 1) * _FOOTER_FIELD], constants.ByteOrder) for i in range(4)]
+    tables_offset, tables_len, index_offset, index_len = fields
+    if not (len(ARCHIVE_MAGIC) + 1 <= tables_offset <= tables_offset + tables_len <= index_offset
+            and index_offset + index_len <= file_size - _FOOTER):
+        raise ValueError("Поврежден хвост архива: смещения разделов вне файла.")
+    return tables_offset, tables_len, index_offset, index_len
+
+
+def _locate_footer(buffer, size):
+    """
+    Находит последний целый хвост архива в buffer (mmap): обычно он в конце файла,
+    после прерванного добавления за ним остаются недописанные записи. Хвост считается
+    целым, если его разделы проходят проверку и индекс заканчивается прямо перед ним.
+
+    Возвращает:
+        tuple: (footer_end, tables_offset, tables_len, index_offset, index_len).
+    """
+    end = size
+    while end >= len(ARCHIVE_MAGIC) + 1 + _FOOTER:
+        try:
+            fields = _read_footer(bytes(buffer[end - _FOOTER:end]), end)
+        except ValueError:
+            fields = None
+        if fields is not None and fields[2] + fields[3] == end - _FOOTER:
+            return (end,) + fields
+        end = buffer.rfind(ARCHIVE_MAGIC, 0, end - 1) + len(ARCHIVE_MAGIC)
+    raise ValueError("Неверный формат архива (не найден хвост 'MYJPAR').")
+
+
+def _parse_index(index_bytes):
+    entries = json.loads(bytes(index_bytes).decode('utf-8'))["entries"]
+    return {name: (offset, length, width, height) for name, offset, length, width, height in entries}
+
+
+class ImageArchive:
+    """
+    Чтение архива через mmap: открытие читает только хвост, раздел таблиц и индекс,
+    любая запись доступна без просмотра остальных. Потоки компонентов - memoryview
+    поверх отображения файла и действительны до close().
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < len(ARCHIVE_MAGIC) + 1 + _FOOTER:
+                raise ValueError("Файл слишком мал для архива MYJPAR.")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+            if self._view[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+                raise ValueError("Неверный формат архива (не найден 'MYJPAR').")
+            if self._view[len(ARCHIVE_MAGIC)] != ARCHIVE_VERSION:
+                raise ValueError(f"Неподдерживаемая версия архива: {self._view[len(ARCHIVE_MAGIC)]}")
+            _, tables_offset, tables_len, index_offset, index_len = _locate_footer(self._mmap, size)
+            self._tables = json.loads(bytes(self._view[tables_offset:tables_offset + tables_len]).decode('utf-8'))
+            self._index = _parse_index(self._view[index_offset:index_offset + index_len])
+            self._names = sorted(self._index)
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def names(self):
+        """Имена записей по возрастанию."""
+        return list(self._names)
+
+    def info(self, name):
+        """Положение и размеры записи: {'offset', 'length', 'width', 'height'}. KeyError для неизвестного имени."""
+        offset, length, width, height = self._index[name]
+        return {'offset': offset, 'length': length, 'width': width, 'height': height}
+
+    def read_components(self, name):
+        """
+        Возвращает (metadata, y_data, cb_data, cr_data) записи, как parse_compressed_data:
+        метаданные дополнены общими таблицами, потоки - memoryview поверх архива.
+        """
+        offset, length, _, _ = self._index[name]
+        entry = self._view[offset:offset + length]
+        header_len = int.from_bytes(entry[:constants.Bites_for_param], constants.ByteOrder)
+        pos = constants.Bites_for_param + header_len
+        metadata = json.loads(bytes(entry[constants.Bites_for_param:pos]).decode('utf-8'))
+        metadata.update(self._tables[metadata.pop("tables")])
+        payloads = []
+        for key in ("data_len_y", "data_len_cb", "data_len_cr"):
+            payloads.append(entry[pos:pos + metadata[key]])
+            pos += metadata[key]
+        if pos != length:
+            raise ValueError(f"Запись {name!r} повреждена: длины потоков не совпадают с длиной записи.")
+        return metadata, payloads[0], payloads[1], payloads[2]
+
+    def read_bytes(self, name):
+        """Возвращает запись в виде самостоятельного файла MYJPEG (bytes)."""
+        metadata, y_data, cb_data, cr_data = self.read_components(name)
+        buffer = io.BytesIO()
+        write_compressed_data(buffer, metadata, y_data, cb_data, cr_data)
+        return buffer.getvalue()
+
+    def decompress(self, name, tracer=None):
+        """
+        Декодирует запись в RGB массив без копирования потоков (как decompress_bytes).
+
+        Возвращает:
+            np.ndarray: RGB изображение (height, width, 3), uint8, или None при ошибке.
+        """
+        tracer = instrumentation.resolve_tracer(tracer)
+        with tracer.stage('decompress', path=f"{self.path}:{name}"):
+            with tracer.stage('load'):
+                try:
+                    metadata, y_data, cb_data, cr_data = self.read_components(name)
+                except KeyError as e:
+                    tracer.error(f"Ошибка: запись {name!r} не найдена в архиве {self.path}", exception=e)
+                    return None
+                except (ValueError, json.JSONDecodeError) as e:
+                    tracer.error(f"Ошибка формата записи {name!r}: {e}", exception=e)
+                    return None
+            return decode_components(metadata, y_data, cb_data, cr_data, tracer=tracer)
+
+    def close(self):
+        """Закрывает отображение и файл. Ранее возвращенные memoryview становятся недействительными."""
+        view = getattr(self, '_view', None)
+        if view is not None:
+            try:
+                view.release()
+            except BufferError:
+                pass
+            self._view = None
+        if getattr(self, '_mmap', None) is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # на отображение еще ссылаются потоки записей; оно закроется вместе с ними
+                pass
+            self._mmap = None
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
+            self._file = None
+
+
+class ArchiveWriter:
+    """
+    Запись архива. В режиме append новые записи дописываются после хвоста существующего
+    архива, а таблицы, индекс и новый хвост записываются в close(): до этого архив
+    читается в прежнем виде, в том числе если запись прервана. Недописанные записи
+    прерванного добавления отбрасываются при следующем открытии в режиме append.
+    """
+    def __init__(self, path, append=False):
+        self.path = path
+        self._tables = {}
+        self._index = {}
+        if append and os.path.exists(path):
+            self._file = open(path, 'r+b')
+            try:
+                size = os.fstat(self._file.fileno()).st_size
+                self._file.seek(0)
+                head = self._file.read(len(ARCHIVE_MAGIC) + 1)
+                if head != ARCHIVE_MAGIC + bytes([ARCHIVE_VERSION]) or size < len(head) + _FOOTER:
+                    raise ValueError("Неверный формат или версия архива.")
+                with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    footer_end, tables_offset, tables_len, index_offset, index_len = _locate_footer(view, size)
+                    self._tables = json.loads(view[tables_offset:tables_offset + tables_len].decode('utf-8'))
+                    self._index = _parse_index(view[index_offset:index_offset + index_len])
+                # недописанные записи прерванного добавления не попали в индекс
+                self._file.truncate(footer_end)
+                self._file.seek(footer_end)
+            except Exception:
+                self._file.close()
+                raise
+        else:
+            self._file = open(path, 'wb')
+            self._file.write(ARCHIVE_MAGIC + bytes([ARCHIVE_VERSION]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, name, data):
+        """
+        Добавляет сжатое изображение (содержимое файла MYJPEG) под именем name.
+
+        Возвращает:
+            int: Длина записи в архиве.
+        """
+        error_collector = instrumentation.ErrorCollector()
+        metadata, y_data, cb_data, cr_data = parse_compressed_data(data, tracer=error_collector)
+        if metadata is None:
+            raise ValueError(f"Не удалось разобрать сжатые данные {name!r}: {'; '.join(error_collector.errors)}")
+        if len(y_data) != metadata["data_len_y"] or len(cb_data) != metadata["data_len_cb"] \
+                or len(cr_data) != metadata["data_len_cr"]:
+            raise ValueError(f"Сжатые данные {name!r} обрезаны.")
+
+        tables = {key: metadata[key] for key in SHARED_METADATA_KEYS}
+        tables_id = _tables_id(tables)
+        self._tables.setdefault(tables_id, tables)
+        header = {key: value for key, value in metadata.items() if key not in SHARED_METADATA_KEYS}
+        header["tables"] = tables_id
+        header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+
+        offset = self._file.tell()
+        self._file.write(len(header_bytes).to_bytes(constants.Bites_for_param, constants.ByteOrder))
+        self._file.write(header_bytes)
+        self._file.write(y_data)
+        self._file.write(cb_data)
+        self._file.write(cr_data)
+        length = self._file.tell() - offset
+        self._index[name] = (offset, length, metadata["original_width"], metadata["original_height"])
+        return length
+
+    def add_image(self, name, image, **compress_kwargs):
+        """Сжимает RGB массив (аргументы как у compress_array) и добавляет его под именем name."""
+        data = compress_array(image, **compress_kwargs)
+        if data is None:
+            raise ValueError(f"Не удалось сжать изображение {name!r}.")
+        return self.add(name, data)
+
+    def close(self):
+        """Записывает раздел таблиц, индекс и хвост и закрывает файл."""
+        if self._file is None:
+            return
+        tables_bytes = json.dumps(self._tables, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        entries = [[name, *self._index[name]] for name in sorted(self._index)]
+        index_bytes = json.dumps({"entries": entries}, separators=(',', ':')).encode('utf-8')
+
+        tables_offset = self._file.tell()
+        self._file.write(tables_bytes)
+        index_offset = self._file.tell()
+        self._file.write(index_bytes)
+        for value in (tables_offset, len(tables_bytes), index_offset, len(index_bytes)):
+            self._file.write(value.to_bytes(_FOOTER_FIELD, constants.ByteOrder))
+        self._file.write(ARCHIVE_MAGIC)
+        self._file.truncate()
+        self._file.close()
+        self._file = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Архив сжатых изображений MYJPAR.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="Сжать изображения или добавить файлы MYJPEG в архив.")
+    pack.add_argument("archive")
+    pack.add_argument("inputs", nargs="+", help="Изображения (PNG, BMP, ...) или файлы MYJPEG.")
+    pack.add_argument("-q", "--quality", type=int, default=75)
+    pack.add_argument("-a", "--append", action="store_true", help="Добавить к существующему архиву.")
+    listing = commands.add_parser("list", help="Список записей архива.")
+    listing.add_argument("archive")
+    extract = commands.add_parser("extract", help="Декодировать запись в файл изображения.")
+    extract.add_argument("archive")
+    extract.add_argument("name")
+    extract.add_argument("output")
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        with ArchiveWriter(args.archive, append=args.append) as writer:
+            for path in args.inputs:
+                name = os.path.basename(path)
+                with open(path, 'rb') as f:
+                    data = f.read()
+                if data.startswith(b'MYJPEG'):
+                    writer.add(name, data)
+                else:
+                    with Image.open(io.BytesIO(data)) as img:
+                        writer.add_image(name, np.array(img.convert('L' if img.mode in GRAYSCALE_MODES else 'RGB')),
+                                         quality=args.quality)
+        print(f"Архив {args.archive}: {os.path.getsize(args.archive)} байт")
+        return 0
+
+    with ImageArchive(args.archive) as archive:
+        if args.command == "list":
+            for name in archive.names():
+                info = archive.info(name)
+                print(f"{name}\t{info['width']}x{info['height']}\t{info['length']} байт")
+            return 0
+        error_collector = instrumentation.ErrorCollector()
+        final_rgb = archive.decompress(args.name, tracer=error_collector)
+        if final_rgb is None:
+            for message in error_collector.errors:
+                print(message, file=sys.stderr)
+            return 1
+        Image.fromarray(final_rgb).save(args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
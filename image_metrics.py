@@ -0,0 +1,40 @@
+import numpy as np
+
+
+def mse(original, reconstructed):
+    """
+    Вычисляет среднеквадратичную ошибку между двумя изображениями одинакового размера.
+
+    Аргументы:
+        original (np.ndarray): Исходное изображение (например, RGB, uint8).
+        reconstructed (np.ndarray): Восстановленное изображение той же формы.
+
+    Возвращает:
+        float: Среднеквадратичная ошибка.
+    """
+    if original.shape != reconstructed.shape:
+        raise ValueError(f"Размеры изображений не совпадают: {original.shape} и {reconstructed.shape}")
+    diff = original.astype(np.float64) - reconstructed.astype(np.float64)
+    return float(np.mean(diff * diff))
+
+
+def psnr(original, reconstructed, peak=255.0):
+    """
+    Вычисляет пиковое отношение сигнал/шум (PSNR) в децибелах.
+
+    Аргументы:
+        original (np.ndarray): Исходное изображение.
+        reconstructed (np.ndarray): Восстановленное изображение той же формы.
+        peak (float): Максимально возможное значение пикселя.
+
+    Возвращает:
+        float: PSNR в дБ (float('inf') для идентичных изображений).
+    """
+    return psnr_from_mse(mse(original, reconstructed), peak)
+
+
+def psnr_from_mse(mse_value, peak=255.0):
+    """Переводит среднеквадратичную ошибку в PSNR (дБ)."""
+    if mse_value <= 0:
+        return float('inf')
+    return float(10.0 * np.log10(peak * peak / mse_value))
@@ -0,0 +1,225 @@
+import sys
+import time
+import cProfile
+import pstats
+import io
+
+
+class _NullStage:
+    """Пустой контекст этапа, используемый молчаливым трассировщиком."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """Контекст этапа: замеряет время и сообщает трассировщику о начале и конце."""
+    def __init__(self, tracer, stage, fields):
+        self._tracer = tracer
+        self._stage = stage
+        self._fields = fields
+        self._start = 0.0
+
+    def __enter__(self):
+        self._tracer.stage_start(self._stage, **self._fields)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        elapsed = time.perf_counter() - self._start
+        self._tracer.stage_end(self._stage, elapsed, **self._fields)
+        return False
+
+
+class Tracer:
+    """
+    Базовый приёмник структурированных событий конвейера кодека.
+
+    События:
+        stage_start(stage, **fields)           - начало этапа (например, 'dct_quant', component='Y').
+        stage_end(stage, elapsed, **fields)    - конец этапа, elapsed - время в секундах.
+        counter(name, value, **fields)         - счетчик: байты, блоки и т.п.
+        warning(message, **fields)             - предупреждение (некорректные данные и т.п.).
+        error(message, **fields)               - ошибка, после которой операция прерывается.
+
+    Подклассы переопределяют нужные методы. Атрибут enabled = False сообщает коду
+    конвейера, что события можно не формировать вовсе (нулевые накладные расходы).
+    """
+    enabled = True
+
+    def stage(self, stage, **fields):
+        """Возвращает контекстный менеджер, оборачивающий этап stage."""
+        return _Stage(self, stage, fields)
+
+    def stage_start(self, stage, **fields):
+        pass
+
+    def stage_end(self, stage, elapsed, **fields):
+        pass
+
+    def counter(self, name, value, **fields):
+        pass
+
+    def warning(self, message, **fields):
+        pass
+
+    def error(self, message, **fields):
+        """Ошибки по умолчанию всегда выводятся в stderr, даже в тихом режиме."""
+        print(message, file=sys.stderr)
+
+
+class NullTracer(Tracer):
+    """Молчаливый трассировщик по умолчанию: игнорирует все события, кроме ошибок."""
+    enabled = False
+
+    def stage(self, stage, **fields):
+        return _NULL_STAGE
+
+
+NULL_TRACER = NullTracer()
+
+
+class ErrorCollector(NullTracer):
+    """Молчаливый трассировщик, запоминающий сообщения об ошибках в self.errors вместо печати."""
+    def __init__(self):
+        self.errors = []
+
+    def error(self, message, **fields):
+        self.errors.append(message)
+
+
+def resolve_tracer(tracer):
+    """Возвращает tracer или молчаливый трассировщик, если tracer равен None."""
+    return NULL_TRACER if tracer is None else tracer
+
+
+def _format_fields(fields):
+    return " ".join(f"{key}={value}" for key, value in fields.items())
+
+
+class ConsoleTracer(Tracer):
+    """Печатает события в текстовом виде (подробный режим, как раньше делали print)."""
+    def __init__(self, stream=None):
+        self._stream = stream
+
+    def _print(self, text):
+        print(text, file=self._stream if self._stream is not None else sys.stdout)
+
+    def stage_start(self, stage, **fields):
+        self._print(f"[{stage}] начало {_format_fields(fields)}".rstrip())
+
+    def stage_end(self, stage, elapsed, **fields):
+        self._print(f"[{stage}] конец за {elapsed * 1000:.2f} мс {_format_fields(fields)}".rstrip())
+
+    def counter(self, name, value, **fields):
+        self._print(f"  {name}: {value} {_format_fields(fields)}".rstrip())
+
+    def warning(self, message, **fields):
+        self._print(f"Предупреждение: {message}")
+
+    def error(self, message, **fields):
+        print(message, file=sys.stderr)
+        exception = fields.get('exception')
+        if exception is not None:
+            import traceback
+            traceback.print_exception(type(exception), exception, exception.__traceback__)
+
+
+class RecordingTracer(Tracer):
+    """Сохраняет все события в список словарей self.events (удобно для тестов и логирования)."""
+    def __init__(self):
+        self.events = []
+
+    def stage_start(self, stage, **fields):
+        self.events.append({'event': 'stage_start', 'stage': stage, 'time': time.perf_counter(), **fields})
+
+    def stage_end(self, stage, elapsed, **fields):
+        self.events.append({'event': 'stage_end', 'stage': stage, 'elapsed': elapsed, **fields})
+
+    def counter(self, name, value, **fields):
+        self.events.append({'event': 'counter', 'name': name, 'value': value, **fields})
+
+    def warning(self, message, **fields):
+        self.events.append({'event': 'warning', 'message': message, **fields})
+
+    def error(self, message, **fields):
+        self.events.append({'event': 'error', 'message': message, **fields})
+        super().error(message, **fields)
+
+
+class PerfCounterCollector(Tracer):
+    """
+    Собирает поэтапную статистику по time.perf_counter:
+    количество вызовов и суммарное время каждого этапа, суммы счетчиков, число предупреждений.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.warnings = 0
+
+    def stage_end(self, stage, elapsed, **fields):
+        calls, total = self.stages.get(stage, (0, 0.0))
+        self.stages[stage] = (calls + 1, total + elapsed)
+
+    def counter(self, name, value, **fields):
+        component = fields.get('component')
+        key = name if component is None else f"{name}[{component}]"
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def warning(self, message, **fields):
+        self.warnings += 1
+
+    def as_dict(self):
+        """Возвращает собранную статистику в виде словаря (для JSON)."""
+        return {
+            'stages': {name: {'calls': calls, 'seconds': total} for name, (calls, total) in self.stages.items()},
+            'counters': dict(self.counters),
+            'warnings': self.warnings,
+        }
+
+    def report(self, stream=None):
+        """Записывает таблицу с разбивкой времени по этапам в stream (по умолчанию stdout)."""
+        stream = stream if stream is not None else sys.stdout
+        stream.write(f"{'Этап':<24}{'Вызовов':>10}{'Всего, мс':>14}{'Среднее, мс':>14}\n")
+        for name, (calls, total) in sorted(self.stages.items(), key=lambda item: -item[1][1]):
+            stream.write(f"{name:<24}{calls:>10}{total * 1000:>14.2f}{total * 1000 / calls:>14.3f}\n")
+        for key, value in self.counters.items():
+            stream.write(f"{key}: {value}\n")
+        if self.warnings:
+            stream.write(f"Предупреждений: {self.warnings}\n")
+
+
+class ProfileCollector(PerfCounterCollector):
+    """
+    Дополняет PerfCounterCollector профилированием cProfile: профилировщик включается
+    на время самого внешнего этапа, а report() добавляет к разбивке по этапам
+    top_n самых затратных функций.
+    """
+    def __init__(self, top_n=20):
+        super().__init__()
+        self.profile = cProfile.Profile()
+        self.top_n = top_n
+        self._depth = 0
+
+    def stage_start(self, stage, **fields):
+        if self._depth == 0:
+            self.profile.enable()
+        self._depth += 1
+
+    def stage_end(self, stage, elapsed, **fields):
+        super().stage_end(stage, elapsed, **fields)
+        self._depth -= 1
+        if self._depth == 0:
+            self.profile.disable()
+
+    def report(self, stream=None):
+        stream = stream if stream is not None else sys.stdout
+        super().report(stream)
+        buffer = io.StringIO()
+        pstats.Stats(self.profile, stream=buffer).sort_stats('cumulative').print_stats(self.top_n)
+        stream.write(buffer.getvalue())
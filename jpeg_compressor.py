@@ -1,8 +1,10 @@
 import numpy as np
 from PIL import Image
 import json
+import io
 import math
 import sys
+import base64
 
 import rgb_to_ycbcr
 import downsample_channel
@@ -10,11 +12,15 @@ import split_into_blocks
 import dct_2d
 import adjust_quantization_matrix
 import quantization
+import rdo_quantization
 import zigzag_scan
-import dc_differential_coding
-import rle_ac_coding
-import vli_coding
+import coefficient_store
 import huffman_coding
+import entropy_coding
+import progressive_coding
+import instrumentation
+import block_cache as block_cache_module
+import entropy_statistics
 
 try:
     import constants
@@ -49,140 +55,691 @@ BASE_Q_CHROMINANCE = np.array([
     [99, 99, 99, 99, 99, 99, 99, 99]
 ], dtype=np.uint8)
 
-def save_compressed_data(filepath, metadata, y_data, cb_data, cr_data):
+# Режимы Pillow, которые сжимаются как одна плоскость яркости без преобразования в RGB.
+GRAYSCALE_MODES = ('1', 'L', 'LA', 'I', 'I;16', 'F')
+
+# Поддерживаемые размеры блока DCT. Категории DC и символы AC блоков 16x16 выходят
+# за алфавит стандартных таблиц, поэтому для них таблицы Хаффмана строятся по статистике
+# изображения (huffman_coding.optimal_table_spec) и записываются в заголовок.
+SUPPORTED_BLOCK_SIZES = (8, 16)
+
+# Макроблок режима adaptive_blocks: кодируется одним блоком 16x16 или четырьмя блоками 8x8.
+MACROBLOCK_SIZE = 16
+
+# Множитель λ при выборе размера блока и число уточнений таблиц для оценки битов
+# (см. _choose_block_sizes).
+DEFAULT_ADAPTIVE_LAMBDA_SCALE = 1.0
+ADAPTIVE_PASSES = 2
+
+def write_compressed_data(fileobj, metadata, y_data, cb_data, cr_data, tracer=None):
+    """
+    Записывает метаданные и сжатые байтовые потоки в открытый двоичный поток.
+
+    Аргументы:
+        fileobj: Объект с методом write(bytes) (файл, io.BytesIO, сокет и т.п.).
+        metadata (dict): Метаданные контейнера.
+        y_data, cb_data, cr_data (bytes-like): Сжатые потоки компонентов.
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+
+    Возвращает:
+        int: Количество записанных байт.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    metadata_bytes = json.dumps(metadata, indent=4).encode('utf-8')
+    header_len = len(metadata_bytes)
+
+    fileobj.write(b'MYJPEG')
+    fileobj.write(header_len.to_bytes(constants.Bites_for_param, constants.ByteOrder))
+    fileobj.write(metadata_bytes)
+    fileobj.write(y_data)
+    fileobj.write(cb_data)
+    fileobj.write(cr_data)
+
+    total_size = len(b'MYJPEG') + constants.Bites_for_param + header_len + len(y_data) + len(cb_data) + len(cr_data)
+    if tracer.enabled:
+        orig_pixels = metadata['original_width'] * metadata['original_height'] * metadata.get('components', 3)
+        tracer.counter('header_bytes', header_len)
+        tracer.counter('file_bytes', total_size, ratio=orig_pixels / total_size)
+    return total_size
+
+def save_compressed_data(filepath, metadata, y_data, cb_data, cr_data, tracer=None):
     """Сохраняет метаданные и сжатые байтовые потоки в файл."""
+    tracer = instrumentation.resolve_tracer(tracer)
     try:
-        metadata_bytes = json.dumps(metadata, indent=4).encode('utf-8')
-        header_len = len(metadata_bytes)
-
-        with open(filepath, 'wb') as f:
-            f.write(b'MYJPEG')
-            f.write(header_len.to_bytes(constants.Bites_for_param, constants.ByteOrder))
-            f.write(metadata_bytes)
-            f.write(y_data)
-            f.write(cb_data)
-            f.write(cr_data)
-        print(f"Сжатые данные сохранены в {filepath}")
-        print(f"Размер метаданных: {header_len} байт")
-        print(f"Размер данных Y: {len(y_data)} байт")
-        print(f"Размер данных Cb: {len(cb_data)} байт")
-        print(f"Размер данных Cr: {len(cr_data)} байт")
-        total_size = len(b'MYJPEG') + constants.Bites_for_param + header_len + len(y_data) + len(cb_data) + len(cr_data)
-        print(f"Общий размер файла: {total_size} байт")
-        orig_pixels = metadata['original_width'] * metadata['original_height'] * 3
-        if orig_pixels > 0:
-             ratio = orig_pixels / total_size
-             print(f"Степень сжатия (приближенно): {ratio:.2f}x")
+        with tracer.stage('save', path=filepath):
+            with open(filepath, 'wb') as f:
+                write_compressed_data(f, metadata, y_data, cb_data, cr_data, tracer=tracer)
 
     except IOError as e:
-        print(f"Ошибка записи файла {filepath}: {e}", file=sys.stderr)
+        tracer.error(f"Ошибка записи файла {filepath}: {e}", exception=e)
     except Exception as e:
-        print(f"Неожиданная ошибка при сохранении файла: {e}", file=sys.stderr)
+        tracer.error(f"Неожиданная ошибка при сохранении файла: {e}", exception=e)
 
-def compress_image(image_path, output_path, quality=75, block_size=8):
+def compress_image(image_path, output_path, quality=75, block_size=8, tracer=None, distortion=None,
+                   progressive=False, entropy_coder='huffman', rdo=False, block_cache=None, session=None,
+                   entropy_stats=None, adaptive_blocks=False):
     """
     Выполняет сжатие изображения из стандартного формата (PNG, BMP, и т.д.)
     по алгоритму, похожему на JPEG Baseline.
+
+    При progressive (True, 'refine' или свой скрипт сканов, см. progressive_coding)
+    коэффициенты записываются последовательностью сканов: сначала DC всех компонентов,
+    затем полосы AC. Любой префикс такого файла декодируется в предварительное изображение,
+    полный файл декодируется в точности как базовый.
+
+    Ход работы (этапы, время, размеры) сообщается объекту tracer
+    (см. instrumentation.Tracer); по умолчанию сжатие выполняется молча.
+    Если передан distortion (distortion_estimate.DistortionEstimator), кодер заполняет
+    его оценкой искажений по коэффициентам DCT, без декодирования.
+    entropy_coder выбирает энтропийный кодер (см. entropy_coding): 'huffman' или 'rans'.
+    При rdo уровни AC выбираются минимизацией искажение + λ·биты (rdo_quantization);
+    число вместо True задает множитель λ. Биты считаются по таблицам Хаффмана, формат
+    файла не меняется.
+    С block_cache (block_cache.BlockCache) одинаковые по байтам блоки квантуются один раз.
+    Кэш выгоден для скриншотов, сканов документов и их серий (один кэш на серию); на
+    фотографиях повторов почти нет и поиск в кэше только замедляет квантование, поэтому
+    по умолчанию (None или False) кэш не используется. Попадания и промахи сообщаются
+    счетчиками 'block_cache_hits' и 'block_cache_misses'. В режиме rdo кэш не используется.
+    Изображения в оттенках серого (режимы GRAYSCALE_MODES, а также RGB с R = G = B во всех
+    пикселях) сжимаются с одним компонентом Y: плоскости Cb и Cr не строятся и не кодируются,
+    декодер возвращает для такого файла одноканальный массив.
+    Сессия session (codec_session.Encoder) хранит таблицы и буферы между вызовами.
+    Если передан entropy_stats (entropy_statistics.EntropyStatistics), кодер добавляет в него
+    гистограммы символов и разбивку битов каждого компонента.
+    block_size - 8 или 16. Для блоков 16x16 матрицы квантования растягиваются из матриц 8x8
+    (adjust_quantization_matrix.scale_to_block_size), а таблицы Хаффмана строятся
+    по статистике изображения и записываются в файл.
+    При adaptive_blocks (True или множитель λ, только с block_size=8) каждый макроблок 16x16
+    кодируется одним блоком 16x16 или четырьмя блоками 8x8 - что дешевле по искажение + λ·биты:
+    плавные области занимают меньше места. Выбор записывается в метаданных "large_blocks".
+    Блоки 16x16 несовместимы с progressive, rdo и кодером 'rans'.
     """
-    print(f"Начало сжатия '{image_path}' с качеством {quality}...")
+    tracer = instrumentation.resolve_tracer(tracer)
+    with tracer.stage('compress', path=image_path, quality=quality):
+        try:
+            with tracer.stage('read'):
+                img = Image.open(image_path)
+                if img.mode in GRAYSCALE_MODES:
+                    img = img.convert('L')
+                elif img.mode != 'RGB':
+                     img = img.convert('RGB')
+                pixels = np.array(img)
 
-    try:
-        img = Image.open(image_path)
-        if img.mode != 'RGB':
-             print(f"Конвертация изображения из режима '{img.mode}' в 'RGB'...")
-             img = img.convert('RGB')
+        except FileNotFoundError as e:
+            tracer.error(f"Ошибка: Файл не найден {image_path}", exception=e)
+            return
+        except Exception as e:
+            tracer.error(f"Ошибка при чтении или подготовке изображения: {e}", exception=e)
+            return
 
-        img_rgb = np.array(img)
-        original_height, original_width, num_channels = img_rgb.shape
+        encoded = _encode_array(pixels, quality, block_size, tracer, distortion, progressive, entropy_coder, rdo,
+                              block_cache, session, entropy_stats, adaptive_blocks)
+        if encoded is None:
+            return
+        metadata, components_data = encoded
 
-        if num_channels != 3:
-            raise ValueError(f"Ожидалось 3 канала RGB, получено {num_channels}")
+        save_compressed_data(
+            output_path,
+            metadata,
+            components_data['Y'],
+            components_data['Cb'],
+            components_data['Cr'],
+            tracer=tracer
+        )
 
-        print(f"Исходный размер: {original_width}x{original_height}")
 
-    except FileNotFoundError:
-        print(f"Ошибка: Файл не найден {image_path}", file=sys.stderr)
-        return
-    except Exception as e:
-        print(f"Ошибка при чтении или подготовке изображения: {e}", file=sys.stderr)
-        return
-
-    print("Преобразование в YCbCr...")
-    img_ycbcr = rgb_to_ycbcr.rgb_to_ycbcr(img_rgb)
-    y_channel  = img_ycbcr[:, :, 0]
-    cb_channel = img_ycbcr[:, :, 1]
-    cr_channel = img_ycbcr[:, :, 2]
-
-    print("Даунсэмплинг Cb и Cr...")
-    cb_downsampled = downsample_channel.downsample_channel_420(cb_channel)
-    cr_downsampled = downsample_channel.downsample_channel_420(cr_channel)
-    print(f"  Размер Y : {y_channel.shape}")
-    print(f"  Размер Cb (DS): {cb_downsampled.shape}")
-    print(f"  Размер Cr (DS): {cr_downsampled.shape}")
-
-    print("Подготовка таблиц квантования и Хаффмана...")
-    q_matrix_y = adjust_quantization_matrix.adjust_quantization_matrix(BASE_Q_LUMINANCE, quality)
-    q_matrix_c = adjust_quantization_matrix.adjust_quantization_matrix(BASE_Q_CHROMINANCE, quality)
+def compress_to_stream(image, fileobj, quality=75, block_size=8, tracer=None, distortion=None,
+                       progressive=False, entropy_coder='huffman', rdo=False, block_cache=None, session=None,
+                       entropy_stats=None, adaptive_blocks=False):
+    """
+    Сжимает изображение, заданное массивом, и записывает результат в двоичный поток
+    без обращения к файловой системе.
+
+    Аргументы:
+        image (np.ndarray): RGB изображение (height, width, 3) или оттенки серого (height, width), uint8.
+        fileobj: Объект с методом write(bytes).
+        quality (int): Уровень качества от 1 до 100.
+        block_size (int): Размер блока (8 или 16).
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+        distortion (distortion_estimate.DistortionEstimator, optional): Приемник оценки искажений.
+        progressive (bool | str | list): Прогрессивный режим (см. compress_image).
+        entropy_coder (str): Энтропийный кодер (см. compress_image).
+        rdo (bool | float): Квантование с оптимизацией искажение/биты (см. compress_image).
+        block_cache (block_cache.BlockCache, optional): Кэш квантованных блоков (см. compress_image).
+        session (codec_session.Encoder, optional): Сессия с общими таблицами и буферами.
+        entropy_stats (entropy_statistics.EntropyStatistics, optional): Сборщик статистики
+            энтропийного кодирования.
+        adaptive_blocks (bool | float): Выбор блоков 8x8 / 16x16 по макроблокам (см. compress_image).
+
+    Возвращает:
+        int: Количество записанных байт или None при ошибке.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    with tracer.stage('compress', quality=quality):
+        try:
+            pixels = _as_pixel_array(image)
+        except (TypeError, ValueError) as e:
+            tracer.error(f"Ошибка при подготовке изображения: {e}", exception=e)
+            return None
+
+        encoded = _encode_array(pixels, quality, block_size, tracer, distortion, progressive, entropy_coder, rdo,
+                              block_cache, session, entropy_stats, adaptive_blocks)
+        if encoded is None:
+            return None
+        metadata, components_data = encoded
+
+        try:
+            with tracer.stage('save'):
+                return write_compressed_data(fileobj, metadata, components_data['Y'],
+                                             components_data['Cb'], components_data['Cr'], tracer=tracer)
+        except Exception as e:
+            tracer.error(f"Ошибка записи сжатых данных в поток: {e}", exception=e)
+            return None
+
+
+def compress_array(image, quality=75, block_size=8, tracer=None, distortion=None, progressive=False,
+                   entropy_coder='huffman', rdo=False, block_cache=None, session=None, entropy_stats=None,
+                   adaptive_blocks=False):
+    """
+    Сжимает изображение, заданное массивом, и возвращает содержимое сжатого файла.
+
+    Аргументы:
+        image (np.ndarray): RGB изображение (height, width, 3) или оттенки серого (height, width), uint8.
+        quality (int): Уровень качества от 1 до 100.
+        block_size (int): Размер блока (8 или 16).
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+        distortion (distortion_estimate.DistortionEstimator, optional): Приемник оценки искажений.
+        progressive (bool | str | list): Прогрессивный режим (см. compress_image).
+        entropy_coder (str): Энтропийный кодер (см. compress_image).
+        rdo (bool | float): Квантование с оптимизацией искажение/биты (см. compress_image).
+        block_cache (block_cache.BlockCache, optional): Кэш квантованных блоков (см. compress_image).
+        session (codec_session.Encoder, optional): Сессия с общими таблицами и буферами.
+        entropy_stats (entropy_statistics.EntropyStatistics, optional): Сборщик статистики
+            энтропийного кодирования.
+        adaptive_blocks (bool | float): Выбор блоков 8x8 / 16x16 по макроблокам (см. compress_image).
+
+    Возвращает:
+        bytes: Сжатые данные в формате MYJPEG или None при ошибке.
+    """
+    buffer = io.BytesIO()
+    if compress_to_stream(image, buffer, quality=quality, block_size=block_size, tracer=tracer,
+                          distortion=distortion, progressive=progressive, entropy_coder=entropy_coder, rdo=rdo,
+                          block_cache=block_cache, session=session, entropy_stats=entropy_stats,
+                          adaptive_blocks=adaptive_blocks) is None:
+        return None
+    return buffer.getvalue()
+
+
+def _as_pixel_array(image):
+    """
+    Проверяет входной массив: оттенки серого (height, width) возвращаются как есть,
+    из RGBA берутся каналы RGB, (height, width, 1) приводится к (height, width).
+    """
+    if not isinstance(image, np.ndarray):
+        raise TypeError("Изображение должно быть массивом NumPy.")
+    if image.dtype != np.uint8:
+        raise ValueError(f"Ожидался тип uint8, получен {image.dtype}")
+    if image.ndim == 2:
+        return image
+    if image.ndim == 3 and image.shape[2] == 1:
+        return image[:, :, 0]
+    if image.ndim != 3 or image.shape[2] not in (3, 4):
+        raise ValueError(f"Ожидалось изображение формы (height, width, 3), получено {image.shape}")
+    return image[:, :, :3]
+
 
+def _is_gray_rgb(img_rgb):
+    """Проверяет, что во всех пикселях RGB изображения R = G = B (цветоразностные плоскости нейтральны)."""
+    return np.array_equal(img_rgb[:, :, 0], img_rgb[:, :, 1]) and np.array_equal(img_rgb[:, :, 1], img_rgb[:, :, 2])
+
+
+def _resolve_coder(progressive, entropy_coder, block_size, tracer, large_blocks=False):
+    """
+    Проверяет параметры энтропийного кодирования. Блоки 16x16 (block_size=16 или
+    адаптивный выбор, large_blocks) проверяются до разбора скрипта сканов, чтобы
+    любая несовместимая комбинация получала одно и то же сообщение.
+
+    Возвращает:
+        tuple: (scan_script, backend) или None при ошибке (сообщается через tracer).
+    """
     try:
-        huff_dc_y = huffman_coding.HuffmanTable(huffman_coding.DEFAULT_DC_LUMINANCE_BITS, huffman_coding.DEFAULT_DC_LUMINANCE_HUFFVAL)
-        huff_ac_y = huffman_coding.HuffmanTable(huffman_coding.DEFAULT_AC_LUMINANCE_BITS, huffman_coding.DEFAULT_AC_LUMINANCE_HUFFVAL)
-        huff_dc_c = huffman_coding.HuffmanTable(huffman_coding.DEFAULT_DC_CHROMINANCE_BITS, huffman_coding.DEFAULT_DC_CHROMINANCE_HUFFVAL)
-        huff_ac_c = huffman_coding.HuffmanTable(huffman_coding.DEFAULT_AC_CHROMINANCE_BITS, huffman_coding.DEFAULT_AC_CHROMINANCE_HUFFVAL)
+        backend = entropy_coding.get_backend(entropy_coder)
     except ValueError as e:
-         print(f"Ошибка при создании таблиц Хаффмана из стандартных спецификаций: {e}", file=sys.stderr)
-         return
+        tracer.error(f"Ошибка выбора энтропийного кодера: {e}", exception=e)
+        return None
+    if (block_size != 8 or large_blocks) and (progressive or backend.name != 'huffman'):
+        tracer.error("Блоки 16x16 поддерживаются только базовым кодером 'huffman' без прогрессивного режима.")
+        return None
+
+    try:
+        scan_script = progressive_coding.resolve_scan_script(progressive, block_size * block_size)
+    except (TypeError, ValueError) as e:
+        tracer.error(f"Некорректный скрипт прогрессивных сканов: {e}", exception=e)
+        return None
+    if scan_script is not None and backend.name != 'huffman':
+        tracer.error(f"Прогрессивный режим поддерживает только кодер 'huffman', выбран '{backend.name}'.")
+        return None
+    return scan_script, backend
+
+
+class QuantizedImage:
+    """
+    Изображение между квантованием и энтропийным кодированием: размеры, матрицы
+    квантования, таблицы Хаффмана и квантованные коэффициенты компонентов
+    (coefficient_store). Объект передается между процессами (pickle), поэтому
+    первую и вторую половину сжатия можно выполнять в разных процессах
+    (см. quantize_array и encode_quantized).
+    """
+    def __init__(self, width, height, block_size, quality, q_matrix_y, q_matrix_c, huffman_tables,
+                 components, padded_dims, large_blocks=None):
+        """
+        Аргументы:
+            width, height (int): Размеры исходного изображения.
+            block_size (int): Размер блока N.
+            quality (int): Уровень качества.
+            q_matrix_y, q_matrix_c (np.ndarray): Матрицы квантования яркости и цветности.
+            huffman_tables (tuple): (huff_dc_y, huff_ac_y, huff_dc_c, huff_ac_c).
+            components (list[tuple]): [(имя, коэффициенты (n, N*N), dc_table, ac_table), ...].
+            padded_dims (dict): Имя компонента -> (h_pad, w_pad); (0, 0) для отсутствующих.
+            large_blocks (dict, optional): Для режима adaptive_blocks - макроблоки 16x16:
+                {'block_size', 'q_matrix_y', 'q_matrix_c', 'huffman_tables',
+                 'components': [(имя, коэффициенты (n, 256), dc_table, ac_table, флаги макроблоков), ...]}.
+        """
+        self.width = width
+        self.height = height
+        self.block_size = block_size
+        self.quality = quality
+        self.q_matrix_y = q_matrix_y
+        self.q_matrix_c = q_matrix_c
+        self.huffman_tables = huffman_tables
+        self.components = components
+        self.padded_dims = padded_dims
+        self.large_blocks = large_blocks
+
+    @property
+    def grayscale(self):
+        return len(self.components) == 1
+
+
+def _quantization_matrices(quality, block_size, session=None):
+    """Матрицы квантования яркости и цветности для качества quality и блока NxN."""
+    if session is not None:
+        return session.quantization_tables(quality, block_size)
+    return tuple(adjust_quantization_matrix.scale_to_block_size(
+                     adjust_quantization_matrix.adjust_quantization_matrix(base, quality), block_size)
+                 for base in (BASE_Q_LUMINANCE, BASE_Q_CHROMINANCE))
+
+
+def _statistics_tables(coefficient_groups):
+    """
+    Таблицы Хаффмана (dc_table, ac_table), оптимальные для символов, которые
+    huffman_encode_coefficients запишет для всех хранилищ из coefficient_groups.
+    EOB и ZRL включаются всегда: кодер требует их наличия в таблице AC.
+    """
+    dc_counts = np.zeros(entropy_statistics.NUM_CATEGORIES, dtype=np.int64)
+    ac_counts = np.zeros(entropy_statistics.NUM_AC_SYMBOLS, dtype=np.int64)
+    for coeffs in coefficient_groups:
+        if len(coeffs):
+            counts = entropy_statistics.symbol_counts(coeffs)
+            dc_counts += counts['dc_categories'][:len(dc_counts)]
+            ac_counts += counts['ac_symbols']
+    dc_counts[0] = max(dc_counts[0], 1)
+    for symbol in (entropy_statistics.EOB_SYMBOL, entropy_statistics.ZRL_SYMBOL):
+        ac_counts[symbol] = max(ac_counts[symbol], 1)
+    return (huffman_coding.HuffmanTable(*huffman_coding.optimal_table_spec(dc_counts)),
+            huffman_coding.HuffmanTable(*huffman_coding.optimal_table_spec(ac_counts)))
+
+
+def _block_bits(coeffs, dc_table, ac_table):
+    """
+    Биты каждого блока хранилища coeffs при кодировании huffman_encode_coefficients
+    с таблицами dc_table, ac_table: коды и VLI разности DC, символов AC, ZRL и EOB.
+    """
+    num_blocks, num_coeffs = coeffs.shape
+    dc_lengths = np.zeros(entropy_statistics.NUM_CATEGORIES, dtype=np.float64)
+    ac_lengths = np.zeros(entropy_statistics.NUM_AC_SYMBOLS, dtype=np.float64)
+    for lengths, table in ((dc_lengths, dc_table), (ac_lengths, ac_table)):
+        for symbol, (_, code_len) in table.encode_table.items():
+            lengths[symbol] = code_len
+
+    dc_categories = entropy_statistics.vli_categories(np.diff(coeffs[:, 0].astype(np.int64), prepend=0))
+    bits = dc_lengths[dc_categories] + dc_categories
+
+    blocks, positions = np.nonzero(coeffs[:, 1:])
+    categories = entropy_statistics.vli_categories(coeffs[:, 1:][blocks, positions])
+    previous = np.empty_like(positions)
+    previous[1:] = positions[:-1]
+    first_in_block = np.ones(len(positions), dtype=bool)
+    first_in_block[1:] = blocks[1:] != blocks[:-1]
+    previous[first_in_block] = -1
+    runs = positions - previous - 1
+    zrl_bits = ac_lengths[entropy_statistics.ZRL_SYMBOL]
+    symbol_bits = ac_lengths[((runs % 16) << 4) | categories] + categories + (runs // 16) * zrl_bits
+    bits += np.bincount(blocks, weights=symbol_bits, minlength=num_blocks)
+
+    trailing_zeros = num_coeffs - np.maximum(coefficient_store.eob_positions(coeffs), 1)
+    return bits + (trailing_zeros // 16) * zrl_bits + ac_lengths[entropy_statistics.EOB_SYMBOL]
+
+
+def _choose_block_sizes(channel, q_small, q_large, lam):
+    """
+    Квантует плоскость макроблоками MACROBLOCK_SIZE обоими способами и для каждого
+    выбирает размер блока с меньшей стоимостью D + λ·R: D - сумма квадратов ошибок
+    в пикселях (по равенству Парсеваля, с учетом множителя N/8 в dct_2d), R - биты
+    блоков с оптимальными таблицами Хаффмана (_block_bits). Таблицы сначала строятся
+    по всем блокам каждого размера, затем ADAPTIVE_PASSES - 1 раз по выбранным.
+    На плавных участках (градиенты, небо) один блок 16x16 передает то же изображение
+    меньшим числом DC, EOB и ненулевых коэффициентов, на текстуре дешевле блоки 8x8.
+
+    Аргументы:
+        channel (np.ndarray): Плоскость компонента uint8.
+        q_small, q_large (np.ndarray): Матрицы квантования блоков 8x8 и 16x16.
+        lam (float): Множитель Лагранжа λ.
+
+    Возвращает:
+        tuple: (коэффициенты блоков 8x8 (n_small, 64) и 16x16 (n_large, 256) в зигзаг-порядке,
+                флаги макроблоков (rows, cols) bool - True для блока 16x16,
+                сумма квадратов ошибок в пикселях, (h_pad, w_pad)).
+    """
+    mb = MACROBLOCK_SIZE
+    small = mb // 2
+    h, w = channel.shape
+    h_pad, w_pad = math.ceil(h / mb) * mb, math.ceil(w / mb) * mb
+    plane = np.pad(channel, ((0, h_pad - h), (0, w_pad - w)), constant_values=128).astype(np.float64) - 128.0
+    rows, cols = h_pad // mb, w_pad // mb
+    count = rows * cols
+    large_blocks = plane.reshape(rows, mb, cols, mb).transpose(0, 2, 1, 3).reshape(count, mb, mb)
+    # четыре блока 8x8 каждого макроблока подряд: верхний левый, верхний правый, нижний левый, нижний правый
+    small_blocks = large_blocks.reshape(count, 2, small, 2, small).transpose(0, 1, 3, 2, 4).reshape(-1, small, small)
+
+    dct_small = dct_2d.dct_2d_blocks(small_blocks)
+    dct_large = dct_2d.dct_2d_blocks(large_blocks)
+    levels_small = np.round(dct_small / q_small.astype(np.float64))
+    levels_large = np.round(dct_large / q_large.astype(np.float64))
+    error_small = np.sum(((dct_small - levels_small * q_small) ** 2).reshape(count, -1), axis=1)
+    error_large = np.sum(((dct_large - levels_large * q_large) ** 2).reshape(count, -1), axis=1) * (small / mb) ** 2
+    coeffs_small = coefficient_store.from_blocks(levels_small).astype(coefficient_store.COEFF_DTYPE)
+    coeffs_large = coefficient_store.from_blocks(levels_large).astype(coefficient_store.COEFF_DTYPE)
+    quads = coeffs_small.reshape(count, 4, small * small)
+
+    use_large = np.ones(count, dtype=bool)
+    for iteration in range(ADAPTIVE_PASSES):
+        selected_small = quads[~use_large].reshape(-1, small * small) if iteration else coeffs_small
+        selected_large = coeffs_large[use_large] if iteration else coeffs_large
+        bits_small = _block_bits(coeffs_small, *_statistics_tables([selected_small])).reshape(count, 4).sum(axis=1)
+        bits_large = _block_bits(coeffs_large, *_statistics_tables([selected_large]))
+        use_large = error_large + lam * bits_large < error_small + lam * bits_small
 
-    components_data = {}
-    padded_dims = {}
-    num_blocks_total = 0
+    return (quads[~use_large].reshape(-1, small * small),
+            coeffs_large[use_large],
+            use_large.reshape(rows, cols),
+            float(np.sum(np.where(use_large, error_large, error_small))),
+            (h_pad, w_pad))
+
+
+def _quantize(pixels, quality, block_size, tracer, distortion=None, rdo=False, block_cache=None, session=None,
+              adaptive_blocks=False):
+    """
+    Первая половина сжатия: цветовое преобразование, даунсэмплинг, DCT и квантование.
+    RGB изображение с R = G = B сжимается как оттенки серого.
+    При adaptive_blocks (True или множитель λ) каждый макроблок 16x16 квантуется
+    одним блоком 16x16 или четырьмя блоками 8x8 (см. _choose_block_sizes).
+
+    Возвращает:
+        QuantizedImage: Коэффициенты компонентов (при session - в буферах сессии,
+                        действительны до следующего вызова) или None при ошибке.
+    """
+    if pixels.ndim == 3:
+        original_height, original_width, num_channels = pixels.shape
+        if num_channels != 3:
+            tracer.error(f"Ошибка при чтении или подготовке изображения: Ожидалось 3 канала RGB, получено {num_channels}")
+            return None
+        if _is_gray_rgb(pixels):
+            pixels = pixels[:, :, 0]
+    else:
+        original_height, original_width = pixels.shape
+    grayscale = pixels.ndim == 2
+
+    if block_size not in SUPPORTED_BLOCK_SIZES:
+        tracer.error(f"Неподдерживаемый размер блока {block_size}: допустимы {SUPPORTED_BLOCK_SIZES}.")
+        return None
+    adaptive_scale = None
+    if adaptive_blocks:
+        if block_size != MACROBLOCK_SIZE // 2:
+            tracer.error(f"Режим adaptive_blocks выбирает между блоками {MACROBLOCK_SIZE // 2}x{MACROBLOCK_SIZE // 2} "
+                         f"и {MACROBLOCK_SIZE}x{MACROBLOCK_SIZE}; block_size должен быть {MACROBLOCK_SIZE // 2}.")
+            return None
+        adaptive_scale = DEFAULT_ADAPTIVE_LAMBDA_SCALE if adaptive_blocks is True else float(adaptive_blocks)
+    if rdo and (block_size != 8 or adaptive_scale is not None):
+        tracer.error("Квантование rdo поддерживается только для блоков 8x8 без adaptive_blocks.")
+        return None
+
+    if block_cache is False:
+        block_cache = None
+
+    rdo_scale = None
+    if rdo:
+        rdo_scale = rdo_quantization.DEFAULT_LAMBDA_SCALE if rdo is True else float(rdo)
+
+    if grayscale:
+        y_channel = pixels
+        if distortion is not None:
+            distortion.measure_grayscale()
+    else:
+        with tracer.stage('color'):
+            img_ycbcr = rgb_to_ycbcr.rgb_to_ycbcr(pixels)
+            y_channel  = img_ycbcr[:, :, 0]
+            cb_channel = img_ycbcr[:, :, 1]
+            cr_channel = img_ycbcr[:, :, 2]
+
+        with tracer.stage('downsample'):
+            cb_downsampled = downsample_channel.downsample_channel_420(cb_channel)
+            cr_downsampled = downsample_channel.downsample_channel_420(cr_channel)
+
+        if distortion is not None:
+            with tracer.stage('distortion'):
+                distortion.measure_colour_and_subsampling(pixels, img_ycbcr, cb_downsampled, cr_downsampled)
+
+    with tracer.stage('tables'):
+        q_matrix_y, q_matrix_c = _quantization_matrices(quality, block_size, session)
+        huffman_table = huffman_coding.HuffmanTable if session is None else session.huffman_table
+        if adaptive_scale is not None:
+            q_large_y, q_large_c = _quantization_matrices(quality, MACROBLOCK_SIZE, session)
+
+        try:
+            huff_dc_y = huffman_table(huffman_coding.DEFAULT_DC_LUMINANCE_BITS, huffman_coding.DEFAULT_DC_LUMINANCE_HUFFVAL)
+            huff_ac_y = huffman_table(huffman_coding.DEFAULT_AC_LUMINANCE_BITS, huffman_coding.DEFAULT_AC_LUMINANCE_HUFFVAL)
+            huff_dc_c = huffman_table(huffman_coding.DEFAULT_DC_CHROMINANCE_BITS, huffman_coding.DEFAULT_DC_CHROMINANCE_HUFFVAL)
+            huff_ac_c = huffman_table(huffman_coding.DEFAULT_AC_CHROMINANCE_BITS, huffman_coding.DEFAULT_AC_CHROMINANCE_HUFFVAL)
+        except ValueError as e:
+             tracer.error(f"Ошибка при создании таблиц Хаффмана из стандартных спецификаций: {e}", exception=e)
+             return None
+
+    padded_dims = {'Y': (0, 0), 'Cb': (0, 0), 'Cr': (0, 0)}
+    quantized_components = []
+    large_components = []
+    components = [('Y', y_channel, q_matrix_y, huff_dc_y, huff_ac_y)]
+    if not grayscale:
+        components += [('Cb', cb_downsampled, q_matrix_c, huff_dc_c, huff_ac_c),
+                       ('Cr', cr_downsampled, q_matrix_c, huff_dc_c, huff_ac_c)]
 
     try:
-        for name, channel, q_matrix, dc_table, ac_table in [
-            ('Y', y_channel, q_matrix_y, huff_dc_y, huff_ac_y),
-            ('Cb', cb_downsampled, q_matrix_c, huff_dc_c, huff_ac_c),
-            ('Cr', cr_downsampled, q_matrix_c, huff_dc_c, huff_ac_c)
-        ]:
-            print(f"Обработка компонента {name}...")
+        for name, channel, q_matrix, dc_table, ac_table in components:
+            if adaptive_scale is not None:
+                q_large = q_large_y if name == 'Y' else q_large_c
+                with tracer.stage('dct_quant', component=name):
+                    small_coeffs, large_coeffs, modes, squared_error_sum, padded_dims[name] = _choose_block_sizes(
+                        channel, q_matrix, q_large, rdo_quantization.rdo_lambda(q_matrix, adaptive_scale))
+                tracer.counter('blocks', len(small_coeffs) + len(large_coeffs), component=name)
+                tracer.counter('large_blocks', len(large_coeffs), component=name)
+                if distortion is not None:
+                    distortion.add_quantization_error(name, squared_error_sum, modes.size * MACROBLOCK_SIZE ** 2)
+                quantized_components.append((name, small_coeffs, dc_table, ac_table))
+                large_components.append((name, large_coeffs, modes))
+                continue
+
             h_orig, w_orig = channel.shape
             h_pad = math.ceil(h_orig / block_size) * block_size
             w_pad = math.ceil(w_orig / block_size) * block_size
             padded_dims[name] = (h_pad, w_pad)
 
-            blocks = split_into_blocks.split_into_blocks(channel, block_size, fill_value=128)
-            num_blocks_comp = len(blocks)
-            num_blocks_total += num_blocks_comp
-            print(f"  {name}: {num_blocks_comp} блоков ({block_size}x{block_size})")
-
-            quantized_blocks_data = []
-            all_dc_coeffs = []
-
-            for i, block in enumerate(blocks):
-                block_shifted = block.astype(np.float64) - 128.0
-                dct_coeffs = dct_2d.dct_2d_transform(block_shifted)
-                quantized_coeffs = quantization.quantize(dct_coeffs, q_matrix)
-                all_dc_coeffs.append(quantized_coeffs[0, 0])
-                ac_coeffs_flat = zigzag_scan.zigzag_scan(quantized_coeffs)[1:]
-                ac_rle = rle_ac_coding.rle_encode_ac_coefficients(ac_coeffs_flat.tolist())
-                quantized_blocks_data.append([None, None, ac_rle])
-
-            dc_diffs = dc_differential_coding.dpcm_encode_dc(all_dc_coeffs)
-            for i, dc_diff in enumerate(dc_diffs):
-                dc_category, dc_vli_bits = vli_coding.get_vli_category_and_value(dc_diff)
-                quantized_blocks_data[i][0] = dc_category
-                quantized_blocks_data[i][1] = dc_vli_bits
-
-            print(f"  Кодирование Хаффмана для {name}...")
-            compressed_data = huffman_coding.huffman_encode_data(quantized_blocks_data, dc_table, ac_table)
+            with tracer.stage('dct_quant', component=name):
+                blocks = split_into_blocks.split_into_blocks(channel, block_size, fill_value=128)
+
+                num_coeffs = block_size * block_size
+                order = zigzag_scan.zigzag_order(block_size)
+                # каждая строка хранилища заполняется ниже (из кэша, квантованием или RDO),
+                # поэтому буфер сессии не обнуляется
+                if session is not None:
+                    zigzag_coeffs = session.buffer(('coeffs', name), len(blocks), (num_coeffs,),
+                                                   coefficient_store.COEFF_DTYPE)
+                else:
+                    zigzag_coeffs = coefficient_store.allocate(len(blocks), num_coeffs)
+                if rdo_scale is not None:
+                    # коэффициенты DCT до квантования; точности float32 для выбора уровней достаточно
+                    if session is not None:
+                        dct_zigzag = session.buffer('dct', len(blocks), (num_coeffs,), np.float32)
+                    else:
+                        dct_zigzag = np.empty((len(blocks), num_coeffs), dtype=np.float32)
+                squared_error_sum = 0.0
+                memo = block_cache if rdo_scale is None else None
+                q_key = q_matrix.tobytes()
+                hits_before, misses_before = (memo.hits, memo.misses) if memo is not None else (0, 0)
+
+                for index, block in enumerate(blocks):
+                    if memo is not None:
+                        key = block_cache_module.block_key(block, q_key)
+                        cached = memo.get(key)
+                        if cached is not None and (distortion is None or cached[1] is not None):
+                            zigzag_coeffs[index] = cached[0]
+                            if distortion is not None:
+                                squared_error_sum += cached[1]
+                            continue
+                    block_shifted = block.astype(np.float64) - 128.0
+                    dct_coeffs = dct_2d.dct_2d_transform(block_shifted)
+                    if rdo_scale is not None:
+                        dct_zigzag[index] = dct_coeffs.reshape(-1)[order]
+                        continue
+                    quantized_coeffs = quantization.quantize(dct_coeffs, q_matrix)
+                    block_error = None
+                    if distortion is not None:
+                        quant_error = dct_coeffs - quantization.dequantize(quantized_coeffs, q_matrix)
+                        block_error = float(np.sum(quant_error * quant_error))
+                        squared_error_sum += block_error
+                    zigzag_coeffs[index] = quantized_coeffs.reshape(-1)[order]
+                    if memo is not None:
+                        memo.put(key, zigzag_coeffs[index].copy(), block_error)
+
+                if rdo_scale is not None:
+                    q_zigzag = q_matrix.reshape(-1)[order].astype(np.float64)
+                    with tracer.stage('rdo', component=name):
+                        zigzag_coeffs = rdo_quantization.trellis_quantize(
+                            dct_zigzag, q_zigzag, ac_table, rdo_quantization.rdo_lambda(q_matrix, rdo_scale))
+                    if distortion is not None:
+                        quant_error = dct_zigzag - zigzag_coeffs * q_zigzag
+                        squared_error_sum = float(np.sum(quant_error * quant_error))
+            tracer.counter('blocks', len(blocks), component=name)
+            if memo is not None:
+                tracer.counter('block_cache_hits', memo.hits - hits_before, component=name)
+                tracer.counter('block_cache_misses', memo.misses - misses_before, component=name)
+            if distortion is not None:
+                # dct_2d отличается от ортонормированного DCT множителем N/8
+                distortion.add_quantization_error(name, squared_error_sum * (8.0 / block_size) ** 2,
+                                                  len(blocks) * block_size * block_size)
+
+            quantized_components.append((name, zigzag_coeffs, dc_table, ac_table))
+
+    except Exception as e:
+        tracer.error(f"Ошибка на этапе обработки блока: {e}", exception=e)
+        return None
+
+    huffman_tables = (huff_dc_y, huff_ac_y, huff_dc_c, huff_ac_c)
+    if block_size != 8 or adaptive_scale is not None:
+        with tracer.stage('tables'):
+            huffman_tables = _component_tables(quantized_components)
+        quantized_components = _with_tables(quantized_components, huffman_tables)
+    large_blocks = None
+    if adaptive_scale is not None:
+        with tracer.stage('tables'):
+            large_tables = _component_tables(large_components)
+        large_blocks = {
+            'block_size': MACROBLOCK_SIZE,
+            'q_matrix_y': q_large_y,
+            'q_matrix_c': q_large_c,
+            'huffman_tables': large_tables,
+            'components': [(name, coeffs, dc_table, ac_table, modes) for (name, coeffs, modes), (_, _, dc_table, ac_table)
+                           in zip(large_components, _with_tables(large_components, large_tables))],
+        }
+
+    return QuantizedImage(original_width, original_height, block_size, quality, q_matrix_y, q_matrix_c,
+                          huffman_tables, quantized_components, padded_dims, large_blocks)
+
+
+def _component_tables(components):
+    """Таблицы (dc_y, ac_y, dc_c, ac_c) по статистике компонентов [(имя, коэффициенты, ...), ...]."""
+    luminance = _statistics_tables([entry[1] for entry in components if entry[0] == 'Y'])
+    chrominance = _statistics_tables([entry[1] for entry in components if entry[0] != 'Y'])
+    return luminance + chrominance
+
+
+def _with_tables(components, huffman_tables):
+    """Заменяет таблицы компонентов [(имя, коэффициенты, ...), ...] на таблицы яркости или цветности."""
+    huff_dc_y, huff_ac_y, huff_dc_c, huff_ac_c = huffman_tables
+    return [(entry[0], entry[1]) + ((huff_dc_y, huff_ac_y) if entry[0] == 'Y' else (huff_dc_c, huff_ac_c))
+            for entry in components]
+
+
+def _entropy_encode(quantized, scan_script, backend, tracer, entropy_stats=None):
+    """
+    Вторая половина сжатия: энтропийное кодирование коэффициентов и метаданные контейнера.
+
+    Возвращает:
+        tuple: (metadata, components_data) как _encode_array или None при ошибке.
+    """
+    large_blocks = quantized.large_blocks
+    components_data = {'Y': b'', 'Cb': b'', 'Cr': b''}
+    large_data_len = {}
+    progressive_components = []
+    try:
+        for name, zigzag_coeffs, dc_table, ac_table in quantized.components:
+            if scan_script is not None:
+                if entropy_stats is not None:
+                    entropy_stats.add_component(name, zigzag_coeffs, dc_table, ac_table)
+                progressive_components.append((name, zigzag_coeffs, dc_table, ac_table))
+                continue
+
+            with tracer.stage('entropy', component=name, coder=backend.name):
+                compressed_data = backend.encode(zigzag_coeffs, dc_table, ac_table, tracer=tracer)
+            if entropy_stats is not None:
+                entropy_stats.add_component(name, zigzag_coeffs, dc_table, ac_table, compressed_data,
+                                            coder=backend.name)
             components_data[name] = compressed_data
-            print(f"    Размер сжатых данных {name}: {len(compressed_data)} байт")
+            tracer.counter('bytes', len(compressed_data), component=name)
+
+        # поток макроблоков 16x16 записывается в конец потока компонента
+        for name, zigzag_coeffs, dc_table, ac_table, _ in (large_blocks['components'] if large_blocks else ()):
+            with tracer.stage('entropy', component=name, coder=backend.name, block_size=large_blocks['block_size']):
+                compressed_data = backend.encode(zigzag_coeffs, dc_table, ac_table, tracer=tracer)
+            if entropy_stats is not None:
+                entropy_stats.add_component(f"{name} {large_blocks['block_size']}x{large_blocks['block_size']}",
+                                            zigzag_coeffs, dc_table, ac_table, compressed_data, coder=backend.name)
+            large_data_len[name] = len(compressed_data)
+            components_data[name] += compressed_data
+            tracer.counter('bytes', len(compressed_data), component=name)
+
+        if scan_script is not None:
+            scans, scan_data = progressive_coding.encode_progressive(progressive_components, scan_script, tracer=tracer)
+            components_data = {'Y': scan_data, 'Cb': b'', 'Cr': b''}
 
     except Exception as e:
-        print(f"Ошибка на этапе обработки блока или кодирования Хаффмана: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc()
-        return
+        tracer.error(f"Ошибка на этапе обработки блока или энтропийного кодирования: {e}", exception=e)
+        return None
 
+    huff_dc_y, huff_ac_y, huff_dc_c, huff_ac_c = quantized.huffman_tables
+    q_matrix_y, q_matrix_c = quantized.q_matrix_y, quantized.q_matrix_c
+    padded_dims = quantized.padded_dims
+    original_width, original_height = quantized.width, quantized.height
+    block_size, quality, grayscale = quantized.block_size, quantized.quality, quantized.grayscale
     metadata = {
         "original_width": original_width,
         "original_height": original_height,
@@ -205,14 +762,118 @@ def compress_image(image_path, output_path, quality=75, block_size=8):
         "data_len_cb": len(components_data['Cb']),
         "data_len_cr": len(components_data['Cr']),
     }
+    if grayscale:
+        metadata["components"] = 1
+    if scan_script is not None:
+        metadata["progressive_scans"] = scans
+    if backend.name != entropy_coding.DEFAULT_ENTROPY_CODER:
+        metadata["entropy_coder"] = backend.name
+    if large_blocks is not None:
+        metadata["large_blocks"] = _large_blocks_metadata(large_blocks, large_data_len)
+
+    return metadata, components_data
 
-    print("Сохранение результата...")
-    save_compressed_data(
-        output_path,
-        metadata,
-        components_data['Y'],
-        components_data['Cb'],
-        components_data['Cr']
-    )
 
-    print(f"Сжатие '{image_path}' завершено. Результат в '{output_path}'.")
\ No newline at end of file
+def _large_blocks_metadata(large_blocks, data_len):
+    """
+    Заголовок режима adaptive_blocks. Флаги макроблоков (1 - блок 16x16) упакованы
+    по строкам np.packbits и записаны в base64; data_len - длина потока блоков 16x16
+    в конце потока компонента. Таблицы Хаффмана записаны под теми же ключами,
+    что и таблицы блоков 8x8 в корне метаданных. Матрицы квантования 16x16 не
+    записываются: декодер получает их из q_table_y и q_table_c (scale_to_block_size).
+    """
+    huff_dc_y, huff_ac_y, huff_dc_c, huff_ac_c = large_blocks['huffman_tables']
+    return {
+        "block_size": large_blocks['block_size'],
+        "modes": {name: base64.b64encode(np.packbits(modes).tobytes()).decode('ascii')
+                  for name, _, _, _, modes in large_blocks['components']},
+        "data_len": data_len,
+        "huff_dc_y_bits": huff_dc_y.bits,
+        "huff_dc_y_huffval": huff_dc_y.huffval,
+        "huff_ac_y_bits": huff_ac_y.bits,
+        "huff_ac_y_huffval": huff_ac_y.huffval,
+        "huff_dc_c_bits": huff_dc_c.bits,
+        "huff_dc_c_huffval": huff_dc_c.huffval,
+        "huff_ac_c_bits": huff_ac_c.bits,
+        "huff_ac_c_huffval": huff_ac_c.huffval,
+    }
+
+
+def _encode_array(pixels, quality, block_size, tracer, distortion=None, progressive=False, entropy_coder='huffman',
+                  rdo=False, block_cache=None, session=None, entropy_stats=None, adaptive_blocks=False):
+    """
+    Выполняет сжатие RGB массива (height, width, 3) или массива оттенков серого (height, width) в памяти.
+    RGB изображение с R = G = B сжимается как оттенки серого.
+
+    Возвращает:
+        tuple: (metadata, components_data), где components_data - словарь
+               {'Y': bytes, 'Cb': bytes, 'Cr': bytes}, или None при ошибке.
+               В прогрессивном режиме все сканы записываются подряд в поток 'Y',
+               потоки 'Cb' и 'Cr' пусты, а разбиение на сканы описано в
+               метаданных "progressive_scans". Для оттенков серого потоки 'Cb' и 'Cr'
+               пусты, а в метаданных записывается "components": 1.
+    """
+    coder = _resolve_coder(progressive, entropy_coder, block_size, tracer, adaptive_blocks)
+    if coder is None:
+        return None
+    quantized = _quantize(pixels, quality, block_size, tracer, distortion, rdo, block_cache, session,
+                          adaptive_blocks)
+    if quantized is None:
+        return None
+    return _entropy_encode(quantized, *coder, tracer, entropy_stats)
+
+
+def quantize_array(image, quality=75, block_size=8, tracer=None, distortion=None, rdo=False, block_cache=None,
+                   session=None, adaptive_blocks=False):
+    """
+    Первая половина compress_array: цветовое преобразование, DCT и квантование без
+    энтропийного кодирования. Вместе с encode_quantized дает те же байты, что compress_array;
+    половины можно выполнять в разных процессах (см. pipeline).
+
+    Аргументы:
+        image (np.ndarray): RGB изображение (height, width, 3) или оттенки серого (height, width), uint8.
+        quality, block_size, tracer, distortion, rdo, block_cache, session, adaptive_blocks: см. compress_array.
+
+    Возвращает:
+        QuantizedImage: Квантованные коэффициенты или None при ошибке.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    with tracer.stage('quantize', quality=quality):
+        try:
+            pixels = _as_pixel_array(image)
+        except (TypeError, ValueError) as e:
+            tracer.error(f"Ошибка при подготовке изображения: {e}", exception=e)
+            return None
+        return _quantize(pixels, quality, block_size, tracer, distortion, rdo, block_cache, session,
+                         adaptive_blocks)
+
+
+def encode_quantized(quantized, progressive=False, entropy_coder='huffman', tracer=None, entropy_stats=None):
+    """
+    Вторая половина compress_array: энтропийное кодирование результата quantize_array.
+
+    Аргументы:
+        quantized (QuantizedImage): Результат quantize_array.
+        progressive, entropy_coder, tracer, entropy_stats: см. compress_array.
+
+    Возвращает:
+        bytes: Сжатые данные в формате MYJPEG или None при ошибке.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    with tracer.stage('encode', coder=entropy_coder):
+        coder = _resolve_coder(progressive, entropy_coder, quantized.block_size, tracer,
+                               quantized.large_blocks is not None)
+        if coder is None:
+            return None
+        encoded = _entropy_encode(quantized, *coder, tracer, entropy_stats)
+        if encoded is None:
+            return None
+        metadata, components_data = encoded
+        buffer = io.BytesIO()
+        try:
+            write_compressed_data(buffer, metadata, components_data['Y'], components_data['Cb'],
+                                  components_data['Cr'], tracer=tracer)
+        except Exception as e:
+            tracer.error(f"Ошибка записи сжатых данных в поток: {e}", exception=e)
+            return None
+        return buffer.getvalue()
@@ -4,17 +4,20 @@ import json
 import math
 import sys
 import os
+import base64
+import mmap
+import argparse
 
 import rgb_to_ycbcr
-import downsample_channel
-import reassemble_from_blocks
 import dct_2d
 import quantization
-import zigzag_scan
-import dc_differential_coding
-import rle_ac_coding
-import vli_coding
+import adjust_quantization_matrix
+import coefficient_store
 import huffman_coding
+import entropy_coding
+import progressive_coding
+import instrumentation
+import decoded_image_cache
 
 try:
     import constants
@@ -36,8 +39,110 @@ except ImportError:
     plt = None
 
 
-def load_compressed_data(filepath):
+REQUIRED_METADATA_KEYS = [
+    "data_len_y", "data_len_cb", "data_len_cr", "original_width", "original_height",
+    "block_size", "q_table_y", "q_table_c", "huff_dc_y_bits", "huff_dc_y_huffval",
+    "huff_ac_y_bits", "huff_ac_y_huffval", "huff_dc_c_bits", "huff_dc_c_huffval",
+    "huff_ac_c_bits", "huff_ac_c_huffval", "padded_dims_y", "padded_dims_cb", "padded_dims_cr"
+]
+
+
+# Ключи заголовка "large_blocks" (режим adaptive_blocks, см. jpeg_compressor.compress_image).
+REQUIRED_LARGE_BLOCKS_KEYS = [
+    "block_size", "modes", "data_len", "huff_dc_y_bits", "huff_dc_y_huffval",
+    "huff_ac_y_bits", "huff_ac_y_huffval", "huff_dc_c_bits", "huff_dc_c_huffval",
+    "huff_ac_c_bits", "huff_ac_c_huffval"
+]
+
+
+def _validate_metadata(metadata):
+    """Проверяет наличие всех обязательных ключей в метаданных и количество компонентов."""
+    for key in REQUIRED_METADATA_KEYS:
+        if key not in metadata:
+            raise ValueError(f"Отсутствует необходимый ключ в метаданных: {key}")
+    if metadata.get('components', 3) not in (1, 3):
+        raise ValueError(f"Неподдерживаемое количество компонентов: {metadata['components']}")
+    large_blocks = metadata.get('large_blocks')
+    if large_blocks is not None:
+        for key in REQUIRED_LARGE_BLOCKS_KEYS:
+            if key not in large_blocks:
+                raise ValueError(f"Отсутствует необходимый ключ в метаданных large_blocks: {key}")
+        if large_blocks['block_size'] != 2 * metadata['block_size'] or 'progressive_scans' in metadata:
+            raise ValueError(f"Неподдерживаемое сочетание блоков {metadata['block_size']} "
+                             f"и {large_blocks['block_size']} в режиме large_blocks.")
+
+
+def _parse_container(view, tracer):
+    """
+    Разбирает контейнер MYJPEG в view, читая только заголовок. Ошибки формата
+    передаются исключениями (ValueError, EOFError, json.JSONDecodeError).
+
+    Возвращает:
+        tuple: (metadata, [y_data, cb_data, cr_data], header_len), потоки - срезы view.
+    """
+    magic_len = len(b'MYJPEG')
+    if view[:magic_len].tobytes() != b'MYJPEG':
+        raise ValueError("Неверный формат данных (не найден 'MYJPEG')")
+
+    pos = magic_len + constants.Bites_for_param
+    if len(view) < pos:
+        raise EOFError("Не удалось прочитать длину заголовка.")
+    header_len = int.from_bytes(view[magic_len:pos], constants.ByteOrder)
+
+    if len(view) < pos + header_len:
+        raise EOFError("Не удалось прочитать полный заголовок.")
+    metadata = json.loads(bytes(view[pos:pos + header_len]).decode('utf-8'))
+    _validate_metadata(metadata)
+    pos += header_len
+
+    payloads = []
+    for key in ("data_len_y", "data_len_cb", "data_len_cr"):
+        length = metadata[key]
+        if len(view) < pos + length:
+            if 'progressive_scans' not in metadata:
+                raise EOFError("Не удалось прочитать полные сжатые данные для компонентов.")
+            tracer.warning(f"Прогрессивные данные обрезаны: доступно {max(0, len(view) - pos)} из {length} байт.")
+            length = max(0, len(view) - pos)
+        payloads.append(view[pos:pos + length])
+        pos += length
+    return metadata, payloads, header_len
+
+
+def parse_compressed_data(data, tracer=None):
+    """
+    Разбирает содержимое сжатого файла, уже находящееся в памяти.
+
+    Аргументы:
+        data (bytes | bytearray | memoryview): Полное содержимое файла формата MYJPEG.
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+
+    Возвращает:
+        tuple: (metadata, y_data, cb_data, cr_data), где потоки компонентов - memoryview
+               поверх data, или (None, None, None, None) при ошибке.
+               Обрезанный прогрессивный файл не считается ошибкой: возвращается
+               доступный префикс сканов.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    try:
+        metadata, payloads, header_len = _parse_container(memoryview(data), tracer)
+        tracer.counter('header_bytes', header_len)
+
+    except json.JSONDecodeError as e:
+        tracer.error(f"Ошибка декодирования JSON в метаданных: {e}", exception=e)
+        return None, None, None, None
+    except (ValueError, EOFError) as e:
+        tracer.error(f"Ошибка формата сжатых данных: {e}", exception=e)
+        return None, None, None, None
+    except Exception as e:
+        tracer.error(f"Неожиданная ошибка при разборе сжатых данных: {e}", exception=e)
+        return None, None, None, None
+
+    return metadata, payloads[0], payloads[1], payloads[2]
+
+
+def load_compressed_data(filepath, tracer=None):
     """Загружает метаданные и сжатые байтовые потоки из файла."""
+    tracer = instrumentation.resolve_tracer(tracer)
     metadata = None
     y_data, cb_data, cr_data = None, None, None
     try:
@@ -55,16 +160,7 @@ def load_compressed_data(filepath):
             if len(metadata_bytes) != header_len:
                 raise EOFError("Не удалось прочитать полный заголовок.")
             metadata = json.loads(metadata_bytes.decode('utf-8'))
-
-            required_keys = [
-                "data_len_y", "data_len_cb", "data_len_cr", "original_width", "original_height",
-                 "block_size", "q_table_y", "q_table_c", "huff_dc_y_bits", "huff_dc_y_huffval",
-                 "huff_ac_y_bits", "huff_ac_y_huffval", "huff_dc_c_bits", "huff_dc_c_huffval",
-                 "huff_ac_c_bits", "huff_ac_c_huffval", "padded_dims_y", "padded_dims_cb", "padded_dims_cr"
-                 ]
-            for key in required_keys:
-                if key not in metadata:
-                    raise ValueError(f"Отсутствует необходимый ключ в метаданных: {key}")
+            _validate_metadata(metadata)
 
             y_data = f.read(metadata["data_len_y"])
             cb_data = f.read(metadata["data_len_cb"])
@@ -73,196 +169,723 @@ def load_compressed_data(filepath):
             if len(y_data) != metadata["data_len_y"] or \
                len(cb_data) != metadata["data_len_cb"] or \
                len(cr_data) != metadata["data_len_cr"]:
-                raise EOFError("Не удалось прочитать полные сжатые данные для компонентов.")
+                if 'progressive_scans' not in metadata:
+                    raise EOFError("Не удалось прочитать полные сжатые данные для компонентов.")
+                tracer.warning(f"Прогрессивные данные обрезаны: доступно {len(y_data)} из {metadata['data_len_y']} байт.")
 
-            print(f"Метаданные и сжатые данные успешно загружены из {filepath}")
+            tracer.counter('header_bytes', header_len)
 
-    except FileNotFoundError:
-        print(f"Ошибка: Файл не найден {filepath}", file=sys.stderr)
+    except FileNotFoundError as e:
+        tracer.error(f"Ошибка: Файл не найден {filepath}", exception=e)
         return None, None, None, None
     except json.JSONDecodeError as e:
-        print(f"Ошибка декодирования JSON в метаданных: {e}", file=sys.stderr)
+        tracer.error(f"Ошибка декодирования JSON в метаданных: {e}", exception=e)
         return None, None, None, None
     except (ValueError, EOFError) as e:
-        print(f"Ошибка чтения или формата файла {filepath}: {e}", file=sys.stderr)
+        tracer.error(f"Ошибка чтения или формата файла {filepath}: {e}", exception=e)
         return None, None, None, None
     except Exception as e:
-        print(f"Неожиданная ошибка при загрузке файла: {e}", file=sys.stderr)
+        tracer.error(f"Неожиданная ошибка при загрузке файла: {e}", exception=e)
         return None, None, None, None
 
     return metadata, y_data, cb_data, cr_data
 
 
-def decompress_image(compressed_path, output_path):
+class CompressedImage:
+    """
+    Ленивый доступ к файлу MYJPEG через mmap: при открытии разбирается только заголовок,
+    потоки компонентов - memoryview поверх отображения файла, читаются с диска
+    при первом обращении и действительны до close().
+    """
+    def __init__(self, path, tracer=None):
+        """
+        Аргументы:
+            path (str | os.PathLike): Путь к сжатому файлу.
+            tracer (instrumentation.Tracer, optional): Получатель предупреждений
+                (обрезанный прогрессивный файл).
+
+        Исключения:
+            OSError, ValueError, EOFError, json.JSONDecodeError: файл недоступен или поврежден.
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self.file_size = os.fstat(self._file.fileno()).st_size
+            if self.file_size == 0:
+                raise EOFError("Пустой файл.")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+            metadata, payloads, self.header_bytes = _parse_container(self._view, instrumentation.resolve_tracer(tracer))
+            self.metadata = metadata
+            self._payloads = dict(zip(('Y', 'Cb', 'Cr'), payloads))
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def width(self):
+        return self.metadata['original_width']
+
+    @property
+    def height(self):
+        return self.metadata['original_height']
+
+    @property
+    def components(self):
+        """Имена записанных компонентов (см. component_names)."""
+        return component_names(self.metadata)
+
+    def component_data(self, name):
+        """Сжатый поток компонента ('Y', 'Cb' или 'Cr') как memoryview без копирования. KeyError для другого имени."""
+        return self._payloads[name]
+
+    def info(self):
+        """
+        Сведения из заголовка без чтения потоков компонентов.
+
+        Возвращает:
+            dict: width, height, quality, block_size, components, entropy_coder, progressive,
+                  adaptive_blocks, header_bytes, payload_bytes (по компонентам), file_size.
+        """
+        metadata = self.metadata
+        return {
+            'width': self.width,
+            'height': self.height,
+            'quality': metadata.get('quality'),
+            'block_size': metadata['block_size'],
+            'components': list(self.components),
+            'entropy_coder': entropy_coding.get_backend(metadata.get('entropy_coder')).name,
+            'progressive': 'progressive_scans' in metadata,
+            'adaptive_blocks': 'large_blocks' in metadata,
+            'header_bytes': self.header_bytes,
+            'payload_bytes': {name: len(self._payloads[name]) for name in self.components},
+            'file_size': self.file_size,
+        }
+
+    def decompress(self, components=None, tracer=None, session=None, out=None):
+        """
+        Декодирует изображение (см. decode_components), потоки читаются прямо из отображения.
+
+        Аргументы:
+            components (tuple, optional): Декодируемые компоненты, например ('Y',) для
+                быстрого просмотра в оттенках серого; по умолчанию - все.
+            tracer, session, out: см. decode_components.
+
+        Возвращает:
+            np.ndarray: Изображение uint8 или None при ошибке.
+        """
+        return decode_components(self.metadata, self._payloads['Y'], self._payloads['Cb'], self._payloads['Cr'],
+                                 tracer=tracer, session=session, out=out, components=components)
+
+    def close(self):
+        """Закрывает отображение и файл. Ранее возвращенные memoryview становятся недействительными."""
+        for payload in getattr(self, '_payloads', {}).values():
+            payload.release()
+        self._payloads = {}
+        view = getattr(self, '_view', None)
+        if view is not None:
+            view.release()
+            self._view = None
+        if getattr(self, '_mmap', None) is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # на отображение еще ссылаются срезы потоков; оно закроется вместе с ними
+                pass
+            self._mmap = None
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
+            self._file = None
+
+
+def open_compressed_image(compressed_path, tracer=None):
+    """
+    Открывает файл MYJPEG как CompressedImage, сообщая ошибки через tracer.
+
+    Возвращает:
+        CompressedImage: Открытый файл (закрыть через close() или with) или None при ошибке.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    try:
+        return CompressedImage(compressed_path, tracer=tracer)
+    except FileNotFoundError as e:
+        tracer.error(f"Ошибка: Файл не найден {compressed_path}", exception=e)
+    except json.JSONDecodeError as e:
+        tracer.error(f"Ошибка декодирования JSON в метаданных: {e}", exception=e)
+    except (ValueError, EOFError) as e:
+        tracer.error(f"Ошибка чтения или формата файла {compressed_path}: {e}", exception=e)
+    except Exception as e:
+        tracer.error(f"Неожиданная ошибка при загрузке файла: {e}", exception=e)
+    return None
+
+
+def decompress_image(compressed_path, output_path, tracer=None, session=None, components=None):
     """
     Выполняет декомпрессию изображения из формата .myjpeg в стандартный формат (напр. PNG).
+    Файл с одним компонентом сохраняется в оттенках серого.
+    Для прогрессивного файла достаточно любого префикса, содержащего заголовок:
+    недостающие сканы заменяются нулевыми коэффициентами (предварительное изображение).
+
+    Ход работы сообщается объекту tracer (см. instrumentation.Tracer);
+    по умолчанию декомпрессия выполняется молча.
+    Сессия session (codec_session.Decoder) хранит таблицы и буферы между вызовами.
+    Файл отображается в память (CompressedImage): с components=('Y',) потоки
+    цветности не читаются и сохраняется изображение в оттенках серого.
     """
-    print(f"Начало декомпрессии '{compressed_path}'...")
+    tracer = instrumentation.resolve_tracer(tracer)
+    with tracer.stage('decompress', path=compressed_path):
+        return _decompress_image(compressed_path, output_path, tracer, session, components)
 
-    metadata, y_data, cb_data, cr_data = load_compressed_data(compressed_path)
-    if metadata is None:
+
+def _decompress_image(compressed_path, output_path, tracer, session=None, components=None):
+    with tracer.stage('load'):
+        image = open_compressed_image(compressed_path, tracer=tracer)
+    if image is None:
+        return None
+    tracer.counter('header_bytes', image.header_bytes)
+
+    with image:
+        final_rgb = image.decompress(components=components, tracer=tracer, session=session)
+    if final_rgb is None:
+        return None
+
+    try:
+        with tracer.stage('write', path=output_path):
+            img_out = Image.fromarray(final_rgb)
+            img_out.save(output_path)
+    except Exception as e:
+        tracer.error(f"Ошибка при сохранении изображения {output_path}: {e}", exception=e)
+        return None
+
+    return final_rgb
+
+
+def component_names(metadata):
+    """Имена компонентов, записанных в файле: ('Y',) для оттенков серого, иначе ('Y', 'Cb', 'Cr')."""
+    return ('Y',) if metadata.get('components', 3) == 1 else ('Y', 'Cb', 'Cr')
+
+
+def read_tables(metadata, session=None):
+    """
+    Матрицы квантования и таблицы Хаффмана из метаданных.
+
+    Аргументы:
+        metadata (dict): Метаданные контейнера.
+        session (codec_session.CodecSession, optional): Сессия, в которой таблицы Хаффмана
+            с одинаковой спецификацией строятся один раз.
+
+    Возвращает:
+        dict: Имя компонента -> (q_matrix, dc_table, ac_table); Cb и Cr используют общие таблицы.
+    """
+    q_matrix_y = np.array(metadata['q_table_y'], dtype=np.uint8)
+    q_matrix_c = np.array(metadata['q_table_c'], dtype=np.uint8)
+
+    huffman_table = huffman_coding.HuffmanTable if session is None else session.huffman_table
+    huff_dc_y = huffman_table(metadata['huff_dc_y_bits'], metadata['huff_dc_y_huffval'])
+    huff_ac_y = huffman_table(metadata['huff_ac_y_bits'], metadata['huff_ac_y_huffval'])
+    huff_dc_c = huffman_table(metadata['huff_dc_c_bits'], metadata['huff_dc_c_huffval'])
+    huff_ac_c = huffman_table(metadata['huff_ac_c_bits'], metadata['huff_ac_c_huffval'])
+    return {
+        'Y': (q_matrix_y, huff_dc_y, huff_ac_y),
+        'Cb': (q_matrix_c, huff_dc_c, huff_ac_c),
+        'Cr': (q_matrix_c, huff_dc_c, huff_ac_c),
+    }
+
+
+def decode_coefficients(metadata, y_data, cb_data, cr_data, tracer=None):
+    """
+    Энтропийное декодирование без обратного DCT: восстанавливает квантованные коэффициенты
+    компонентов (для операций над сжатыми данными, см. compressed_domain).
+
+    Аргументы:
+        metadata (dict): Метаданные контейнера.
+        y_data, cb_data, cr_data (bytes-like): Сжатые потоки компонентов Y, Cb, Cr.
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+
+    Возвращает:
+        dict: Имя компонента -> коэффициенты (n_blocks, N*N) в зигзаг-порядке (coefficient_store),
+              только для компонентов из component_names(metadata), или None при ошибке.
+              Файлы с блоками разного размера ("large_blocks") не поддерживаются.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    try:
+        if 'large_blocks' in metadata:
+            raise ValueError("коэффициенты файла с блоками разного размера (large_blocks) "
+                             "не образуют единую сетку блоков.")
+        with tracer.stage('tables'):
+            tables = read_tables(metadata)
+        return _decode_coefficients(metadata, y_data, cb_data, cr_data, tables, tracer)
+    except Exception as e:
+        tracer.error(f"Ошибка при энтропийном декодировании: {e}", exception=e)
         return None
 
+
+def _decode_coefficients(metadata, y_data, cb_data, cr_data, tables, tracer, session=None, names=None):
+    block_size = metadata['block_size']
+    num_coeffs = block_size * block_size
+    padded_dims = {
+        'Y': tuple(metadata['padded_dims_y']),
+        'Cb': tuple(metadata['padded_dims_cb']),
+        'Cr': tuple(metadata['padded_dims_cr'])
+    }
+    num_blocks = {name: (h // block_size) * (w // block_size) for name, (h, w) in padded_dims.items()}
+    if names is None:
+        names = component_names(metadata)
+    streams = {'Y': y_data, 'Cb': cb_data, 'Cr': cr_data}
+    large_blocks = metadata.get('large_blocks')
+    if large_blocks is not None:
+        # блоки 8x8 - только в макроблоках, не выбранных для 16x16; их поток идет первым
+        modes = macroblock_modes(metadata)
+        for name, mode in modes.items():
+            num_blocks[name] = 4 * int(np.count_nonzero(~mode))
+            streams[name] = streams[name][:len(streams[name]) - large_blocks['data_len'][name]]
+
+    backend = entropy_coding.get_backend(metadata.get('entropy_coder'))
+    scans = metadata.get('progressive_scans')
+    if scans is not None:
+        huffman_tables = {name: (dc_table, ac_table) for name, (_, dc_table, ac_table) in tables.items()}
+        progressive_coeffs = progressive_coding.decode_progressive(scans, y_data, num_blocks, huffman_tables,
+                                                                   num_coeffs, tracer=tracer)
+        tracer.counter('bytes', len(y_data))
+        for name in names:
+            if num_blocks[name]:
+                tracer.counter('blocks', num_blocks[name], component=name)
+        return {name: progressive_coeffs[name] for name in names}
+
+    coefficients = {}
+    for name in names:
+        comp_data = streams[name]
+        _, dc_table, ac_table = tables[name]
+        num_blocks_comp = num_blocks[name]
+        if num_blocks_comp == 0 and len(comp_data) > 0:
+             raise ValueError(f"Расчетное количество блоков 0, но есть данные для {name}")
+        elif num_blocks_comp == 0:
+             coefficients[name] = coefficient_store.allocate(0, num_coeffs)
+             continue
+        out = None
+        if session is not None:
+            out = session.buffer(('coeffs', name), num_blocks_comp, (num_coeffs,), coefficient_store.COEFF_DTYPE)
+        with tracer.stage('entropy_decode', component=name, coder=backend.name):
+            zigzag_coeffs = backend.decode(comp_data, num_blocks_comp, dc_table, ac_table,
+                                           num_coeffs=num_coeffs, tracer=tracer, out=out)
+        tracer.counter('bytes', len(comp_data), component=name)
+        if len(zigzag_coeffs) != num_blocks_comp:
+             tracer.warning(f"декодировано {len(zigzag_coeffs)} блоков для {name}, ожидалось {num_blocks_comp}", component=name)
+        if len(zigzag_coeffs):
+            tracer.counter('blocks', len(zigzag_coeffs), component=name)
+        coefficients[name] = zigzag_coeffs
+    return coefficients
+
+
+def macroblock_modes(metadata):
+    """
+    Флаги макроблоков файла с блоками разного размера ("large_blocks").
+
+    Возвращает:
+        dict: Имя компонента -> массив (rows, cols) bool, True - макроблок закодирован
+              одним блоком large_blocks['block_size'], иначе четырьмя блоками block_size.
+    """
+    large_blocks = metadata['large_blocks']
+    size = large_blocks['block_size']
+    modes = {}
+    for name, encoded in large_blocks['modes'].items():
+        h_pad, w_pad = metadata[f'padded_dims_{name.lower()}']
+        rows, cols = h_pad // size, w_pad // size
+        packed = np.frombuffer(base64.b64decode(encoded), dtype=np.uint8)
+        if len(packed) * 8 < rows * cols:
+            raise ValueError(f"Флагов макроблоков {name} меньше, чем макроблоков ({rows * cols}).")
+        modes[name] = np.unpackbits(packed, count=rows * cols).astype(bool).reshape(rows, cols)
+    return modes
+
+
+def _decode_large_blocks(metadata, y_data, cb_data, cr_data, tracer, names):
+    """
+    Декодирует потоки блоков 16x16 из концов потоков компонентов.
+
+    Возвращает:
+        dict: Имя компонента -> (коэффициенты (n, 256), q_matrix, флаги макроблоков).
+    """
+    large_blocks = metadata['large_blocks']
+    size = large_blocks['block_size']
+    num_coeffs = size * size
+    # матрицы квантования больших блоков однозначно задаются матрицами 8x8
+    tables = read_tables(dict(large_blocks, **{
+        key: adjust_quantization_matrix.scale_to_block_size(np.array(metadata[key], dtype=np.uint8), size)
+        for key in ('q_table_y', 'q_table_c')}))
+    modes = macroblock_modes(metadata)
+    streams = {'Y': y_data, 'Cb': cb_data, 'Cr': cr_data}
+    decoded = {}
+    for name in names:
+        if name not in modes:
+            continue
+        q_matrix, dc_table, ac_table = tables[name]
+        data_len = large_blocks['data_len'][name]
+        data = streams[name][len(streams[name]) - data_len:]
+        num_blocks = int(np.count_nonzero(modes[name]))
+        with tracer.stage('entropy_decode', component=name, coder='huffman', block_size=large_blocks['block_size']):
+            coeffs = huffman_coding.huffman_decode_coefficients(data, dc_table, ac_table, num_blocks,
+                                                               num_coeffs=num_coeffs)
+        tracer.counter('bytes', data_len, component=name)
+        if len(coeffs):
+            tracer.counter('blocks', len(coeffs), component=name)
+        decoded[name] = (coeffs, q_matrix, modes[name])
+    return decoded
+
+
+# Количество блоков, обрабатываемых reconstruct_plane за один проход (ограничивает
+# размер промежуточных массивов float64).
+RECONSTRUCT_CHUNK_BLOCKS = 4096
+
+
+def reconstruct_plane(zigzag_coeffs, q_matrix, block_size, padded_height, padded_width, out=None):
+    """
+    Восстанавливает плоскость компонента из квантованных коэффициентов: деквантование,
+    обратное DCT, сдвиг уровня, ограничение и округление выполняются над стопками
+    блоков (n, N, N) и записываются прямо в плоскость через вид на ее блоки.
+    Результат побитно совпадает с поблочным путем (quantization.dequantize,
+    dct_2d.idct_2d_transform, + 128, clip, round, reassemble_from_blocks).
+
+    Аргументы:
+        zigzag_coeffs (np.ndarray): Коэффициенты (n_blocks, N*N) в зигзаг-порядке.
+        q_matrix (np.ndarray): Матрица квантования NxN.
+        block_size (int): Размер блока N.
+        padded_height, padded_width (int): Размеры плоскости (кратны N).
+        out (np.ndarray, optional): Плоскость (padded_height, padded_width) uint8 для результата.
+
+    Возвращает:
+        np.ndarray: Плоскость (padded_height, padded_width) uint8.
+    """
+    rows, cols = padded_height // block_size, padded_width // block_size
+    if len(zigzag_coeffs) != rows * cols:
+        raise ValueError(f"Количество блоков ({len(zigzag_coeffs)}) не соответствует "
+                         f"ожидаемому ({rows * cols}) для данных размеров.")
+    if out is None:
+        out = np.empty((padded_height, padded_width), dtype=np.uint8)
+    block_view = out.reshape(rows, block_size, cols, block_size).transpose(0, 2, 1, 3)
+    rows_per_chunk = max(1, RECONSTRUCT_CHUNK_BLOCKS // max(cols, 1))
+    for first_row in range(0, rows, rows_per_chunk):
+        last_row = min(rows, first_row + rows_per_chunk)
+        chunk = coefficient_store.to_blocks(zigzag_coeffs[first_row * cols:last_row * cols], block_size)
+        pixels = dct_2d.idct_2d_blocks(quantization.dequantize_blocks(chunk, q_matrix))
+        pixels += 128.0
+        np.clip(pixels, 0, 255, out=pixels)
+        np.round(pixels, out=pixels)
+        block_view[first_row:last_row] = pixels.reshape(last_row - first_row, cols, block_size, block_size)
+    return out
+
+
+def _reconstruct_blocks(zigzag_coeffs, q_matrix, block_size):
+    """Пиксели блоков (n, N, N) uint8 из коэффициентов, порциями по RECONSTRUCT_CHUNK_BLOCKS."""
+    blocks = np.empty((len(zigzag_coeffs), block_size, block_size), dtype=np.uint8)
+    for first in range(0, len(zigzag_coeffs), RECONSTRUCT_CHUNK_BLOCKS):
+        chunk = coefficient_store.to_blocks(zigzag_coeffs[first:first + RECONSTRUCT_CHUNK_BLOCKS], block_size)
+        pixels = dct_2d.idct_2d_blocks(quantization.dequantize_blocks(chunk, q_matrix))
+        pixels += 128.0
+        np.clip(pixels, 0, 255, out=pixels)
+        np.round(pixels, out=pixels)
+        blocks[first:first + len(chunk)] = pixels
+    return blocks
+
+
+def reconstruct_adaptive_plane(small_coeffs, q_small, large_coeffs, q_large, modes, padded_height, padded_width,
+                               out=None):
+    """
+    Восстанавливает плоскость из макроблоков разного размера: макроблоки с флагом
+    modes - из блоков 16x16, остальные - из четверок блоков 8x8 (верхний левый,
+    верхний правый, нижний левый, нижний правый) в порядке обхода макроблоков.
+
+    Аргументы:
+        small_coeffs, large_coeffs (np.ndarray): Коэффициенты блоков 8x8 и 16x16 в зигзаг-порядке.
+        q_small, q_large (np.ndarray): Матрицы квантования блоков 8x8 и 16x16.
+        modes (np.ndarray): Флаги макроблоков (rows, cols) bool.
+        padded_height, padded_width (int): Размеры плоскости (кратны 16).
+        out (np.ndarray, optional): Плоскость (padded_height, padded_width) uint8 для результата.
+
+    Возвращает:
+        np.ndarray: Плоскость (padded_height, padded_width) uint8.
+    """
+    small, large = q_small.shape[0], q_large.shape[0]
+    rows, cols = modes.shape
+    num_large = int(np.count_nonzero(modes))
+    if (rows * large, cols * large) != (padded_height, padded_width) or len(large_coeffs) != num_large \
+            or len(small_coeffs) != 4 * (modes.size - num_large):
+        raise ValueError(f"Количество блоков ({len(small_coeffs)} + {len(large_coeffs)}) не соответствует "
+                         f"флагам макроблоков для данных размеров.")
+    if out is None:
+        out = np.empty((padded_height, padded_width), dtype=np.uint8)
+    macroblocks = out.reshape(rows, large, cols, large).transpose(0, 2, 1, 3)
+    macroblocks[modes] = _reconstruct_blocks(large_coeffs, q_large, large)
+    quads = _reconstruct_blocks(small_coeffs, q_small, small).reshape(-1, 2, 2, small, small)
+    macroblocks[~modes] = quads.transpose(0, 1, 3, 2, 4).reshape(-1, large, large)
+    return out
+
+
+def _select_components(metadata, components):
+    """Проверяет запрошенные компоненты: все записанные или один из них (в порядке файла)."""
+    available = component_names(metadata)
+    if components is None:
+        return available
+    selected = tuple(name for name in available if name in components)
+    unknown = set(components) - set(available)
+    if unknown or not selected or (len(selected) > 1 and selected != available):
+        raise ValueError(f"Нельзя декодировать компоненты {tuple(components)}: "
+                         f"доступны {available} целиком или по одному.")
+    return selected
+
+
+def decode_components(metadata, y_data, cb_data, cr_data, tracer=None, session=None, out=None, components=None):
+    """
+    Восстанавливает RGB изображение из метаданных и сжатых потоков компонентов,
+    не обращаясь к файловой системе. Для файла с одним компонентом ("components": 1)
+    плоскость Y возвращается напрямую, без апсэмплинга и цветового преобразования.
+    Так же возвращается единственный компонент, выбранный через components: потоки
+    остальных не декодируются (прогрессивный файл декодируется целиком - его сканы
+    чередуют компоненты в одном потоке).
+    Цветность увеличивается вместе с преобразованием в RGB (rgb_to_ycbcr.ycbcr420_to_rgb),
+    без плоскостей Cb/Cr полного разрешения.
+
+    Аргументы:
+        metadata (dict): Метаданные контейнера.
+        y_data, cb_data, cr_data (bytes-like): Сжатые потоки компонентов Y, Cb, Cr.
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+        session (codec_session.Decoder, optional): Сессия с общими таблицами и буферами.
+        out (np.ndarray, optional): Буфер результата uint8 формы (height, width, 3),
+            для одного компонента - форма его видимой плоскости.
+        components (tuple, optional): Имена декодируемых компонентов: все записанные
+            (по умолчанию) или один, например ('Y',). Плоскость Cb/Cr имеет половинное разрешение.
+
+    Возвращает:
+        np.ndarray: RGB изображение (height, width, 3) или плоскость одного компонента
+                    (height, width), uint8 (out, если он передан), или None при ошибке.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
     try:
-        print("Восстановление таблиц и параметров...")
+        names = _select_components(metadata, components)
         block_size = metadata['block_size']
         original_width = metadata['original_width']
         original_height = metadata['original_height']
-        padded_dims = {
-            'Y': tuple(metadata['padded_dims_y']),
-            'Cb': tuple(metadata['padded_dims_cb']),
-            'Cr': tuple(metadata['padded_dims_cr'])
-        }
-
-        q_matrix_y = np.array(metadata['q_table_y'], dtype=np.uint8)
-        q_matrix_c = np.array(metadata['q_table_c'], dtype=np.uint8)
+        # начало видимой области в плоскости Y (не ноль после compressed_domain.transform)
+        offset_x = metadata.get('offset_x', 0)
+        offset_y = metadata.get('offset_y', 0)
 
-        huff_dc_y = huffman_coding.HuffmanTable(metadata['huff_dc_y_bits'], metadata['huff_dc_y_huffval'])
-        huff_ac_y = huffman_coding.HuffmanTable(metadata['huff_ac_y_bits'], metadata['huff_ac_y_huffval'])
-        huff_dc_c = huffman_coding.HuffmanTable(metadata['huff_dc_c_bits'], metadata['huff_dc_c_huffval'])
-        huff_ac_c = huffman_coding.HuffmanTable(metadata['huff_ac_c_bits'], metadata['huff_ac_c_huffval'])
+        with tracer.stage('tables'):
+            tables = read_tables(metadata, session=session)
 
+        coefficients = _decode_coefficients(metadata, y_data, cb_data, cr_data, tables, tracer, session, names)
+        large_coefficients = {}
+        if 'large_blocks' in metadata:
+            large_coefficients = _decode_large_blocks(metadata, y_data, cb_data, cr_data, tracer, names)
         reconstructed_channels = {}
 
-        for name, comp_data, dc_table, ac_table, q_matrix in [
-            ('Y', y_data, huff_dc_y, huff_ac_y, q_matrix_y),
-            ('Cb', cb_data, huff_dc_c, huff_ac_c, q_matrix_c),
-            ('Cr', cr_data, huff_dc_c, huff_ac_c, q_matrix_c)
-        ]:
-            print(f"Декодирование компонента {name}...")
-            h_pad, w_pad = padded_dims[name]
-            num_blocks_comp = (h_pad // block_size) * (w_pad // block_size)
-            if num_blocks_comp == 0 and len(comp_data) > 0:
-                 raise ValueError(f"Расчетное количество блоков 0, но есть данные для {name}")
-            elif num_blocks_comp == 0 and len(comp_data) == 0:
-                 reconstructed_channels[name] = np.zeros((0,0), dtype=np.uint8)
-                 continue
-
-            decoded_block_data = huffman_coding.huffman_decode_data(comp_data, dc_table, ac_table, num_blocks_comp)
-            if len(decoded_block_data) != num_blocks_comp:
-                 print(f"Предупреждение: декодировано {len(decoded_block_data)} блоков для {name}, ожидалось {num_blocks_comp}")
-                 num_blocks_comp = len(decoded_block_data)
-                 if num_blocks_comp == 0:
-                      reconstructed_channels[name] = np.zeros((0,0), dtype=np.uint8)
-                      continue
-
-            all_dc_diffs = []
-            quantized_blocks_list = []
-
-            print(f"  Восстановление {num_blocks_comp} квантованных блоков {name}...")
-            for dc_category, dc_vli_bits, ac_rle_pairs in decoded_block_data:
-                ac_zigzag = rle_ac_coding.rle_decode_ac_coefficients(ac_rle_pairs, block_size * block_size - 1)
-                dc_diff = vli_coding.decode_vli(dc_category, dc_vli_bits)
-                all_dc_diffs.append(dc_diff)
-                zigzag_flat = np.array([dc_diff] + ac_zigzag, dtype=np.int32)
-                if len(zigzag_flat) != block_size * block_size:
-                    raise ValueError(f"Неверная длина ({len(zigzag_flat)}) восстановленного зигзаг-массива для блока. Ожидалось {block_size*block_size}.")
-                quant_block_with_dc_diff = zigzag_scan.inverse_zigzag_scan(zigzag_flat, block_size)
-                quantized_blocks_list.append(quant_block_with_dc_diff)
-
-            print(f"  Применение обратного DPCM к DC {name}...")
-            dc_actual_values = dc_differential_coding.dpcm_decode_dc(all_dc_diffs)
-
-            if len(dc_actual_values) != len(quantized_blocks_list):
-                 raise ValueError(f"Несовпадение количества DC ({len(dc_actual_values)}) и блоков ({len(quantized_blocks_list)}) для {name}")
-
-            final_component_blocks = []
-            print(f"  Деквантование и IDCT для блоков {name}...")
-            for i, quant_block in enumerate(quantized_blocks_list):
-                quant_block[0, 0] = dc_actual_values[i]
-                dequantized_coeffs = quantization.dequantize(quant_block, q_matrix)
-                reconstructed_shifted = dct_2d.idct_2d_transform(dequantized_coeffs)
-                reconstructed_leveled = reconstructed_shifted + 128.0
-                reconstructed_final = np.clip(reconstructed_leveled, 0, 255)
-                final_component_blocks.append(np.round(reconstructed_final).astype(np.uint8))
-
-            print(f"  Сборка компонента {name}...")
-            if not final_component_blocks:
-                 reassembled_padded = np.zeros((h_pad, w_pad), dtype=np.uint8)
-            else:
-                 reassembled_padded = reassemble_from_blocks.reassemble_from_blocks(final_component_blocks, h_pad, w_pad)
+        for name, zigzag_coeffs in coefficients.items():
+            h_pad, w_pad = metadata[f'padded_dims_{name.lower()}']
+            q_matrix = tables[name][0]
+            if len(zigzag_coeffs) == 0 and name not in large_coefficients:
+                reconstructed_channels[name] = np.zeros((0,0), dtype=np.uint8)
+                continue
+
+            # плоскость оттенков серого возвращается вызывающему, поэтому буфер сессии
+            # используется только для цветного изображения
+            plane = None
+            if session is not None and 'Cb' in coefficients:
+                plane = session.buffer(('plane', name), h_pad, (w_pad,), np.uint8)
+            with tracer.stage('idct', component=name):
+                if name in large_coefficients:
+                    large_coeffs, q_large, modes = large_coefficients[name]
+                    reassembled_padded = reconstruct_adaptive_plane(zigzag_coeffs, q_matrix, large_coeffs, q_large,
+                                                                    modes, h_pad, w_pad, out=plane)
+                else:
+                    reassembled_padded = reconstruct_plane(zigzag_coeffs, q_matrix, block_size, h_pad, w_pad,
+                                                           out=plane)
 
             if name == 'Y':
+                start_y, start_x = offset_y, offset_x
                 final_h, final_w = original_height, original_width
             else:
-                final_h = math.ceil(original_height / 2)
-                final_w = math.ceil(original_width / 2)
+                # при нечетном смещении первая строка (столбец) Y попадает на вторую половину отсчета Cb/Cr
+                start_y, start_x = offset_y // 2, offset_x // 2
+                final_h = math.ceil((offset_y % 2 + original_height) / 2)
+                final_w = math.ceil((offset_x % 2 + original_width) / 2)
 
-            final_h = min(final_h, h_pad)
-            final_w = min(final_w, w_pad)
+            final_h = min(final_h, h_pad - start_y)
+            final_w = min(final_w, w_pad - start_x)
 
-            reconstructed_channels[name] = reassembled_padded[:final_h, :final_w]
-            print(f"    Финальный размер {name}: {reconstructed_channels[name].shape}")
+            reconstructed_channels[name] = reassembled_padded[start_y:start_y + final_h, start_x:start_x + final_w]
+
+        if len(reconstructed_channels) == 1:
+            (plane,) = reconstructed_channels.values()
+            if out is not None:
+                np.copyto(out, plane)
+                return out
+            return np.ascontiguousarray(plane)
 
-        print("Апсэмплинг Cb и Cr...")
         y_final = reconstructed_channels['Y']
-        target_h, target_w = y_final.shape
+        cb_final, cr_final = reconstructed_channels['Cb'], reconstructed_channels['Cr']
+        if cb_final.size == 0 or cr_final.size == 0:
+            tracer.warning("Каналы Cb/Cr пусты после декомпрессии/обрезки. Возможно, исходное изображение было < 2x2.")
+            chroma_shape = (math.ceil(y_final.shape[0] / 2), math.ceil(y_final.shape[1] / 2))
+            cb_final = cr_final = np.full(chroma_shape, 128, dtype=np.uint8)
 
-        if reconstructed_channels['Cb'].size == 0 or reconstructed_channels['Cr'].size == 0:
-            print("Предупреждение: Каналы Cb/Cr пусты после декомпрессии/обрезки. Возможно, исходное изображение было < 2x2.")
-            cb_upsampled = np.full((target_h, target_w), 128, dtype=np.uint8)
-            cr_upsampled = np.full((target_h, target_w), 128, dtype=np.uint8)
-        else:
-            cb_upsampled = downsample_channel.upsample_channel_nearest_neighbor(reconstructed_channels['Cb'], target_h, target_w)
-            cr_upsampled = downsample_channel.upsample_channel_nearest_neighbor(reconstructed_channels['Cr'], target_h, target_w)
+        with tracer.stage('color'):
+            final_rgb = rgb_to_ycbcr.ycbcr420_to_rgb(y_final, cb_final, cr_final, out=out,
+                                                     parity=(offset_y % 2, offset_x % 2))
 
-        print(f"  Размер Y : {y_final.shape}")
-        print(f"  Размер Cb (US): {cb_upsampled.shape}")
-        print(f"  Размер Cr (US): {cr_upsampled.shape}")
+        return final_rgb
 
-        if not (y_final.shape == cb_upsampled.shape == cr_upsampled.shape):
-             raise ValueError(f"Размеры каналов после апсэмплинга не совпадают: "
-                              f"Y={y_final.shape}, Cb={cb_upsampled.shape}, Cr={cr_upsampled.shape}")
+    except Exception as e:
+        tracer.error(f"Ошибка во время процесса декомпрессии: {e}", exception=e)
+        return None
 
-        final_ycbcr = np.stack((y_final, cb_upsampled, cr_upsampled), axis=-1)
-        final_rgb = rgb_to_ycbcr.ycbcr_to_rgb(final_ycbcr)
 
-        print(f"Сохранение восстановленного изображения в {output_path}...")
-        img_out = Image.fromarray(final_rgb)
-        img_out.save(output_path)
+def decompress_bytes(data, tracer=None, session=None, out=None, components=None):
+    """
+    Декодирует сжатое изображение из памяти в RGB массив (или в массив оттенков серого
+    для файла с одним компонентом).
+    Контейнер разбирается через memoryview: потоки компонентов не копируются
+    и читаются декодером Хаффмана напрямую из data.
+
+    Аргументы:
+        data (bytes | bytearray | memoryview): Содержимое сжатого файла.
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+        session (codec_session.Decoder, optional): Сессия с общими таблицами и буферами.
+        out (np.ndarray, optional): Буфер результата (см. decode_components).
+        components (tuple, optional): Декодируемые компоненты (см. decode_components).
+
+    Возвращает:
+        np.ndarray: RGB изображение (height, width, 3) или оттенки серого (height, width), uint8,
+                    или None при ошибке.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    with tracer.stage('decompress'):
+        return _decompress_bytes(data, tracer, session, out, components)
 
-        print(f"Декомпрессия '{compressed_path}' завершена. Результат в '{output_path}'.")
-        return final_rgb
 
-    except Exception as e:
-        print(f"Ошибка во время процесса декомпрессии: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc()
+def _decompress_bytes(data, tracer, session=None, out=None, components=None):
+    with tracer.stage('load'):
+        metadata, y_data, cb_data, cr_data = parse_compressed_data(data, tracer=tracer)
+    if metadata is None:
         return None
+    return decode_components(metadata, y_data, cb_data, cr_data, tracer=tracer, session=session, out=out,
+                             components=components)
 
 
-def display_compressed_image(compressed_path):
+def decode_to_array(source, cache=None, tracer=None, session=None):
+    """
+    Декодирует сжатое изображение в RGB массив без записи промежуточных файлов.
+
+    Аргументы:
+        source (str | os.PathLike | bytes | bytearray | memoryview): Путь к сжатому файлу
+            или его содержимое в памяти.
+        cache (DecodedImageCache, optional): Кэш декодированных изображений. Ключ - путь,
+            время изменения и размер файла (или SHA-256 содержимого для данных в памяти).
+            Изображения из кэша доступны только для чтения.
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+        session (codec_session.Decoder, optional): Сессия с общими таблицами и буферами.
+
+    Возвращает:
+        np.ndarray: RGB изображение (height, width, 3) или оттенки серого (height, width), uint8,
+                    или None при ошибке.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    key = None
+    if cache is not None:
+        try:
+            key = decoded_image_cache.source_key(source)
+        except OSError as e:
+            tracer.error(f"Ошибка: Файл не найден {source}", exception=e)
+            return None
+        cached = cache.get(key)
+        if cached is not None:
+            tracer.counter('cache_hits', 1)
+            return cached
+
+    with tracer.stage('decompress', path=source if isinstance(source, (str, os.PathLike)) else None):
+        if isinstance(source, (str, os.PathLike)):
+            with tracer.stage('load'):
+                image = open_compressed_image(source, tracer=tracer)
+            if image is None:
+                return None
+            tracer.counter('header_bytes', image.header_bytes)
+            with image:
+                final_rgb = image.decompress(tracer=tracer, session=session)
+        else:
+            final_rgb = _decompress_bytes(source, tracer, session)
+
+    if final_rgb is not None and cache is not None:
+        cache.put(key, final_rgb)
+    return final_rgb
+
+
+def decode_to_pil(source, cache=None, tracer=None):
+    """
+    Декодирует сжатое изображение в объект PIL.Image (режим RGB, для файла с одним компонентом - L).
+    Аргументы совпадают с decode_to_array. Возвращает None при ошибке.
+    """
+    final_rgb = decode_to_array(source, cache=cache, tracer=tracer)
+    if final_rgb is None:
+        return None
+    return Image.fromarray(final_rgb)
+
+
+def display_compressed_image(compressed_path, cache=None, tracer=None):
     """Декомпрессирует и отображает изображение с помощью Pillow."""
-    print(f"Попытка отображения сжатого изображения: {compressed_path}")
+    tracer = instrumentation.resolve_tracer(tracer)
     if not os.path.exists(compressed_path):
-         print(f"Ошибка: Файл не найден {compressed_path}", file=sys.stderr)
+         tracer.error(f"Ошибка: Файл не найден {compressed_path}")
          return
 
-    import tempfile
-    temp_file = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_f:
-            temp_output_path = temp_f.name
-        print(f"Декомпрессия во временный файл: {temp_output_path}")
-
-        decompressed_rgb = decompress_image(compressed_path, temp_output_path)
-
-        if decompressed_rgb is not None:
-            print(f"Показ изображения из {temp_output_path}...")
-            img_display = Image.open(temp_output_path)
+        img_display = decode_to_pil(compressed_path, cache=cache, tracer=tracer)
+        if img_display is not None:
             img_display.show()
-
         else:
-            print("Декомпрессия не удалась, отображение невозможно.")
+            tracer.warning("Декомпрессия не удалась, отображение невозможно.")
 
     except Exception as e:
-        print(f"Ошибка при декомпрессии или отображении: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc()
-    finally:
-        if 'temp_output_path' in locals() and os.path.exists(temp_output_path):
-            try:
-                os.remove(temp_output_path)
-                print(f"Временный файл {temp_output_path} удален.")
-            except OSError as rm_err:
-                print(f"Не удалось удалить временный файл {temp_output_path}: {rm_err}", file=sys.stderr)
\ No newline at end of file
+        tracer.error(f"Ошибка при декомпрессии или отображении: {e}", exception=e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Декомпрессия файлов MYJPEG.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="Сведения из заголовка (потоки компонентов не читаются).")
+    info.add_argument("inputs", nargs="+")
+    decode = commands.add_parser("decode", help="Декодировать файл в изображение.")
+    decode.add_argument("input")
+    decode.add_argument("output")
+    decode.add_argument("-c", "--component", choices=("Y", "Cb", "Cr"),
+                        help="Декодировать только один компонент (оттенки серого).")
+    args = parser.parse_args(argv)
+
+    error_collector = instrumentation.ErrorCollector()
+    if args.command == "info":
+        status = 0
+        for path in args.inputs:
+            image = open_compressed_image(path, tracer=error_collector)
+            if image is None:
+                status = 1
+                continue
+            with image:
+                info = image.info()
+            payload = ", ".join(f"{name} {size}" for name, size in info['payload_bytes'].items())
+            print(f"{path}\t{info['width']}x{info['height']}\tq={info['quality']}\tN={info['block_size']}"
+                  f"\t{info['entropy_coder']}{' progressive' if info['progressive'] else ''}"
+                  f"{' adaptive' if info['adaptive_blocks'] else ''}"
+                  f"\tзаголовок {info['header_bytes']} байт\tпотоки: {payload}")
+    else:
+        components = (args.component,) if args.component else None
+        status = 0 if decompress_image(args.input, args.output, tracer=error_collector,
+                                       components=components) is not None else 1
+    for message in error_collector.errors:
+        print(message, file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
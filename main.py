@@ -3,6 +3,7 @@ import os
 from pathlib import Path
 from jpeg_compressor import compress_image
 from jpeg_decompressor import decompress_image
+from distortion_estimate import DistortionEstimator
 
 def write_table(filename, new_data):
     file_exists = Path(filename).exists()
@@ -10,7 +11,7 @@ def write_table(filename, new_data):
     with open(filename, 'a', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
         if not file_exists:
-            writer.writerow(["Коэффициент качества сжатия", "Размер сжатого файла"])
+            writer.writerow(["Коэффициент качества сжатия", "Размер сжатого файла", "PSNR (оценка), дБ"])
         writer.writerow(new_data)
 
 
@@ -29,10 +30,12 @@ for file in files:
             quality = i
 
         current_raw_file = f"{current_folder}/{file[:-4]} {quality}.raw"
-        compress_image(f"data/{file}", current_raw_file, quality=quality)
+        distortion = DistortionEstimator()
+        compress_image(f"data/{file}", current_raw_file, quality=quality, distortion=distortion)
 
         if i in [0, 20, 40, 60, 80, 100]:
             decompress_image(current_raw_file, f"{current_folder}/{file[:-4]} {i}.png")
 
-        write_table(f"{current_folder}/{file[:-4]}.csv", [i, os.path.getsize(current_raw_file)])
+        write_table(f"{current_folder}/{file[:-4]}.csv",
+                    [i, os.path.getsize(current_raw_file), round(distortion.report()['psnr'], 2)])
         os.remove(current_raw_file)
\ No newline at end of file
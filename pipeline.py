@@ -0,0 +1,233 @@
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation
+
+
+# Признак конца потока заданий в очереди между стадиями.
+_DONE = object()
+
+
+class Stage:
+    """
+    Стадия конвейера: функция func(item) -> item, выполняемая workers исполнителями.
+    Стадии ввода-вывода (чтение, декодирование PNG, запись) выполняются потоками:
+    zlib и файловые операции отпускают GIL. Вычислительные стадии (processes=True)
+    выполняются в своем пуле процессов; тогда func и элементы должны сериализоваться pickle,
+    а время работы включает их передачу между процессами.
+    """
+    def __init__(self, name, func, workers=1, processes=False):
+        """
+        Аргументы:
+            name (str): Имя стадии в статистике.
+            func (callable): Обработчик элемента (для processes=True - функция уровня модуля).
+            workers (int): Количество параллельных исполнителей.
+            processes (bool): Выполнять ли func в отдельных процессах.
+        """
+        if workers < 1:
+            raise ValueError(f"Количество исполнителей стадии {name!r} должно быть положительным: {workers}")
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.processes = processes
+
+
+class _StageCounters:
+    """Счетчики стадии, обновляемые ее исполнителями под общей блокировкой."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.wait_input = 0.0
+        self.wait_output = 0.0
+        self.finished_workers = 0
+        self.queue_high_water = 0
+
+
+class Pipeline:
+    """
+    Конвейер стадий, связанных ограниченными очередями: пока одна стадия ждет диск,
+    другие заняты вычислениями, а заполненная очередь приостанавливает предыдущие
+    стадии, поэтому в памяти находится не больше queue_size элементов на каждую очередь
+    плюс элементы в работе.
+
+    Исключение в стадии не останавливает конвейер: элемент помечается ошибкой
+    и проходит остальные стадии без обработки.
+
+    Для каждой стадии считаются обработанные элементы, время работы исполнителей,
+    время ожидания входа (стадия простаивает - предыдущие не успевают) и выхода
+    (следующие не успевают), загрузка busy / (workers * время конвейера) и наибольшая
+    длина входной очереди. Стадия с загрузкой около 1 и полной входной очередью -
+    узкое место, ей нужны еще исполнители.
+    """
+    def __init__(self, stages, queue_size=4, tracer=None):
+        """
+        Аргументы:
+            stages (list[Stage]): Стадии по порядку.
+            queue_size (int): Емкость каждой очереди между стадиями.
+            tracer (instrumentation.Tracer, optional): Получатель счетчиков стадий после run.
+        """
+        if not stages:
+            raise ValueError("Конвейер должен содержать хотя бы одну стадию.")
+        self.stages = list(stages)
+        self.queue_size = max(1, queue_size)
+        self.tracer = instrumentation.resolve_tracer(tracer)
+        self._counters = [_StageCounters() for _ in self.stages]
+        self.elapsed = 0.0
+
+    def run(self, items):
+        """
+        Пропускает элементы через все стадии.
+
+        Аргументы:
+            items (iterable): Входные элементы (читаются по мере освобождения места в очереди).
+
+        Возвращает:
+            iterator[tuple]: (index, result, error) в порядке завершения: index - номер элемента
+                во входной последовательности, error - None или (имя стадии, исключение).
+                Если перебор прерван, оставшиеся элементы пропускаются без обработки.
+                Исключение при чтении items передается вызывающему после того, как
+                уже прочитанные элементы прошли конвейер.
+        """
+        self._counters = [_StageCounters() for _ in self.stages]
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        cancelled = threading.Event()
+        feed_errors = []
+        pools = [ProcessPoolExecutor(max_workers=stage.workers) if stage.processes else None
+                 for stage in self.stages]
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0], cancelled, feed_errors), daemon=True)]
+        for position, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(position, pools[position], queues[position], queues[position + 1],
+                                             cancelled), daemon=True))
+
+        start = time.perf_counter()
+        with self.tracer.stage('pipeline', stages=len(self.stages)):
+            for thread in threads:
+                thread.start()
+            try:
+                while True:
+                    item = queues[-1].get()
+                    if item is _DONE:
+                        break
+                    yield item
+                if feed_errors:
+                    raise feed_errors[0]
+            finally:
+                cancelled.set()
+                # дочитываем выход, чтобы исполнители не остались заблокированными на put
+                while any(thread.is_alive() for thread in threads):
+                    try:
+                        queues[-1].get(timeout=0.05)
+                    except queue.Empty:
+                        pass
+                for pool in pools:
+                    if pool is not None:
+                        pool.shutdown()
+                self.elapsed = time.perf_counter() - start
+                self._report_counters()
+
+    def _feed(self, items, output, cancelled, errors):
+        counters = self._counters[0]
+        try:
+            for index, item in enumerate(items):
+                if cancelled.is_set():
+                    break
+                output.put((index, item, None))
+                with counters.lock:
+                    counters.queue_high_water = max(counters.queue_high_water, output.qsize())
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # признак конца отправляется и при ошибке чтения items, иначе run ждал бы выход вечно
+            for _ in range(self.stages[0].workers):
+                output.put(_DONE)
+
+    def _work(self, position, pool, input_queue, output_queue, cancelled):
+        stage = self.stages[position]
+        counters = self._counters[position]
+        next_counters = self._counters[position + 1] if position + 1 < len(self.stages) else None
+        busy = wait_input = wait_output = 0.0
+        items = failed = 0
+        while True:
+            started = time.perf_counter()
+            item = input_queue.get()
+            wait_input += time.perf_counter() - started
+            if item is _DONE:
+                break
+            index, value, error = item
+            if error is None and not cancelled.is_set():
+                started = time.perf_counter()
+                try:
+                    value = pool.submit(stage.func, value).result() if pool is not None else stage.func(value)
+                except Exception as e:
+                    value, error = None, (stage.name, e)
+                    failed += 1
+                busy += time.perf_counter() - started
+                items += 1
+            started = time.perf_counter()
+            output_queue.put((index, value, error))
+            wait_output += time.perf_counter() - started
+            if next_counters is not None:
+                with next_counters.lock:
+                    next_counters.queue_high_water = max(next_counters.queue_high_water, output_queue.qsize())
+
+        with counters.lock:
+            counters.items += items
+            counters.failed += failed
+            counters.busy += busy
+            counters.wait_input += wait_input
+            counters.wait_output += wait_output
+            counters.finished_workers += 1
+            last = counters.finished_workers == stage.workers
+        if last:
+            # последний исполнитель стадии передает признак конца каждому исполнителю следующей
+            for _ in range(self.stages[position + 1].workers if position + 1 < len(self.stages) else 1):
+                output_queue.put(_DONE)
+
+    def stats(self):
+        """
+        Статистика последнего запуска.
+
+        Возвращает:
+            dict: {'elapsed': секунды, 'stages': {имя: {'kind', 'workers', 'items', 'failed',
+                   'busy_s', 'wait_input_s', 'wait_output_s', 'utilisation', 'queue_high_water'}}}
+        """
+        stages = {}
+        for stage, counters in zip(self.stages, self._counters):
+            capacity = stage.workers * self.elapsed
+            stages[stage.name] = {
+                'kind': 'process' if stage.processes else 'thread',
+                'workers': stage.workers,
+                'items': counters.items,
+                'failed': counters.failed,
+                'busy_s': counters.busy,
+                'wait_input_s': counters.wait_input,
+                'wait_output_s': counters.wait_output,
+                'utilisation': counters.busy / capacity if capacity > 0 else 0.0,
+                'queue_high_water': counters.queue_high_water,
+            }
+        return {'elapsed': self.elapsed, 'stages': stages}
+
+    def _report_counters(self):
+        for name, entry in self.stats()['stages'].items():
+            self.tracer.counter('pipeline_items', entry['items'], component=name)
+            self.tracer.counter('pipeline_busy_seconds', entry['busy_s'], component=name)
+            self.tracer.counter('pipeline_utilisation', entry['utilisation'], component=name)
+
+    def report(self, stream=None):
+        """Записывает таблицу загрузки стадий в stream (по умолчанию stdout)."""
+        stream = stream if stream is not None else sys.stdout
+        stats = self.stats()
+        stream.write(f"{'Стадия':<12}{'Тип':>9}{'Исп.':>6}{'Элем.':>7}{'Работа, с':>11}"
+                     f"{'Ждет вход, с':>14}{'Ждет выход, с':>15}{'Загрузка':>10}{'Очередь':>9}\n")
+        for name, entry in stats['stages'].items():
+            stream.write(f"{name:<12}{entry['kind']:>9}{entry['workers']:>6}{entry['items']:>7}"
+                         f"{entry['busy_s']:>11.2f}{entry['wait_input_s']:>14.2f}{entry['wait_output_s']:>15.2f}"
+                         f"{entry['utilisation']:>10.0%}{entry['queue_high_water']:>9}\n")
+        stream.write(f"Время конвейера: {stats['elapsed']:.2f} с\n")
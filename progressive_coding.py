@@ -0,0 +1,347 @@
+import numpy as np
+
+import instrumentation
+import coefficient_store
+import huffman_coding
+import dc_differential_coding
+import rle_ac_coding
+import vli_coding
+
+
+# Скан прогрессивного режима описывается как в ITU-T T.81 (G.1.1):
+#   (Ss, Se, Ah, Al) - диапазон коэффициентов в зигзаг-порядке [Ss, Se], Ah - точка
+#   преобразования предыдущего скана этих коэффициентов (0 для первого скана),
+#   Al - точка преобразования текущего скана (значение делится на 2^Al).
+# DC (Ss = Se = 0) всегда кодируется в отдельном скане. Скрипт применяется к каждому
+# компоненту по очереди: первый скан Y, Cb, Cr, затем второй и т.д., поэтому любой
+# префикс файла содержит сначала грубое приближение всего изображения.
+
+# Только спектральная селекция: DC, затем полосы AC 1-5, 6-20, 21-63.
+DEFAULT_SCAN_SCRIPT = (
+    (0, 0, 0, 0),
+    (1, 5, 0, 0),
+    (6, 20, 0, 0),
+    (21, 63, 0, 0),
+)
+
+# Спектральная селекция с последовательным приближением (как в libjpeg по умолчанию).
+SUCCESSIVE_APPROXIMATION_SCAN_SCRIPT = (
+    (0, 0, 0, 1),
+    (1, 5, 0, 2),
+    (6, 63, 0, 2),
+    (1, 63, 2, 1),
+    (0, 0, 1, 0),
+    (1, 63, 1, 0),
+)
+
+_EOB = 0x00
+_ZRL = 0xF0
+
+
+def resolve_scan_script(progressive, num_coeffs=64):
+    """
+    Приводит параметр progressive к списку сканов (Ss, Se, Ah, Al) и проверяет,
+    что после всех сканов каждый коэффициент восстанавливается точно.
+
+    Аргументы:
+        progressive (bool | str | list): True - DEFAULT_SCAN_SCRIPT,
+            'refine' - SUCCESSIVE_APPROXIMATION_SCAN_SCRIPT, либо свой список сканов.
+        num_coeffs (int): Количество коэффициентов в блоке.
+
+    Возвращает:
+        list[tuple]: Скрипт сканов или None, если progressive ложно (базовый режим).
+    """
+    if not progressive:
+        return None
+    if progressive is True:
+        script = DEFAULT_SCAN_SCRIPT
+    elif progressive == 'refine':
+        script = SUCCESSIVE_APPROXIMATION_SCAN_SCRIPT
+    else:
+        script = progressive
+
+    script = [tuple(int(v) for v in scan) for scan in script]
+    precision = [None] * num_coeffs
+    for ss, se, ah, al in script:
+        if not (0 <= ss <= se < num_coeffs):
+            raise ValueError(f"Некорректный диапазон скана [{ss}, {se}] для {num_coeffs} коэффициентов.")
+        if ss == 0 and se != 0:
+            raise ValueError("DC коэффициент кодируется в отдельном скане (Ss = Se = 0).")
+        if al < 0 or (ah != 0 and ah != al + 1):
+            raise ValueError(f"Некорректные Ah={ah}, Al={al}: уточняющий скан должен иметь Ah = Al + 1.")
+        for k in range(ss, se + 1):
+            expected = None if ah == 0 else ah
+            if precision[k] != expected:
+                raise ValueError(f"Скан ({ss}, {se}, {ah}, {al}) не согласован с предыдущими сканами коэффициента {k}.")
+            precision[k] = al
+    if any(p != 0 for p in precision):
+        raise ValueError("Скрипт сканов не восстанавливает все коэффициенты с точностью Al = 0.")
+    return script
+
+
+def encode_scan(zigzag_coeffs, ss, se, ah, al, dc_table, ac_table):
+    """
+    Кодирует один скан компонента.
+
+    Аргументы:
+        zigzag_coeffs (np.ndarray): Квантованные коэффициенты (n_blocks, 64) в зигзаг-порядке,
+                                    DC - абсолютные значения.
+        ss, se, ah, al (int): Параметры скана.
+        dc_table, ac_table (HuffmanTable): Таблицы Хаффмана компонента.
+
+    Возвращает:
+        bytes: Закодированный скан (с байт-стаффингом, как базовый поток).
+    """
+    bit_writer = huffman_coding.BitWriter()
+    if ss == 0:
+        dc_values = zigzag_coeffs[:, 0].astype(np.int32)
+        if ah == 0:
+            for dc_diff in dc_differential_coding.dpcm_encode_dc(dc_values >> al):
+                dc_category, dc_vli_bits = vli_coding.get_vli_category_and_value(dc_diff)
+                huffman_coding.encode_dc_symbol(bit_writer, dc_category, dc_vli_bits, dc_table)
+        else:
+            for bit in ((dc_values >> al) & 1).tolist():
+                bit_writer.write_bit(bit)
+    else:
+        band = zigzag_coeffs[:, ss:se + 1].astype(np.int32)
+        if ah == 0:
+            band = np.sign(band) * (np.abs(band) >> al)
+            nonzero = band != 0
+            # конец значимой части полосы: хвостовые нули кодируются одним EOB, без ZRL
+            lengths = np.where(nonzero.any(axis=1), band.shape[1] - np.argmax(nonzero[:, ::-1], axis=1), 0)
+            for row, length in zip(band.tolist(), lengths.tolist()):
+                huffman_coding.encode_ac_pairs(bit_writer, rle_ac_coding.rle_encode_ac_coefficients(row[:length]), ac_table)
+        else:
+            for row in band.tolist():
+                _encode_ac_refinement(bit_writer, row, al, ac_table)
+    return bit_writer.get_byte_string()
+
+
+def _write_symbol(bit_writer, ac_table, symbol):
+    code_info = ac_table.get_code(symbol)
+    if code_info is None:
+        raise ValueError(f"Символ AC 0x{symbol:02X} не найден в таблице Хаффмана.")
+    code, length = code_info
+    bit_writer.write_bits(code, length)
+
+
+def _encode_ac_refinement(bit_writer, band, al, ac_table):
+    """
+    Уточняющий скан AC (G.1.2.3): коэффициенты, ставшие ненулевыми на этом бите, кодируются
+    символами (run, 1) и битом знака; для уже ненулевых коэффициентов передается один
+    корректирующий бит. Корректирующие биты, встреченные во время серии нулей, пишутся
+    после символа, завершившего серию (или после EOB в конце полосы). ZRL откладываются
+    до следующего нового коэффициента: хвостовые серии нулей покрывает EOB.
+    """
+    pending_zrl = []
+    corrections = []
+    run = 0
+    for value in band:
+        magnitude = abs(value)
+        if magnitude >> (al + 1):
+            corrections.append((magnitude >> al) & 1)
+        elif magnitude >> al:
+            for zrl_corrections in pending_zrl:
+                _write_symbol(bit_writer, ac_table, _ZRL)
+                for bit in zrl_corrections:
+                    bit_writer.write_bit(bit)
+            _write_symbol(bit_writer, ac_table, (run << 4) | 1)
+            bit_writer.write_bit(1 if value > 0 else 0)
+            for bit in corrections:
+                bit_writer.write_bit(bit)
+            pending_zrl = []
+            corrections = []
+            run = 0
+        else:
+            run += 1
+            if run == 16:
+                pending_zrl.append(corrections)
+                corrections = []
+                run = 0
+    _write_symbol(bit_writer, ac_table, _EOB)
+    for zrl_corrections in pending_zrl:
+        for bit in zrl_corrections:
+            bit_writer.write_bit(bit)
+    for bit in corrections:
+        bit_writer.write_bit(bit)
+
+
+def decode_scan(scan_data, coefficients, ss, se, ah, al, dc_table, ac_table, tracer=None):
+    """
+    Декодирует один скан компонента и дополняет коэффициенты.
+
+    Аргументы:
+        scan_data (bytes-like): Данные скана (могут быть обрезаны).
+        coefficients (np.ndarray): Коэффициенты (n_blocks, N*N) в зигзаг-порядке
+            (coefficient_store.COEFF_DTYPE), изменяются на месте.
+        ss, se, ah, al (int): Параметры скана.
+        dc_table, ac_table (HuffmanTable): Таблицы Хаффмана компонента.
+        tracer (instrumentation.Tracer, optional): Получатель предупреждений.
+
+    Возвращает:
+        int: Количество полностью декодированных блоков. При обрыве данных уже
+             декодированные блоки сохраняются - это дает предварительный просмотр.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    bit_reader = huffman_coding.BitReader(scan_data)
+    decoded = 0
+    try:
+        if ss == 0 and ah == 0:
+            pred = 0
+            for row in coefficients:
+                dc_category = dc_table.decode_symbol(bit_reader, tracer)
+                if dc_category is None:
+                    raise EOFError(f"Не удалось декодировать DC категорию блока {decoded + 1}.")
+                dc_bits = bit_reader.read_bits(dc_category)
+                pred += vli_coding.decode_vli(dc_category, format(dc_bits, f'0{dc_category}b') if dc_category else "")
+                row[0] = pred << al
+                decoded += 1
+        elif ss == 0:
+            for row in coefficients:
+                bit = bit_reader.read_bit()
+                if bit is None:
+                    raise EOFError(f"Конец данных на уточнении DC блока {decoded + 1}.")
+                row[0] |= bit << al
+                decoded += 1
+        elif ah == 0:
+            for row in coefficients:
+                _decode_ac_first(bit_reader, row, ss, se, al, ac_table, tracer)
+                decoded += 1
+        else:
+            for row in coefficients:
+                _decode_ac_refinement(bit_reader, row, ss, se, al, ac_table, tracer)
+                decoded += 1
+    except EOFError as e:
+        tracer.warning(f"Скан ({ss}, {se}, {ah}, {al}) оборван: декодировано {decoded} из {len(coefficients)} блоков. {e}")
+    except (ValueError, OverflowError) as e:
+        tracer.warning(f"Ошибка значения в скане ({ss}, {se}, {ah}, {al}) в блоке {decoded + 1}: {e}")
+    return decoded
+
+
+def _decode_ac_first(bit_reader, row, ss, se, al, ac_table, tracer):
+    k = ss
+    while True:
+        symbol = ac_table.decode_symbol(bit_reader, tracer)
+        if symbol is None:
+            raise EOFError("Не удалось декодировать AC символ.")
+        if symbol == _EOB:
+            return
+        if symbol == _ZRL:
+            k += 16
+            continue
+        run_length = symbol >> 4
+        ac_category = symbol & 0x0F
+        k += run_length
+        if k > se:
+            raise ValueError(f"Серия выходит за границу полосы [{ss}, {se}].")
+        ac_bits = bit_reader.read_bits(ac_category)
+        row[k] = vli_coding.decode_vli(ac_category, format(ac_bits, f'0{ac_category}b')) * (1 << al)
+        k += 1
+
+
+def _decode_ac_refinement(bit_reader, row, ss, se, al, ac_table, tracer):
+    step = 1 << al
+    k = ss
+    while True:
+        symbol = ac_table.decode_symbol(bit_reader, tracer)
+        if symbol is None:
+            raise EOFError("Не удалось декодировать AC символ уточнения.")
+        new_value = None
+        if symbol == _EOB:
+            zeros = se - k + 1
+        elif symbol == _ZRL:
+            zeros = 16
+        else:
+            if symbol & 0x0F != 1:
+                raise ValueError(f"Некорректный символ уточнения 0x{symbol:02X}.")
+            zeros = symbol >> 4
+            sign = bit_reader.read_bit()
+            if sign is None:
+                raise EOFError("Конец данных на бите знака.")
+            new_value = step if sign else -step
+
+        while k <= se:
+            value = row[k]
+            k += 1
+            if value != 0:
+                bit = bit_reader.read_bit()
+                if bit is None:
+                    raise EOFError("Конец данных на корректирующем бите.")
+                if bit:
+                    row[k - 1] = value + step if value > 0 else value - step
+            elif new_value is not None and zeros == 0:
+                row[k - 1] = new_value
+                break
+            else:
+                zeros -= 1
+                if zeros == 0 and symbol == _ZRL:
+                    break
+        else:
+            if new_value is not None:
+                raise ValueError(f"Новый коэффициент выходит за границу полосы [{ss}, {se}].")
+        if symbol == _EOB:
+            return
+
+
+def encode_progressive(components, script, tracer=None):
+    """
+    Кодирует компоненты последовательностью сканов.
+
+    Аргументы:
+        components (list[tuple]): [(имя, коэффициенты (n_blocks, 64) в зигзаг-порядке, dc_table, ac_table), ...]
+        script (list[tuple]): Скрипт сканов (см. resolve_scan_script).
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+
+    Возвращает:
+        tuple[list[dict], bytes]: Описания сканов для метаданных
+            ({"component", "ss", "se", "ah", "al", "length"}) и данные всех сканов подряд.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    scans = []
+    chunks = []
+    for ss, se, ah, al in script:
+        for name, zigzag_coeffs, dc_table, ac_table in components:
+            with tracer.stage('entropy', component=name, scan=len(scans)):
+                data = encode_scan(zigzag_coeffs, ss, se, ah, al, dc_table, ac_table)
+            scans.append({"component": name, "ss": ss, "se": se, "ah": ah, "al": al, "length": len(data)})
+            chunks.append(data)
+            tracer.counter('bytes', len(data), component=name)
+    return scans, b''.join(chunks)
+
+
+def decode_progressive(scans, scan_data, num_blocks, tables, num_coeffs=64, tracer=None):
+    """
+    Декодирует сканы, записанные encode_progressive. Если данные обрезаны, декодируются
+    все доступные сканы (последний - частично), остальные коэффициенты остаются нулевыми.
+
+    Аргументы:
+        scans (list[dict]): Описания сканов из метаданных.
+        scan_data (bytes-like): Данные сканов подряд (могут быть обрезаны).
+        num_blocks (dict): Имя компонента -> количество блоков.
+        tables (dict): Имя компонента -> (dc_table, ac_table).
+        num_coeffs (int): Количество коэффициентов в блоке (N*N).
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+
+    Возвращает:
+        dict: Имя компонента -> np.ndarray (n_blocks, num_coeffs) коэффициентов в зигзаг-порядке
+              (coefficient_store.COEFF_DTYPE).
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    coefficients = {name: coefficient_store.allocate(count, num_coeffs) for name, count in num_blocks.items()}
+    view = memoryview(scan_data)
+    offset = 0
+    complete_scans = 0
+    for index, scan in enumerate(scans):
+        if offset >= len(view):
+            break
+        name = scan["component"]
+        chunk = view[offset:offset + scan["length"]]
+        offset += scan["length"]
+        dc_table, ac_table = tables[name]
+        with tracer.stage('entropy_decode', component=name, scan=index):
+            decode_scan(chunk, coefficients[name], scan["ss"], scan["se"], scan["ah"], scan["al"],
+                        dc_table, ac_table, tracer=tracer)
+        if len(chunk) == scan["length"]:
+            complete_scans += 1
+    tracer.counter('scans', complete_scans, total=len(scans))
+    return coefficients
@@ -38,4 +38,17 @@ def dequantize(quantized_coeffs_block, quantization_matrix):
 
     dequantized_coeffs = quantized_coeffs_block.astype(np.float64) * quantization_matrix.astype(np.float64)
 
-    return dequantized_coeffs
\ No newline at end of file
+    return dequantized_coeffs
+
+
+def dequantize_blocks(quantized_blocks, quantization_matrix):
+    """
+    Обратное квантование стопки блоков (n, N, N) одной матрицей, как dequantize для каждого блока.
+
+    Возвращает:
+        np.ndarray: Блоки (n, N, N) де-квантованных коэффициентов DCT (тип float64).
+    """
+    if quantized_blocks.shape[-2:] != quantization_matrix.shape:
+        raise ValueError("Размеры блоков квантованных коэффициентов и матрицы квантования должны совпадать.")
+
+    return quantized_blocks.astype(np.float64) * quantization_matrix.astype(np.float64)
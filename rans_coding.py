@@ -0,0 +1,435 @@
+import numpy as np
+
+import instrumentation
+import coefficient_store
+
+
+# Адаптивный контекстный rANS-кодер квантованных коэффициентов одного компонента.
+#
+# Коэффициенты блока превращаются в последовательность двоичных решений:
+#   DC (разность с предыдущим блоком):  ноль? -> знак -> категория (унарно) -> биты мантиссы
+#   AC, начиная с позиции k = 1:         конец блока (EOB)? -> ноль? ... ноль? -> значение
+#                                        (знак, категория, мантисса) -> снова EOB? ...
+# Каждое решение кодируется с вероятностью из своего контекста. Контексты зависят от
+# полосы зигзаг-позиции (_BANDS), длины текущей серии нулей, числа ненулевых коэффициентов
+# в блоке и категории DC предыдущего блока. Каждый компонент кодируется отдельным потоком
+# со своей моделью, поэтому контексты различаются и по компонентам.
+#
+# Модель контекста - счетчики нулей и единиц, вероятность нуля p = n0 * 4096 / (n0 + n1);
+# при превышении COUNT_LIMIT счетчики делятся пополам, и модель следует за локальной статистикой.
+#
+# Последовательность блоков делится на lanes непрерывных диапазонов ("дорожек") с примерно
+# равным числом решений, у каждой дорожки свое состояние rANS. Дорожки кодируются в лок-степе: на шаге t каждая дорожка кодирует
+# свое t-е решение с вероятностью, вычисленной по общей модели после шагов 0..t-1, затем модель
+# обновляется решениями всех дорожек шага t (порядок внутри шага не важен - это сложение
+# счетчиков). Байты ренормализации всех дорожек чередуются в одном потоке в том порядке,
+# в котором их читает декодер, поэтому декодер обрабатывает все дорожки одновременно
+# векторными операциями NumPy.
+#
+# Формат потока: varint число дорожек, varint число блоков каждой дорожки, начальные состояния
+# декодера (по 4 байта big-endian на дорожку), затем байты ренормализации.
+
+PROB_BITS = 12
+PROB_SCALE = 1 << PROB_BITS
+RANS_L = 1 << 23
+COUNT_LIMIT = 60
+MAX_CATEGORY = 15
+DECISIONS_PER_LANE = 512
+MAX_LANES = 256
+
+_BANDS = np.array([0, 0, 0, 1, 1, 1, 2, 2, 2, 2] + [3] * 5 + [4] * 6 + [5] * 15 + [6] * 28, dtype=np.int64)
+_BAND_LIST = _BANDS.tolist()
+
+_CTX_DC_ZERO = 0
+_CTX_SIGN = _CTX_DC_ZERO + 3
+_CTX_DC_CATEGORY = _CTX_SIGN + 2
+_CTX_AC_CATEGORY = _CTX_DC_CATEGORY + 3 * 16
+_CTX_DC_MANTISSA = _CTX_AC_CATEGORY + 7 * 16
+_CTX_AC_MANTISSA = _CTX_DC_MANTISSA + 16 * 16
+_CTX_EOB = _CTX_AC_MANTISSA + 16 * 16
+_CTX_ZERO = _CTX_EOB + 7 * 4
+NUM_CONTEXTS = _CTX_ZERO + 7 * 3
+
+_DC_ZERO, _SIGN, _CATEGORY, _MANTISSA, _EOB, _ZERO = range(6)
+
+
+def _decoder_tables():
+    """
+    Таблицы декодера. Контекст решения = _CTX_BASE[фаза, k, состояние DC] + sub, где sub -
+    счетчик фазы: категория (унарная часть), категория * 16 + номер бита (мантисса),
+    min(ненулевых, 3) (EOB), min(длина серии нулей, 2) (ноль?). Типовой переход по (фаза, бит):
+    следующая фаза и sub' = min(sub * MUL + ADD, CAP).
+    """
+    base = np.zeros((6, 64, 3), dtype=np.int64)
+    for k in range(64):
+        band = _BAND_LIST[k]
+        for state in range(3):
+            base[_DC_ZERO, k, state] = _CTX_DC_ZERO + state
+            base[_SIGN, k, state] = _CTX_SIGN + (k > 0)
+            base[_CATEGORY, k, state] = _CTX_AC_CATEGORY + band * 16 if k else _CTX_DC_CATEGORY + state * 16
+            base[_MANTISSA, k, state] = _CTX_AC_MANTISSA if k else _CTX_DC_MANTISSA
+            base[_EOB, k, state] = _CTX_EOB + band * 4
+            base[_ZERO, k, state] = _CTX_ZERO + band * 3
+    big = 1 << 30
+    #                (фаза, бит):  следующая фаза, MUL, ADD, CAP
+    rules = {
+        (_DC_ZERO, 0): (_SIGN, 0, 0, big),
+        (_DC_ZERO, 1): (_EOB, 0, 0, big),
+        (_SIGN, 0): (_CATEGORY, 0, 1, big),
+        (_SIGN, 1): (_CATEGORY, 0, 1, big),
+        (_CATEGORY, 0): (_MANTISSA, 1, 0, big),
+        (_CATEGORY, 1): (_CATEGORY, 1, 1, big),
+        (_MANTISSA, 0): (_MANTISSA, 1, 1, big),
+        (_MANTISSA, 1): (_MANTISSA, 1, 1, big),
+        (_EOB, 0): (_ZERO, 0, 0, big),
+        (_EOB, 1): (_DC_ZERO, 0, 0, big),
+        (_ZERO, 0): (_SIGN, 0, 0, big),
+        (_ZERO, 1): (_ZERO, 1, 1, 2),
+    }
+    table = np.zeros((12, 4), dtype=np.int64)
+    for (phase, bit), rule in rules.items():
+        table[phase * 2 + bit] = rule
+    return base.reshape(-1), table[:, 0].copy(), table[:, 1].copy(), table[:, 2].copy(), table[:, 3].copy()
+
+
+_CTX_BASE, _NEXT_PHASE, _SUB_MUL, _SUB_ADD, _SUB_CAP = _decoder_tables()
+_PHASE_FLAGS = np.eye(6, dtype=bool)
+
+
+def default_lanes(num_decisions):
+    """
+    Число дорожек по умолчанию: по DECISIONS_PER_LANE решений, не больше MAX_LANES.
+    Каждая дорожка стоит около 5 байт заголовка, зато сокращает число шагов декодера.
+    """
+    return max(1, min(MAX_LANES, num_decisions // DECISIONS_PER_LANE))
+
+
+def _dc_state(category):
+    return 0 if category == 0 else (1 if category <= 2 else 2)
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise EOFError("Поток rANS оборван в заголовке дорожек.")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _append_value(value, sign_ctx, category_ctx, mantissa_ctx, ctxs, bits):
+    magnitude = abs(value)
+    category = magnitude.bit_length()
+    if category > MAX_CATEGORY:
+        raise ValueError(f"Значение {value} вне диапазона кодера (категория {category} > {MAX_CATEGORY}).")
+    ctxs.append(sign_ctx)
+    bits.append(1 if value < 0 else 0)
+    for i in range(1, MAX_CATEGORY):
+        ctxs.append(category_ctx + i)
+        bits.append(1 if category > i else 0)
+        if category == i:
+            break
+    for j in range(category - 2, -1, -1):
+        ctxs.append(mantissa_ctx + category * 16 + (category - 2 - j))
+        bits.append((magnitude >> j) & 1)
+
+
+def _block_decisions(row, dc_diff, dc_state, ctxs, bits):
+    """Добавляет решения одного блока в ctxs/bits. Возвращает состояние DC для следующего блока."""
+    if dc_diff == 0:
+        ctxs.append(_CTX_DC_ZERO + dc_state)
+        bits.append(1)
+        next_state = 0
+    else:
+        ctxs.append(_CTX_DC_ZERO + dc_state)
+        bits.append(0)
+        _append_value(dc_diff, _CTX_SIGN, _CTX_DC_CATEGORY + dc_state * 16, _CTX_DC_MANTISSA, ctxs, bits)
+        next_state = _dc_state(abs(dc_diff).bit_length())
+
+    last = 63
+    while last > 0 and row[last] == 0:
+        last -= 1
+    bands = _BAND_LIST
+    k = 1
+    nonzero = 0
+    while k < 64:
+        ctxs.append(_CTX_EOB + bands[k] * 4 + min(nonzero, 3))
+        if k > last:
+            bits.append(1)
+            break
+        bits.append(0)
+        run = 0
+        while row[k] == 0:
+            ctxs.append(_CTX_ZERO + bands[k] * 3 + min(run, 2))
+            bits.append(1)
+            k += 1
+            run += 1
+        ctxs.append(_CTX_ZERO + bands[k] * 3 + min(run, 2))
+        bits.append(0)
+        _append_value(row[k], _CTX_SIGN + 1, _CTX_AC_CATEGORY + bands[k] * 16, _CTX_AC_MANTISSA, ctxs, bits)
+        k += 1
+        nonzero += 1
+    return next_state
+
+
+def _probabilities(n0, n1, ctx):
+    # счетчики не меньше 1 и их сумма не больше COUNT_LIMIT < PROB_SCALE, поэтому 0 < p < PROB_SCALE
+    zeros = n0[ctx]
+    return (zeros << PROB_BITS) // (zeros + n1[ctx])
+
+
+def _update_model(n0, n1, ctx, bits):
+    counts = np.bincount(2 * ctx + bits, minlength=2 * NUM_CONTEXTS)
+    n0 += counts[0::2]
+    n1 += counts[1::2]
+    over = (n0 + n1) > COUNT_LIMIT
+    if np.count_nonzero(over):
+        n0[over] = (n0[over] + 1) >> 1
+        n1[over] = (n1[over] + 1) >> 1
+
+
+def _new_model():
+    return np.ones(NUM_CONTEXTS, dtype=np.int64), np.ones(NUM_CONTEXTS, dtype=np.int64)
+
+
+def encode_coefficients(zigzag_coeffs, lanes=None, tracer=None):
+    """
+    Кодирует квантованные коэффициенты компонента.
+
+    Аргументы:
+        zigzag_coeffs (np.ndarray): Коэффициенты (n_blocks, 64) в зигзаг-порядке, DC - абсолютные значения.
+        lanes (int, optional): Число дорожек (по умолчанию default_lanes(n_blocks)).
+        tracer (instrumentation.Tracer, optional): Получатель событий.
+
+    Возвращает:
+        bytes: Закодированный поток.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    coeffs = np.asarray(zigzag_coeffs)
+    num_blocks = len(coeffs)
+    if num_blocks == 0:
+        return b''
+
+    rows = coeffs.tolist()
+    dc_diffs = np.diff(coeffs[:, 0].astype(np.int64), prepend=0).tolist()
+    block_ctxs = []
+    block_bits = []
+    dc_state = 0
+    for block in range(num_blocks):
+        ctxs = []
+        bits = []
+        dc_state = _block_decisions(rows[block], dc_diffs[block], dc_state, ctxs, bits)
+        block_ctxs.append(ctxs)
+        block_bits.append(bits)
+    block_lengths = np.array([len(c) for c in block_ctxs], dtype=np.int64)
+    total = int(block_lengths.sum())
+    tracer.counter('decisions', total)
+
+    # границы дорожек: равные доли решений, не меньше одного блока на дорожку
+    lanes = max(1, min(lanes or default_lanes(total), num_blocks))
+    cumulative = np.cumsum(block_lengths)
+    bounds = np.searchsorted(cumulative, np.arange(1, lanes) * total / lanes, side='left') + 1
+    bounds = np.maximum(bounds, np.arange(1, lanes))
+    bounds = np.minimum(bounds, num_blocks - lanes + np.arange(1, lanes))
+    bounds = np.maximum.accumulate(np.concatenate(([0], bounds, [num_blocks])))
+    lane_blocks = np.diff(bounds)
+
+    lane_ctxs = []
+    lane_bits = []
+    for lane in range(lanes):
+        first = int(bounds[lane])
+        if first > 0 and dc_diffs[first - 1] != 0:
+            # контекст DC первого блока дорожки не зависит от предыдущей дорожки
+            block_ctxs[first] = []
+            block_bits[first] = []
+            _block_decisions(rows[first], dc_diffs[first], 0, block_ctxs[first], block_bits[first])
+        ctxs = []
+        bits = []
+        for block in range(first, int(bounds[lane + 1])):
+            ctxs += block_ctxs[block]
+            bits += block_bits[block]
+        lane_ctxs.append(ctxs)
+        lane_bits.append(bits)
+
+    lengths = np.array([len(c) for c in lane_ctxs], dtype=np.int64)
+    steps = int(lengths.max())
+    ctx_grid = np.zeros((lanes, steps), dtype=np.int64)
+    bit_grid = np.zeros((lanes, steps), dtype=np.int64)
+    for lane in range(lanes):
+        ctx_grid[lane, :lengths[lane]] = lane_ctxs[lane]
+        bit_grid[lane, :lengths[lane]] = lane_bits[lane]
+    # активные дорожки на каждом шаге: дорожки с длиной > t (номера по возрастанию)
+    active_lanes = [np.flatnonzero(lengths > t) for t in range(steps)]
+
+    # Проход модели в том же порядке, что и у декодера: вероятность каждого решения.
+    n0, n1 = _new_model()
+    prob_grid = np.zeros((lanes, steps), dtype=np.int64)
+    for t in range(steps):
+        active = active_lanes[t]
+        ctx = ctx_grid[active, t]
+        prob_grid[active, t] = _probabilities(n0, n1, ctx)
+        _update_model(n0, n1, ctx, bit_grid[active, t])
+
+    # rANS кодирует решения в обратном порядке. На шаге t декодер сначала дочитывает по байту
+    # во все дорожки с x < RANS_L (по возрастанию номера), затем второй байт туда, где нужно;
+    # кодер формирует байты шага в том же порядке.
+    state = np.full(lanes, RANS_L, dtype=np.int64)
+    chunks = []
+    for t in range(steps - 1, -1, -1):
+        active = active_lanes[t]
+        p = prob_grid[active, t]
+        bit = bit_grid[active, t]
+        freq = np.where(bit == 1, PROB_SCALE - p, p)
+        start = np.where(bit == 1, p, 0)
+        x = state[active]
+        x_max = ((RANS_L >> PROB_BITS) << 8) * freq
+        first = x >= x_max
+        if first.any():
+            low = x & 0xFF
+            x = np.where(first, x >> 8, x)
+            second = x >= x_max
+            high = x & 0xFF
+            x = np.where(second, x >> 8, x)
+            chunks.append(np.concatenate((np.where(second, high, low)[first], low[second])).astype(np.uint8).tobytes())
+        state[active] = ((x // freq) << PROB_BITS) + (x % freq) + start
+
+    header = bytearray()
+    _write_varint(header, lanes)
+    for count in lane_blocks.tolist():
+        _write_varint(header, count)
+    header += state.astype('>u4').tobytes()
+    return bytes(header) + b''.join(reversed(chunks))
+
+
+def decode_coefficients(data, num_blocks, tracer=None):
+    """
+    Декодирует поток encode_coefficients.
+
+    Аргументы:
+        data (bytes-like): Закодированный поток компонента.
+        num_blocks (int): Количество блоков.
+        tracer (instrumentation.Tracer, optional): Получатель предупреждений.
+
+    Возвращает:
+        np.ndarray: Коэффициенты (num_blocks, 64) coefficient_store.COEFF_DTYPE в зигзаг-порядке,
+                    DC - абсолютные значения.
+    """
+    tracer = instrumentation.resolve_tracer(tracer)
+    coeffs = coefficient_store.allocate(num_blocks, 64)
+    if num_blocks == 0:
+        return coeffs
+    view = memoryview(data)
+    lanes, pos = _read_varint(view, 0)
+    if not 1 <= lanes <= num_blocks:
+        raise ValueError(f"Некорректное число дорожек rANS: {lanes} для {num_blocks} блоков.")
+    lane_blocks = []
+    for _ in range(lanes):
+        count, pos = _read_varint(view, pos)
+        lane_blocks.append(count)
+    if sum(lane_blocks) != num_blocks or min(lane_blocks) < 1:
+        raise ValueError(f"Дорожки rANS покрывают {sum(lane_blocks)} блоков, ожидалось {num_blocks}.")
+    if len(view) < pos + 4 * lanes:
+        raise EOFError("Поток rANS оборван в начальных состояниях дорожек.")
+    x = np.frombuffer(view[pos:pos + 4 * lanes], dtype='>u4').astype(np.int64)
+    # запас нулевых байт: на поврежденных данных декодер не выходит за границы буфера
+    buffer = np.frombuffer(bytes(view[pos + 4 * lanes:]) + bytes(2 * lanes), dtype=np.uint8).astype(np.int64)
+    read_pos = 0
+
+    lane_ids = np.arange(lanes, dtype=np.int64)
+    blk = np.concatenate(([0], np.cumsum(lane_blocks)[:-1])).astype(np.int64)
+    end = blk + np.array(lane_blocks, dtype=np.int64)
+    phase = np.zeros(lanes, dtype=np.int64)
+    k = np.zeros(lanes, dtype=np.int64)
+    sub = np.zeros(lanes, dtype=np.int64)
+    nonzero = np.zeros(lanes, dtype=np.int64)
+    bit_index = np.zeros(lanes, dtype=np.int64)
+    magnitude = np.zeros(lanes, dtype=np.int64)
+    negative = np.zeros(lanes, dtype=bool)
+    dc_state = np.zeros(lanes, dtype=np.int64)
+    final_states = np.zeros(lanes, dtype=np.int64)
+    n0, n1 = _new_model()
+    flat = coeffs.reshape(-1)
+
+    while len(lane_ids):
+        ctx = _CTX_BASE[(phase * 64 + k) * 3 + dc_state] + sub
+        p = _probabilities(n0, n1, ctx)
+        slot = x & (PROB_SCALE - 1)
+        one = slot >= p
+        x = np.where(one, PROB_SCALE - p, p) * (x >> PROB_BITS) + slot - p * one
+        for _ in range(2):
+            refill = x < RANS_L
+            count = int(np.count_nonzero(refill))
+            if not count:
+                break
+            x[refill] = (x[refill] << 8) | buffer[read_pos:read_pos + count]
+            read_pos += count
+        _update_model(n0, n1, ctx, one)
+
+        # переходы конечного автомата (одно решение на дорожку за шаг): типовой переход
+        # и счетчик sub берутся из таблиц по (фаза, бит), особые случаи правятся масками
+        flags = _PHASE_FLAGS[phase]
+        in_dc_zero, in_sign, in_category, in_mantissa, in_zero = (flags[:, 0], flags[:, 1], flags[:, 2],
+                                                                 flags[:, 3], flags[:, 5])
+        transition = phase * 2 + one
+        phase = _NEXT_PHASE[transition]
+        sub = np.minimum(sub * _SUB_MUL[transition] + _SUB_ADD[transition], _SUB_CAP[transition])
+        skip = in_zero & one
+        k += skip
+        negative = np.where(in_sign, one, negative)
+        # сдвиг на отрицательное число у дорожек вне мантиссы дает 0 (сдвигается нулевой бит)
+        magnitude |= (one & in_mantissa) << bit_index
+        bit_index -= in_mantissa
+        to_mantissa = in_category & (~one | (sub >= MAX_CATEGORY))
+        if np.count_nonzero(to_mantissa):
+            category = sub[to_mantissa]
+            bit_index[to_mantissa] = category - 2
+            magnitude[to_mantissa] = 1 << (category - 1)
+            sub[to_mantissa] = category * 16
+            phase[to_mantissa] = _MANTISSA
+        finish = ((to_mantissa | in_mantissa) & (bit_index < 0)) | (in_dc_zero & one)
+        block_end = (flags[:, 4] & one) | (skip & (k >= 64))
+
+        if np.count_nonzero(finish):
+            magnitude[in_dc_zero & one] = 0
+            values = magnitude[finish]
+            flat[blk[finish] * 64 + k[finish]] = np.where(negative[finish], -values, values)
+            dc_finish = finish & (k == 0)
+            values = magnitude[dc_finish]
+            dc_state[dc_finish] = (values > 0).astype(np.int64) + (values > 3)
+            nonzero += finish & (k > 0)
+            k += finish
+            block_end |= finish & (k >= 64)
+            phase[finish] = _EOB
+            sub[finish] = np.minimum(nonzero[finish], 3)
+
+        if np.count_nonzero(block_end):
+            blk += block_end
+            k[block_end] = 0
+            nonzero[block_end] = 0
+            sub[block_end] = 0
+            phase[block_end] = _DC_ZERO
+            done = blk >= end
+            if np.count_nonzero(done):
+                final_states[lane_ids[done]] = x[done]
+                keep = ~done
+                (lane_ids, x, blk, end, phase, k, sub, nonzero, bit_index, magnitude,
+                 negative, dc_state) = (arr[keep] for arr in (
+                    lane_ids, x, blk, end, phase, k, sub, nonzero, bit_index, magnitude,
+                    negative, dc_state))
+
+    if np.any(final_states != RANS_L) or read_pos > len(buffer) - 2 * lanes:
+        tracer.warning("Поток rANS поврежден: конечное состояние декодера не совпало с начальным состоянием кодера.")
+    coeffs[:, 0] = np.cumsum(coeffs[:, 0], dtype=np.int64)
+    return coeffs
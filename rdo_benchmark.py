@@ -0,0 +1,114 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+import image_metrics
+from jpeg_compressor import compress_array
+from jpeg_decompressor import decompress_bytes
+
+
+DEFAULT_QUALITIES = (30, 50, 70, 80, 90, 95)
+# Кривая обычного кодера строится плотнее, чтобы PSNR точек RDO попадали в ее диапазон.
+BASELINE_QUALITIES = tuple(range(5, 101, 5))
+
+
+def rd_curve(image, qualities=DEFAULT_QUALITIES, rdo=False):
+    """
+    Точки кривой "размер - качество" для набора уровней качества.
+
+    Возвращает:
+        list[dict]: [{'quality', 'bytes', 'psnr', 'encode_s'}, ...] по возрастанию качества.
+    """
+    points = []
+    for quality in sorted(qualities):
+        start = time.perf_counter()
+        data = compress_array(image, quality=quality, rdo=rdo)
+        encode_s = time.perf_counter() - start
+        if data is None:
+            raise RuntimeError(f"Сжатие с качеством {quality} не удалось.")
+        decoded = decompress_bytes(data)
+        # изображение с R = G = B декодируется в одну плоскость
+        reference = image[:, :, 0] if decoded.ndim == 2 and image.ndim == 3 else image
+        points.append({
+            'quality': quality,
+            'bytes': len(data),
+            'psnr': image_metrics.psnr(reference, decoded),
+            'encode_s': encode_s,
+        })
+    return points
+
+
+def size_at_psnr(points, psnr):
+    """
+    Размер файла на кривой points при заданном PSNR: линейная интерполяция логарифма
+    размера по PSNR. Вне диапазона кривой возвращает None.
+    """
+    psnrs = [p['psnr'] for p in points]
+    order = np.argsort(psnrs)
+    psnrs = np.array(psnrs)[order]
+    sizes = np.log(np.array([p['bytes'] for p in points], dtype=np.float64)[order])
+    if not psnrs[0] <= psnr <= psnrs[-1]:
+        return None
+    return float(np.exp(np.interp(psnr, psnrs, sizes)))
+
+
+def benchmark(image, qualities=DEFAULT_QUALITIES, scales=(True,)):
+    """
+    Сравнивает обычное квантование и RDO.
+
+    Для каждой точки RDO указывается размер обычного кодера при том же PSNR
+    (по интерполяции его кривой) и изменение размера в процентах (меньше нуля - выигрыш).
+
+    Возвращает:
+        dict: {'baseline': [...], 'rdo': {множитель: [...]}}
+    """
+    baseline = rd_curve(image, sorted(set(qualities) | set(BASELINE_QUALITIES)))
+    report = {'baseline': baseline, 'rdo': {}}
+    for scale in scales:
+        points = rd_curve(image, qualities, rdo=scale)
+        for point in points:
+            reference = size_at_psnr(baseline, point['psnr'])
+            point['baseline_bytes_same_psnr'] = reference
+            point['size_change_percent'] = None if reference is None else (point['bytes'] / reference - 1.0) * 100.0
+        report['rdo'][str(scale)] = points
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Выигрыш RDO-квантования: размер, PSNR и время кодирования.")
+    parser.add_argument("images", nargs="+", help="Изображения для сравнения.")
+    parser.add_argument("-q", "--qualities", type=int, nargs="+", default=list(DEFAULT_QUALITIES))
+    parser.add_argument("--scales", type=float, nargs="+", default=None,
+                        help="Множители λ (по умолчанию rdo_quantization.DEFAULT_LAMBDA_SCALE).")
+    parser.add_argument("--json", action="store_true", help="Вывести результат в JSON.")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for path in args.images:
+        with Image.open(path) as img:
+            image = np.array(img.convert('RGB'))
+        results[path] = benchmark(image, args.qualities, args.scales or (True,))
+
+    if args.json:
+        print(json.dumps(results, indent=4, ensure_ascii=False))
+        return 0
+    for path, report in results.items():
+        print(f"{path}:")
+        for point in report['baseline']:
+            print(f"  обычное  q={point['quality']:3d}: {point['bytes']:8d} байт, PSNR {point['psnr']:.2f} дБ, "
+                  f"кодирование {point['encode_s']:.2f} с")
+        for scale, points in report['rdo'].items():
+            for point in points:
+                change = point['size_change_percent']
+                print(f"  rdo={scale:5s} q={point['quality']:3d}: {point['bytes']:8d} байт, PSNR {point['psnr']:.2f} дБ, "
+                      f"кодирование {point['encode_s']:.2f} с"
+                      + (f", {change:+.1f}% к обычному при том же PSNR" if change is not None else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import math
+
+import numpy as np
+
+import coefficient_store
+
+
+# Квантование с оптимизацией "искажение + λ·биты" (trellis quantization).
+#
+# Для каждого блока уровни AC выбираются так, чтобы минимизировать
+#     J = sum (c_k - q_k * l_k)^2 + λ * bits,
+# где bits - точная длина кода блока в базовом кодере: коды Хаффмана символов (run, size)
+# из HuffmanTable.encode_table, дополнительные биты VLI, ZRL для каждых 16 нулей подряд
+# (rle_ac_coding выдает ZRL и для хвостовых нулей) и EOB, который пишется всегда.
+# Кандидаты для позиции k: уровень обычного округления l0, уровень на единицу ближе к нулю
+# и ноль. Динамическое программирование идет по позициям зигзага 1..63, состояние -
+# позиция последнего ненулевого коэффициента; все блоки компонента обрабатываются
+# одновременно векторными операциями NumPy. DC не меняется (от него зависит DPCM соседних блоков).
+#
+# Для N = 8 преобразование dct_2d ортонормировано, поэтому сумма квадратов ошибок
+# коэффициентов равна сумме квадратов ошибок пикселей блока.
+
+# λ = DEFAULT_LAMBDA_SCALE * ln2/6 * среднее q^2 по AC: наклон кривой D(R) = Δ^2/12 * 2^(-2R)
+# при высокой скорости, где Δ - шаг квантования. Среднее q^2 определяется крупными шагами
+# высоких частот, где скорость почти нулевая, поэтому множитель заметно меньше 1;
+# значение подобрано по rdo_benchmark (наименьший размер при том же PSNR для качества 30..90).
+DEFAULT_LAMBDA_SCALE = 0.1
+_MISSING_CODE_BITS = 1 << 10
+
+
+def rdo_lambda(q_matrix, scale=DEFAULT_LAMBDA_SCALE):
+    """
+    Множитель Лагранжа для матрицы квантования. Матрица зависит от уровня качества
+    (adjust_quantization_matrix), поэтому λ растет с уменьшением качества как квадрат шага.
+
+    Аргументы:
+        q_matrix (np.ndarray): Матрица квантования NxN.
+        scale (float): Дополнительный множитель (0 - обычное округление).
+
+    Возвращает:
+        float: λ в единицах квадрата ошибки на бит.
+    """
+    q = np.asarray(q_matrix, dtype=np.float64).reshape(-1)[1:]
+    return scale * math.log(2.0) / 6.0 * float(np.mean(q * q))
+
+
+def code_lengths(ac_table):
+    """
+    Длины кодов Хаффмана символов AC в виде таблицы [run, size] (16 x 16).
+    Отсутствующим в таблице символам назначается очень большая длина.
+    """
+    lengths = np.full((16, 16), _MISSING_CODE_BITS, dtype=np.float64)
+    for symbol, (_, length) in ac_table.encode_table.items():
+        lengths[symbol >> 4, symbol & 0x0F] = length
+    return lengths
+
+
+def _categories(levels):
+    # np.frexp: |l| = m * 2^e, 0.5 <= m < 1, поэтому e - количество бит |l| (категория VLI)
+    return np.frexp(np.abs(levels).astype(np.float64))[1].astype(np.int64)
+
+
+def trellis_quantize(dct_zigzag, q_zigzag, ac_table, lam):
+    """
+    Квантует коэффициенты DCT компонента с минимизацией искажение + λ·биты.
+
+    Аргументы:
+        dct_zigzag (np.ndarray): Коэффициенты DCT (n_blocks, N*N) в зигзаг-порядке (float).
+        q_zigzag (np.ndarray): Матрица квантования в зигзаг-порядке (N*N,).
+        ac_table (huffman_coding.HuffmanTable): Таблица Хаффмана AC, по которой считаются биты.
+        lam (float): Множитель Лагранжа (см. rdo_lambda).
+
+    Возвращает:
+        np.ndarray: Квантованные коэффициенты (n_blocks, N*N) coefficient_store.COEFF_DTYPE в зигзаг-порядке.
+    """
+    coeffs = np.asarray(dct_zigzag, dtype=np.float64)
+    q = np.asarray(q_zigzag, dtype=np.float64).reshape(-1)
+    num_blocks, num_coeffs = coeffs.shape
+    rounded = np.round(coeffs / q)
+    levels = rounded.astype(coefficient_store.COEFF_DTYPE)
+    if num_blocks == 0 or lam <= 0:
+        return levels
+
+    lengths = code_lengths(ac_table)
+    zrl_bits = lengths[15, 0]
+    eob_bits = lengths[0, 0]
+    last = num_coeffs - 1
+
+    # искажение при обнулении коэффициентов 1..k (накопленное)
+    zero_cost = np.zeros((num_blocks, num_coeffs))
+    zero_cost[:, 1:] = np.cumsum(coeffs[:, 1:] ** 2, axis=1)
+
+    # кандидаты: l0 и l0 - sign(l0) (если |l0| >= 2); ноль учитывается серией нулей
+    candidates = []
+    for shift in (0, 1):
+        cand = rounded - shift * np.sign(rounded)
+        valid = np.abs(rounded) >= 1 + shift
+        dist = (coeffs - q * cand) ** 2
+        cats = _categories(cand)
+        # стоимость самого коэффициента без кода Хаффмана: искажение + λ * биты VLI
+        own = np.where(valid, dist + lam * cats, np.inf)
+        candidates.append((cand, np.minimum(cats, 15), own))
+
+    cost = np.full((num_blocks, num_coeffs), np.inf)
+    cost[:, 0] = 0.0
+    prev = np.zeros((num_blocks, num_coeffs), dtype=np.int64)
+    chosen = np.zeros((num_blocks, num_coeffs), dtype=np.int32)
+    rows = np.arange(num_blocks)
+    nonzero_positions = np.flatnonzero(np.any(rounded[:, 1:] != 0, axis=0)) + 1
+
+    for i in nonzero_positions.tolist():
+        run = i - 1 - np.arange(i)
+        base = cost[:, :i] + (zero_cost[:, i - 1:i] - zero_cost[:, :i]) + lam * zrl_bits * (run // 16)
+        run_mod = run % 16
+        best = np.full(num_blocks, np.inf)
+        for cand, cats, own in candidates:
+            total = base + lam * lengths[run_mod[np.newaxis, :], cats[:, i:i + 1]]
+            j = np.argmin(total, axis=1)
+            value = total[rows, j] + own[:, i]
+            better = value < best
+            best = np.where(better, value, best)
+            prev[better, i] = j[better]
+            chosen[better, i] = cand[better, i]
+        cost[:, i] = best
+
+    ends = np.arange(num_coeffs)
+    tail = (zero_cost[:, last:] - zero_cost) + lam * (zrl_bits * ((last - ends) // 16) + eob_bits)
+    pos = np.argmin(cost + tail, axis=1)
+
+    result = np.zeros_like(levels)
+    result[:, 0] = levels[:, 0]
+    active = np.flatnonzero(pos > 0)
+    pos = pos[active]
+    while len(active):
+        result[active, pos] = chosen[active, pos]
+        pos = prev[active, pos]
+        keep = pos > 0
+        active, pos = active[keep], pos[keep]
+    return result
+
@@ -6,15 +6,15 @@ def reassemble_from_blocks(blocks_list, padded_height, padded_width):
     Собирает 2D матрицу (канал изображения) из списка блоков NxN.
 
     Аргументы:
-        blocks_list (list[np.ndarray]): Список блоков NxN в порядке чтения
-                                       (слева направо, сверху вниз).
+        blocks_list (list[np.ndarray] | np.ndarray): Список блоков NxN или массив (n, N, N)
+                                       в порядке чтения (слева направо, сверху вниз).
         padded_height (int): Высота собранного изображения (должна быть кратна N).
         padded_width (int): Ширина собранного изображения (должна быть кратна N).
 
     Возвращает:
         np.ndarray: Собранная 2D матрица.
     """
-    if not blocks_list:
+    if len(blocks_list) == 0:
         return np.array([], dtype=np.uint8).reshape(0,0)
 
     block_size = blocks_list[0].shape[0]
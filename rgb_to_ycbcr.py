@@ -76,4 +76,66 @@ def ycbcr_to_rgb(ycbcr_image):
 
     rgb_image = np.clip(rgb_image, 0, 255)
 
-    return rgb_image.astype(np.uint8)
\ No newline at end of file
+    return rgb_image.astype(np.uint8)
+
+
+# Коэффициенты ycbcr_to_rgb в фиксированной точке (16 дробных бит).
+_FIXED_BITS = 16
+_CR_TO_R = round(1.402 * (1 << _FIXED_BITS))
+_CB_TO_G = round(0.344136 * (1 << _FIXED_BITS))
+_CR_TO_G = round(0.714136 * (1 << _FIXED_BITS))
+_CB_TO_B = round(1.772 * (1 << _FIXED_BITS))
+
+
+def ycbcr420_to_rgb(y, cb, cr, out=None, parity=(0, 0)):
+    """
+    Преобразует Y полного разрешения и Cb/Cr, уменьшенные вдвое по каждой оси (4:2:0),
+    в RGB без построения увеличенных плоскостей цветности: вклады Cb/Cr считаются
+    в разрешении цветности, а каждая из четырех фаз (четные/нечетные строки и столбцы)
+    результата получает их напрямую. Арифметика целочисленная (фиксированная точка,
+    16 дробных бит), результат усекается, как в ycbcr_to_rgb; для R и B он совпадает
+    с ycbcr_to_rgb точно, для G может отличаться на 1 там, где ycbcr_to_rgb ошибается
+    из-за округления float32.
+
+    Аргументы:
+        y (np.ndarray): Плоскость Y (height, width), uint8.
+        cb, cr (np.ndarray): Плоскости Cb и Cr, uint8; пиксель (i, j) использует
+                             отсчет ((i + parity_y) // 2, (j + parity_x) // 2).
+        out (np.ndarray, optional): Буфер результата (height, width, 3) uint8.
+        parity (tuple[int, int]): Сдвиг (parity_y, parity_x) сетки цветности, 0 или 1.
+
+    Возвращает:
+        np.ndarray: RGB изображение (height, width, 3), uint8 (out, если он передан).
+    """
+    height, width = y.shape
+    parity_y, parity_x = parity
+    chroma_h = (height - 1 + parity_y) // 2 + 1 if height else 0
+    chroma_w = (width - 1 + parity_x) // 2 + 1 if width else 0
+    for name, plane in (('Cb', cb), ('Cr', cr)):
+        if plane.shape[0] < chroma_h or plane.shape[1] < chroma_w:
+            raise ValueError(f"Плоскость {name} {plane.shape} меньше необходимой ({chroma_h}, {chroma_w}) "
+                             f"для Y {y.shape}.")
+    if out is None:
+        out = np.empty((height, width, 3), dtype=np.uint8)
+    elif out.shape != (height, width, 3) or out.dtype != np.uint8:
+        raise ValueError(f"Буфер результата {out.dtype}{out.shape} не подходит для ({height}, {width}, 3) uint8.")
+
+    cb_centered = cb[:chroma_h, :chroma_w].astype(np.int32) - 128
+    cr_centered = cr[:chroma_h, :chroma_w].astype(np.int32) - 128
+    offsets = (_CR_TO_R * cr_centered,
+               -(_CB_TO_G * cb_centered + _CR_TO_G * cr_centered),
+               _CB_TO_B * cb_centered)
+
+    for phase_y in range(min(2, height)):
+        first_y = (phase_y + parity_y) // 2
+        rows = len(range(phase_y, height, 2))
+        for phase_x in range(min(2, width)):
+            first_x = (phase_x + parity_x) // 2
+            cols = len(range(phase_x, width, 2))
+            y_scaled = y[phase_y::2, phase_x::2].astype(np.int32) << _FIXED_BITS
+            for channel, offset in enumerate(offsets):
+                value = y_scaled + offset[first_y:first_y + rows, first_x:first_x + cols]
+                value >>= _FIXED_BITS
+                np.clip(value, 0, 255, out=value)
+                out[phase_y::2, phase_x::2, channel] = value
+    return out
@@ -1,5 +1,7 @@
 import numpy as np
 
+import instrumentation
+
 def rle_encode_ac_coefficients(ac_coeffs_zigzag):
     """
     Выполняет Run-Length Encoding (RLE) для AC коэффициентов после зигзаг-сканирования.
@@ -37,7 +39,7 @@ def rle_encode_ac_coefficients(ac_coeffs_zigzag):
 
     return rle_encoded
 
-def rle_decode_ac_coefficients(rle_encoded_ac, num_ac_coeffs=63):
+def rle_decode_ac_coefficients(rle_encoded_ac, num_ac_coeffs=63, tracer=None):
     """
     Декодирует AC коэффициенты из RLE представления.
     Стала более устойчивой к некорректным RLE-последовательностям.
@@ -46,12 +48,14 @@ def rle_decode_ac_coefficients(rle_encoded_ac, num_ac_coeffs=63):
         rle_encoded_ac (list[tuple]): Список RLE-кортежей (run_length, value) или (0,0) для EOB,
                                       или (15,0) для ZRL.
         num_ac_coeffs (int): Общее количество AC коэффициентов в блоке (обычно 63).
+        tracer (instrumentation.Tracer, optional): Получатель предупреждений о некорректных данных.
 
     Возвращает:
         list[int]: Восстановленный одномерный список AC коэффициентов.
     """
     if not isinstance(rle_encoded_ac, list):
         raise TypeError("Входные RLE AC коэффициенты должны быть списком.")
+    tracer = instrumentation.resolve_tracer(tracer)
 
     ac_coeffs_zigzag = []
     for idx, (run_length, value) in enumerate(rle_encoded_ac):
@@ -61,7 +65,8 @@ def rle_decode_ac_coefficients(rle_encoded_ac, num_ac_coeffs=63):
              if run_length == 0 and value == 0:
                   break
              else:
-                  print(f"Предупреждение: Достигнут лимит ({current_len}/{num_ac_coeffs}), но RLE данные продолжаются: ({run_length},{value}) в rle_encoded_ac[{idx}]. Игнорируется остаток.")
+                  if tracer.enabled:
+                      tracer.warning(f"Достигнут лимит ({current_len}/{num_ac_coeffs}), но RLE данные продолжаются: ({run_length},{value}) в rle_encoded_ac[{idx}]. Игнорируется остаток.")
                   break
 
         if run_length == 0 and value == 0:
@@ -72,7 +77,8 @@ def rle_decode_ac_coefficients(rle_encoded_ac, num_ac_coeffs=63):
         elif run_length == 15 and value == 0:
             num_zeros_to_add = 16
             if current_len + num_zeros_to_add > num_ac_coeffs:
-                print(f"Предупреждение: ZRL привел бы к превышению лимита ({current_len} + {num_zeros_to_add} > {num_ac_coeffs}). Добавляем только {num_ac_coeffs - current_len} нулей.")
+                if tracer.enabled:
+                    tracer.warning(f"ZRL привел бы к превышению лимита ({current_len} + {num_zeros_to_add} > {num_ac_coeffs}). Добавляем только {num_ac_coeffs - current_len} нулей.")
                 num_zeros_to_add = num_ac_coeffs - current_len
             ac_coeffs_zigzag.extend([0] * max(0, num_zeros_to_add))
             if len(ac_coeffs_zigzag) >= num_ac_coeffs:
@@ -80,12 +86,14 @@ def rle_decode_ac_coefficients(rle_encoded_ac, num_ac_coeffs=63):
 
         else:
             if run_length < 0 or run_length > 15:
-                 print(f"Предупреждение: Некорректный run_length={run_length} в RLE паре. Игнорируется пара.")
+                 if tracer.enabled:
+                     tracer.warning(f"Некорректный run_length={run_length} в RLE паре. Игнорируется пара.")
                  continue
 
             num_zeros_to_add = run_length
             if current_len + num_zeros_to_add > num_ac_coeffs:
-                 print(f"Предупреждение: Run-length {run_length} для значения {value} привел бы к превышению лимита ({current_len} + {num_zeros_to_add} > {num_ac_coeffs}). Добавляем только {num_ac_coeffs - current_len} нулей.")
+                 if tracer.enabled:
+                     tracer.warning(f"Run-length {run_length} для значения {value} привел бы к превышению лимита ({current_len} + {num_zeros_to_add} > {num_ac_coeffs}). Добавляем только {num_ac_coeffs - current_len} нулей.")
                  num_zeros_to_add = num_ac_coeffs - current_len
                  ac_coeffs_zigzag.extend([0] * max(0, num_zeros_to_add))
                  break
@@ -96,7 +104,8 @@ def rle_decode_ac_coefficients(rle_encoded_ac, num_ac_coeffs=63):
                 ac_coeffs_zigzag.append(value)
             else:
                  if value != 0:
-                    print(f"Предупреждение: После добавления {run_length} нулей не осталось места для значения {value} (достигнут лимит {num_ac_coeffs}). Значение пропущено.")
+                    if tracer.enabled:
+                        tracer.warning(f"После добавления {run_length} нулей не осталось места для значения {value} (достигнут лимит {num_ac_coeffs}). Значение пропущено.")
                  break
 
     if len(ac_coeffs_zigzag) < num_ac_coeffs:
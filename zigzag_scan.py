@@ -1,3 +1,5 @@
+import functools
+
 import numpy as np
 
 def zigzag_scan(matrix_block):
@@ -98,4 +100,27 @@ def inverse_zigzag_scan(flat_array, n):
             else:
                 row += 1
                 col -= 1
-    return matrix_block
\ No newline at end of file
+    return matrix_block
+
+
+@functools.lru_cache(maxsize=None)
+def zigzag_order(n):
+    """
+    Индексы элементов блока NxN (в порядке строк) в порядке зигзаг-сканирования:
+    block.reshape(-1)[zigzag_order(n)] совпадает с zigzag_scan(block).
+    Массив вычисляется один раз для каждого N и далее берется из кэша (только для чтения).
+    """
+    order = zigzag_scan(np.arange(n * n).reshape(n, n))
+    order.flags.writeable = False
+    return order
+
+
+@functools.lru_cache(maxsize=None)
+def inverse_zigzag_order(n):
+    """
+    Обратная перестановка к zigzag_order: flat_array[inverse_zigzag_order(n)].reshape(n, n)
+    совпадает с inverse_zigzag_scan(flat_array, n).
+    """
+    inverse = np.argsort(zigzag_order(n))
+    inverse.flags.writeable = False
+    return inverse